@@ -17,6 +17,25 @@ from pathlib import Path
 import time
 import re
 
+from archive import hot_start, load_movements
+from backup import BackupScheduler
+from cache import TTLCache
+from config import Config, get_database_path
+from database import ConnectionPool
+from forecasting import has_new_movements, load_forecasts, refresh_forecasts, suggestions
+from migrations import bootstrap_database
+from queries import (
+    QUERY_ALERTA_VENCIMENTO, QUERY_ALERTA_ESTOQUE_BAIXO, QUERY_ALERTA_SEM_ESTOQUE,
+    FAIXAS_ETARIAS, load_dashboard_snapshot, stock_filters, load_stock_totals, load_stock_page,
+    load_stock_map, load_location_lots,
+    load_movement_summary, load_movement_page, load_patients
+)
+from receiving import import_lots, read_chunks
+from replenishment import load_deliveries, plan_replenishment, purchase_list, scenario_curves
+from replication import WalReplicator
+from scanning import MODOS, BarcodeIndex, ScanError, ScanSession
+from search import BUSCA_MEDICAMENTOS, fts_query
+
 # Configuração da página
 st.set_page_config(
     page_title="MedStock360 Advanced",
@@ -100,272 +119,81 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_connection_pool(db_path):
+    """Pool de conexões compartilhado por todas as sessões"""
+    # Com a replicação ativa, os checkpoints ficam a cargo do replicador do WAL
+    return ConnectionPool(db_path, auto_checkpoint=not Config.REPLICATION_ENABLED)
+
+@st.cache_resource
+def get_alert_cache():
+    """Cache dos contadores de alertas da sidebar, compartilhado por todas as sessões"""
+    return TTLCache(ttl=Config.CACHE_TIMEOUT)
+
+@st.cache_resource
+def get_dashboard_cache():
+    """Cache do snapshot do dashboard: um cálculo por intervalo para todas as sessões"""
+    return TTLCache(ttl=Config.DASHBOARD_CACHE_TTL)
+
+def get_dashboard_snapshot():
+    """Indicadores do dashboard, recalculados após o TTL ou uma gravação"""
+    def calcular():
+        conn = st.session_state.db_manager.get_connection()
+        try:
+            return load_dashboard_snapshot(conn)
+        finally:
+            conn.close()
+    return get_dashboard_cache().get_or_compute("snapshot", calcular)
+
+@st.cache_resource
+def get_backup_scheduler(db_path):
+    """Backup automático em segundo plano, um agendador por processo"""
+    return BackupScheduler(db_path).start()
+
+@st.cache_resource
+def get_wal_replicator(db_path):
+    """Envio contínuo do WAL para o standby, um replicador por processo"""
+    return WalReplicator(get_connection_pool(db_path)).start()
+
+@st.cache_resource
+def get_barcode_index():
+    """Índice código de barras → medicamento/lote, compartilhado pelas estações de leitura"""
+    return BarcodeIndex()
+
+def invalidate_stock_caches():
+    """Descartar os caches derivados do estoque após gravar lotes ou movimentações"""
+    get_alert_cache().invalidate()
+    get_dashboard_cache().invalidate()
+    get_barcode_index().invalidate_lots()
+
+def invalidate_medicine_caches():
+    """Descartar os caches derivados do cadastro de medicamentos"""
+    get_barcode_index().invalidate()
+    get_dashboard_cache().invalidate()
+
+@st.cache_resource
+def init_database(db_path):
+    """Schema, migrações e admin padrão aplicados uma única vez por processo"""
+    with get_connection_pool(db_path).writer() as conn:
+        return bootstrap_database(conn)
+
 # Classe para gerenciar banco de dados
 class DatabaseManager:
-    def __init__(self, db_path="medstock360.db"):
-        self.db_path = db_path
-        self.init_database()
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_database_path()
+        self.pool = get_connection_pool(self.db_path)
+        # Novas sessões reutilizam o bootstrap do processo, sem DDL
+        self.schema_version = init_database(self.db_path)
+        self.backups = get_backup_scheduler(self.db_path)
+        self.replicator = get_wal_replicator(self.db_path) if Config.REPLICATION_ENABLED else None
     
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
-    
-    def init_database(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Tabela de usuários
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                nome_completo TEXT NOT NULL,
-                email TEXT,
-                perfil TEXT NOT NULL DEFAULT 'operador',
-                crm TEXT,
-                especialidade TEXT,
-                telefone TEXT,
-                ativo BOOLEAN DEFAULT 1,
-                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                ultimo_acesso TIMESTAMP,
-                permissoes TEXT DEFAULT '{}'
-            )
-        """)
-        
-        # Tabela de medicamentos
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS medicamentos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome TEXT NOT NULL,
-                principio_ativo TEXT,
-                categoria TEXT,
-                tipo TEXT,
-                concentracao TEXT,
-                forma_farmaceutica TEXT,
-                via_administracao TEXT,
-                controlado BOOLEAN DEFAULT 0,
-                refrigerado BOOLEAN DEFAULT 0,
-                prescricao_obrigatoria BOOLEAN DEFAULT 0,
-                tarja TEXT,
-                codigo_barras TEXT,
-                fabricante TEXT,
-                observacoes TEXT,
-                ativo BOOLEAN DEFAULT 1,
-                data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                cadastrado_por INTEGER,
-                FOREIGN KEY (cadastrado_por) REFERENCES usuarios (id)
-            )
-        """)
-        
-        # Tabela de lotes
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS lotes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                medicamento_id INTEGER NOT NULL,
-                numero_lote TEXT NOT NULL,
-                data_fabricacao DATE,
-                data_validade DATE NOT NULL,
-                quantidade_inicial INTEGER NOT NULL,
-                quantidade_atual INTEGER NOT NULL,
-                preco_unitario REAL,
-                fornecedor TEXT,
-                local_armazenamento TEXT,
-                setor TEXT,
-                prateleira TEXT,
-                posicao TEXT,
-                observacoes TEXT,
-                ativo BOOLEAN DEFAULT 1,
-                responsavel_entrada INTEGER,
-                data_entrada TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (medicamento_id) REFERENCES medicamentos (id),
-                FOREIGN KEY (responsavel_entrada) REFERENCES usuarios (id)
-            )
-        """)
-        
-        # Tabela de movimentações
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS movimentacoes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                lote_id INTEGER NOT NULL,
-                tipo_movimento TEXT NOT NULL,
-                quantidade INTEGER NOT NULL,
-                motivo TEXT,
-                observacoes TEXT,
-                responsavel INTEGER NOT NULL,
-                data_movimento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (lote_id) REFERENCES lotes (id),
-                FOREIGN KEY (responsavel) REFERENCES usuarios (id)
-            )
-        """)
-        
-        # Tabela de pacientes
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS pacientes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome_completo TEXT NOT NULL,
-                cpf TEXT UNIQUE,
-                rg TEXT,
-                data_nascimento DATE,
-                sexo TEXT,
-                telefone TEXT,
-                email TEXT,
-                endereco TEXT,
-                cidade TEXT,
-                cep TEXT,
-                plano_saude TEXT,
-                numero_carteira TEXT,
-                contato_emergencia TEXT,
-                alergias TEXT,
-                medicamentos_uso_continuo TEXT,
-                historico_familiar TEXT,
-                observacoes TEXT,
-                ativo BOOLEAN DEFAULT 1,
-                data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                cadastrado_por INTEGER,
-                FOREIGN KEY (cadastrado_por) REFERENCES usuarios (id)
-            )
-        """)
-        
-        # Tabela de consultas
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS consultas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                paciente_id INTEGER NOT NULL,
-                medico_id INTEGER NOT NULL,
-                data_consulta DATETIME NOT NULL,
-                motivo TEXT,
-                sintomas TEXT,
-                diagnostico TEXT,
-                observacoes TEXT,
-                valor REAL,
-                status TEXT DEFAULT 'agendada',
-                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
-                FOREIGN KEY (medico_id) REFERENCES usuarios (id)
-            )
-        """)
-        
-        # Tabela de receitas
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS receitas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                paciente_id INTEGER NOT NULL,
-                medico_id INTEGER NOT NULL,
-                consulta_id INTEGER,
-                data_receita DATETIME NOT NULL,
-                observacoes TEXT,
-                validade_receita DATE,
-                status TEXT DEFAULT 'ativa',
-                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
-                FOREIGN KEY (medico_id) REFERENCES usuarios (id),
-                FOREIGN KEY (consulta_id) REFERENCES consultas (id)
-            )
-        """)
-        
-        # Tabela de itens da receita
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS receita_itens (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                receita_id INTEGER NOT NULL,
-                medicamento_id INTEGER NOT NULL,
-                quantidade INTEGER NOT NULL,
-                posologia TEXT,
-                observacoes TEXT,
-                FOREIGN KEY (receita_id) REFERENCES receitas (id),
-                FOREIGN KEY (medicamento_id) REFERENCES medicamentos (id)
-            )
-        """)
-        
-        # Tabela de dispensações
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS dispensacoes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                receita_id INTEGER NOT NULL,
-                lote_id INTEGER NOT NULL,
-                quantidade_dispensada INTEGER NOT NULL,
-                data_dispensacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                responsavel INTEGER NOT NULL,
-                observacoes TEXT,
-                FOREIGN KEY (receita_id) REFERENCES receitas (id),
-                FOREIGN KEY (lote_id) REFERENCES lotes (id),
-                FOREIGN KEY (responsavel) REFERENCES usuarios (id)
-            )
-        """)
-        
-        # Tabela de prontuário
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS prontuario (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                paciente_id INTEGER NOT NULL,
-                consulta_id INTEGER,
-                data_entrada DATETIME NOT NULL,
-                tipo_entrada TEXT NOT NULL,
-                descricao TEXT NOT NULL,
-                medico_responsavel INTEGER,
-                anexos TEXT,
-                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
-                FOREIGN KEY (consulta_id) REFERENCES consultas (id),
-                FOREIGN KEY (medico_responsavel) REFERENCES usuarios (id)
-            )
-        """)
-        
-        # Tabela de alertas inteligentes
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS alertas_inteligentes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                tipo_alerta TEXT NOT NULL,
-                prioridade TEXT NOT NULL,
-                titulo TEXT NOT NULL,
-                mensagem TEXT NOT NULL,
-                paciente_id INTEGER,
-                medicamento_id INTEGER,
-                usuario_destinatario INTEGER,
-                lido BOOLEAN DEFAULT 0,
-                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                data_leitura TIMESTAMP,
-                FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
-                FOREIGN KEY (medicamento_id) REFERENCES medicamentos (id),
-                FOREIGN KEY (usuario_destinatario) REFERENCES usuarios (id)
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
-        
-        # Criar usuário admin se não existir
-        self.create_default_admin()
+        # Conexão de leitura da thread; close() a devolve ao pool
+        return self.pool.connection()
     
-    def create_default_admin(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Verificar se já existe admin
-        cursor.execute("SELECT COUNT(*) FROM usuarios WHERE perfil = 'admin'")
-        admin_count = cursor.fetchone()[0]
-        
-        if admin_count == 0:
-            # Criar usuário admin padrão
-            admin_password = hashlib.sha256("admin123".encode()).hexdigest()
-            
-            cursor.execute("""
-                INSERT INTO usuarios (username, password_hash, nome_completo, perfil, permissoes)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                "admin", admin_password, "Administrador do Sistema", "admin",
-                json.dumps({"medicamentos": ["visualizar", "criar", "editar", "excluir"],
-                           "estoque": ["visualizar", "criar", "editar"],
-                           "pacientes": ["visualizar", "criar", "editar"],
-                           "consultas": ["visualizar", "criar", "editar"],
-                           "receitas": ["visualizar", "criar", "editar"],
-                           "relatorios": ["visualizar", "gerar"],
-                           "usuarios": ["visualizar", "criar", "editar", "excluir"]})
-            ))
-            
-            conn.commit()
-        
-        conn.close()
+    def write_connection(self):
+        # Escritor único serializado: use com 'with', o commit é automático
+        return self.pool.writer()
 
 # Funções de autenticação
 def hash_password(password):
@@ -430,14 +258,12 @@ def show_login():
                         st.session_state.permissions = user['permissoes']
                         
                         # Atualizar último acesso
-                        conn = st.session_state.db_manager.get_connection()
-                        cursor = conn.cursor()
-                        cursor.execute(
-                            "UPDATE usuarios SET ultimo_acesso = CURRENT_TIMESTAMP WHERE id = ?",
-                            (user['id'],)
-                        )
-                        conn.commit()
-                        conn.close()
+                        with st.session_state.db_manager.write_connection() as conn:
+                            cursor = conn.cursor()
+                            cursor.execute(
+                                "UPDATE usuarios SET ultimo_acesso = CURRENT_TIMESTAMP WHERE id = ?",
+                                (user['id'],)
+                            )
                         
                         st.success("✅ Login realizado com sucesso!")
                         time.sleep(1)
@@ -522,6 +348,17 @@ def show_sidebar():
         
         st.markdown("---")
         
+        if Config.SHOW_DEBUG_INFO:
+            with st.expander("🔧 Pool de Conexões"):
+                st.json(st.session_state.db_manager.pool.metrics())
+            with st.expander("🔧 Cache de Alertas"):
+                st.json(get_alert_cache().stats())
+            with st.expander("🔧 Backup Automático"):
+                st.json(st.session_state.db_manager.backups.stats())
+            if st.session_state.db_manager.replicator is not None:
+                with st.expander("🔧 Replicação do WAL"):
+                    st.json(st.session_state.db_manager.replicator.stats())
+        
         if st.button("🚪 Sair", use_container_width=True):
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
@@ -532,35 +369,20 @@ def show_sidebar():
 def show_quick_alerts():
     st.markdown("### ⚠️ Alertas Rápidos")
     
-    conn = st.session_state.db_manager.get_connection()
-    
-    # Medicamentos próximos ao vencimento
-    query_vencimento = """
-        SELECT COUNT(*) FROM lotes l
-        JOIN medicamentos m ON l.medicamento_id = m.id
-        WHERE l.ativo = 1 AND DATE(l.data_validade) <= DATE('now', '+30 days')
-        AND l.quantidade_atual > 0
-    """
-    
-    # Medicamentos com estoque baixo
-    query_estoque_baixo = """
-        SELECT COUNT(*) FROM lotes l
-        JOIN medicamentos m ON l.medicamento_id = m.id
-        WHERE l.ativo = 1 AND l.quantidade_atual > 0 AND l.quantidade_atual <= 10
-    """
-    
-    # Medicamentos sem estoque
-    query_sem_estoque = """
-        SELECT COUNT(*) FROM lotes l
-        JOIN medicamentos m ON l.medicamento_id = m.id
-        WHERE l.ativo = 1 AND l.quantidade_atual = 0
-    """
-    
-    vencimento = pd.read_sql(query_vencimento, conn).iloc[0, 0]
-    estoque_baixo = pd.read_sql(query_estoque_baixo, conn).iloc[0, 0]
-    sem_estoque = pd.read_sql(query_sem_estoque, conn).iloc[0, 0]
+    def contar_alertas():
+        conn = st.session_state.db_manager.get_connection()
+        
+        # Próximos ao vencimento, estoque baixo e sem estoque
+        contadores = tuple(
+            int(conn.execute(query).fetchone()[0])
+            for query in (QUERY_ALERTA_VENCIMENTO, QUERY_ALERTA_ESTOQUE_BAIXO, QUERY_ALERTA_SEM_ESTOQUE)
+        )
+        
+        conn.close()
+        return contadores
     
-    conn.close()
+    # A sidebar roda a cada interação: os contadores vêm do cache compartilhado
+    vencimento, estoque_baixo, sem_estoque = get_alert_cache().get_or_compute("alertas_rapidos", contar_alertas)
     
     if vencimento > 0:
         st.warning(f"⚠️ {vencimento} próximos ao vencimento")
@@ -582,49 +404,30 @@ def show_dashboard():
     </div>
     """, unsafe_allow_html=True)
     
-    conn = st.session_state.db_manager.get_connection()
+    # Um único snapshot por intervalo, compartilhado por todas as sessões
+    snapshot = get_dashboard_snapshot()
     
     # Métricas principais
     col1, col2, col3, col4 = st.columns(4)
     
-    # Total de medicamentos
-    total_medicamentos = pd.read_sql("SELECT COUNT(*) FROM medicamentos WHERE ativo = 1", conn).iloc[0, 0]
-    
-    # Total de lotes ativos
-    total_lotes = pd.read_sql("SELECT COUNT(*) FROM lotes WHERE ativo = 1", conn).iloc[0, 0]
-    
-    # Total de pacientes
-    total_pacientes = pd.read_sql("SELECT COUNT(*) FROM pacientes WHERE ativo = 1", conn).iloc[0, 0]
-    
-    # Movimentações hoje
-    movimentacoes_hoje = pd.read_sql(
-        "SELECT COUNT(*) FROM movimentacoes WHERE DATE(data_movimento) = DATE('now')", conn
-    ).iloc[0, 0]
-    
     with col1:
-        st.metric("💊 Medicamentos", total_medicamentos)
+        st.metric("💊 Medicamentos", snapshot.total_medicamentos)
     
     with col2:
-        st.metric("📦 Lotes Ativos", total_lotes)
+        st.metric("📦 Lotes Ativos", snapshot.total_lotes)
     
     with col3:
-        st.metric("👥 Pacientes", total_pacientes)
+        st.metric("👥 Pacientes", snapshot.total_pacientes)
     
     with col4:
-        st.metric("📈 Movimentações Hoje", movimentacoes_hoje)
+        st.metric("📈 Movimentações Hoje", snapshot.movimentacoes_hoje)
     
     # Gráficos do dashboard
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("### 📊 Medicamentos por Categoria")
-        df_categorias = pd.read_sql("""
-            SELECT categoria, COUNT(*) as quantidade
-            FROM medicamentos 
-            WHERE ativo = 1 AND categoria IS NOT NULL
-            GROUP BY categoria
-            ORDER BY quantidade DESC
-        """, conn)
+        df_categorias = snapshot.categorias
         
         if not df_categorias.empty:
             fig = px.pie(df_categorias, values='quantidade', names='categoria')
@@ -634,16 +437,7 @@ def show_dashboard():
     
     with col2:
         st.markdown("### 📈 Movimentações dos Últimos 7 Dias")
-        df_movimentacoes = pd.read_sql("""
-            SELECT 
-                DATE(data_movimento) as data,
-                tipo_movimento,
-                COUNT(*) as quantidade
-            FROM movimentacoes 
-            WHERE data_movimento >= DATE('now', '-7 days')
-            GROUP BY DATE(data_movimento), tipo_movimento
-            ORDER BY data
-        """, conn)
+        df_movimentacoes = snapshot.movimentacoes_7_dias
         
         if not df_movimentacoes.empty:
             fig = px.bar(df_movimentacoes, x='data', y='quantidade', color='tipo_movimento')
@@ -655,20 +449,7 @@ def show_dashboard():
     st.markdown("### 🚨 Alertas Críticos")
     
     # Medicamentos próximos ao vencimento
-    df_vencimento = pd.read_sql("""
-        SELECT 
-            m.nome,
-            l.numero_lote,
-            l.data_validade,
-            l.quantidade_atual,
-            julianday(l.data_validade) - julianday('now') as dias_vencimento
-        FROM lotes l
-        JOIN medicamentos m ON l.medicamento_id = m.id
-        WHERE l.ativo = 1 AND DATE(l.data_validade) <= DATE('now', '+30 days')
-        AND l.quantidade_atual > 0
-        ORDER BY l.data_validade
-        LIMIT 5
-    """, conn)
+    df_vencimento = snapshot.proximos_vencimento
     
     if not df_vencimento.empty:
         st.markdown("#### ⚠️ Próximos ao Vencimento")
@@ -684,25 +465,12 @@ def show_dashboard():
             st.warning(f"{cor} {item['nome']} (Lote: {item['numero_lote']}) - Vence em {dias} dias")
     
     # Medicamentos com estoque baixo
-    df_estoque_baixo = pd.read_sql("""
-        SELECT 
-            m.nome,
-            l.numero_lote,
-            l.quantidade_atual,
-            l.local_armazenamento
-        FROM lotes l
-        JOIN medicamentos m ON l.medicamento_id = m.id
-        WHERE l.ativo = 1 AND l.quantidade_atual > 0 AND l.quantidade_atual <= 10
-        ORDER BY l.quantidade_atual
-        LIMIT 5
-    """, conn)
+    df_estoque_baixo = snapshot.lotes_estoque_baixo_lista
     
     if not df_estoque_baixo.empty:
         st.markdown("#### 📦 Estoque Baixo")
         for _, item in df_estoque_baixo.iterrows():
             st.warning(f"📦 {item['nome']} - {item['quantidade_atual']} unidades restantes")
-    
-    conn.close()
 
 def show_medicamentos():
     """Módulo de medicamentos"""
@@ -735,18 +503,21 @@ def show_medicamentos():
             SELECT 
                 m.*,
                 u.nome_completo as cadastrado_por_nome,
-                COUNT(DISTINCT l.id) as total_lotes,
-                SUM(l.quantidade_atual) as estoque_total
+                r.lotes_ativos as total_lotes,
+                r.total_unidades as estoque_total
             FROM medicamentos m
             LEFT JOIN usuarios u ON m.cadastrado_por = u.id
-            LEFT JOIN lotes l ON m.id = l.medicamento_id AND l.ativo = 1
-            WHERE m.ativo = 1
+            LEFT JOIN estoque_resumo r ON r.medicamento_id = m.id
         """
         params = []
         
-        if search_term:
-            query += " AND (m.nome LIKE ? OR m.principio_ativo LIKE ?)"
-            params.extend([f"%{search_term}%", f"%{search_term}%"])
+        # Busca FTS5 (sem acentos, por prefixo), ordenada por relevância
+        busca = fts_query(search_term)
+        if busca:
+            query += f" JOIN ({BUSCA_MEDICAMENTOS}) b ON b.id = m.id"
+            params.append(busca)
+        
+        query += " WHERE m.ativo = 1"
         
         if categoria_filter != "Todas":
             query += " AND m.categoria = ?"
@@ -760,7 +531,7 @@ def show_medicamentos():
             elif tipo_filter == "Prescrição Obrigatória":
                 query += " AND m.prescricao_obrigatoria = 1"
         
-        query += " GROUP BY m.id ORDER BY m.nome"
+        query += " ORDER BY b.rank, m.nome" if busca else " ORDER BY m.nome"
         
         df_medicamentos = pd.read_sql(query, conn, params=params)
         conn.close()
@@ -873,25 +644,23 @@ def show_medicamentos():
                         st.error("❌ O nome do medicamento é obrigatório!")
                     else:
                         try:
-                            conn = st.session_state.db_manager.get_connection()
-                            cursor = conn.cursor()
+                            with st.session_state.db_manager.write_connection() as conn:
+                                cursor = conn.cursor()
                             
-                            cursor.execute("""
-                                INSERT INTO medicamentos (
+                                cursor.execute("""
+                                    INSERT INTO medicamentos (
+                                        nome, principio_ativo, categoria, tipo, concentracao,
+                                        forma_farmaceutica, via_administracao, controlado, refrigerado,
+                                        prescricao_obrigatoria, tarja, codigo_barras, fabricante,
+                                        observacoes, cadastrado_por
+                                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                """, (
                                     nome, principio_ativo, categoria, tipo, concentracao,
                                     forma_farmaceutica, via_administracao, controlado, refrigerado,
                                     prescricao_obrigatoria, tarja, codigo_barras, fabricante,
-                                    observacoes, cadastrado_por
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """, (
-                                nome, principio_ativo, categoria, tipo, concentracao,
-                                forma_farmaceutica, via_administracao, controlado, refrigerado,
-                                prescricao_obrigatoria, tarja, codigo_barras, fabricante,
-                                observacoes, st.session_state.user['id']
-                            ))
-                            
-                            conn.commit()
-                            conn.close()
+                                    observacoes, st.session_state.user['id']
+                                ))
+                            invalidate_medicine_caches()
                             
                             st.success("✅ Medicamento cadastrado com sucesso!")
                             time.sleep(2)
@@ -903,33 +672,23 @@ def show_medicamentos():
     with tab3:
         st.markdown("### 📊 Estatísticas de Medicamentos")
         
-        conn = st.session_state.db_manager.get_connection()
-        
-        # Estatísticas gerais
-        total_medicamentos = pd.read_sql("SELECT COUNT(*) FROM medicamentos WHERE ativo = 1", conn).iloc[0, 0]
-        controlados = pd.read_sql("SELECT COUNT(*) FROM medicamentos WHERE ativo = 1 AND controlado = 1", conn).iloc[0, 0]
-        refrigerados = pd.read_sql("SELECT COUNT(*) FROM medicamentos WHERE ativo = 1 AND refrigerado = 1", conn).iloc[0, 0]
+        # Mesmos números do dashboard: reaproveita o snapshot compartilhado
+        snapshot = get_dashboard_snapshot()
         
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("💊 Total Medicamentos", total_medicamentos)
+            st.metric("💊 Total Medicamentos", snapshot.total_medicamentos)
         with col2:
-            st.metric("🔒 Controlados", controlados)
+            st.metric("🔒 Controlados", snapshot.controlados)
         with col3:
-            st.metric("❄️ Refrigerados", refrigerados)
+            st.metric("❄️ Refrigerados", snapshot.refrigerados)
         
         # Gráficos
         col1, col2 = st.columns(2)
         
         with col1:
             # Distribuição por categoria
-            df_cat = pd.read_sql("""
-                SELECT categoria, COUNT(*) as quantidade
-                FROM medicamentos 
-                WHERE ativo = 1 AND categoria IS NOT NULL
-                GROUP BY categoria
-                ORDER BY quantidade DESC
-            """, conn)
+            df_cat = snapshot.categorias
             
             if not df_cat.empty:
                 st.markdown("#### 📂 Por Categoria")
@@ -938,24 +697,91 @@ def show_medicamentos():
         
         with col2:
             # Distribuição por forma farmacêutica
-            df_forma = pd.read_sql("""
-                SELECT forma_farmaceutica, COUNT(*) as quantidade
-                FROM medicamentos 
-                WHERE ativo = 1 AND forma_farmaceutica IS NOT NULL
-                GROUP BY forma_farmaceutica
-                ORDER BY quantidade DESC
-                LIMIT 10
-            """, conn)
+            df_forma = snapshot.formas_farmaceuticas
             
             if not df_forma.empty:
                 st.markdown("#### 💊 Por Forma Farmacêutica")
                 fig = px.pie(df_forma, values='quantidade', names='forma_farmaceutica')
                 st.plotly_chart(fig, use_container_width=True)
-        
-        conn.close()
 
 # FUNÇÕES ADICIONAIS DO SISTEMA (CONTINUAÇÃO DO CÓDIGO FORNECIDO)
 
+@st.fragment
+def show_scan_mode():
+    """Estação de leitura: cada leitura reexecuta só este fragmento e é gravada em micro-lotes"""
+    # Sem run_every: o fragmento fica em uma aba sempre renderizada e reexecutaria em toda sessão;
+    # a gravação acontece na leitura seguinte (lote cheio ou intervalo vencido) ou pelo botão
+    sessao = st.session_state.get('sessao_leitura')
+    # Trocar de operação cria outra sessão: as leituras pendentes precisam ser gravadas antes
+    modo = st.radio("Operação", MODOS, horizontal=True, key="modo_leitura",
+                    disabled=bool(sessao and sessao.pendentes),
+                    help="Grave ou descarte as leituras pendentes para trocar de operação")
+    if sessao is None or sessao.modo != modo:
+        sessao = ScanSession(get_barcode_index(), modo, st.session_state.user['id'])
+        st.session_state.sessao_leitura = sessao
+
+    def registrar_leitura():
+        leitura = st.session_state.codigo_lido
+        st.session_state.codigo_lido = ""
+        if not leitura.strip():
+            return
+        conn = st.session_state.db_manager.get_connection()
+        try:
+            item = sessao.scan(conn, leitura)
+            st.session_state.ultima_leitura = ("success", f"✅ {item['medicamento']}"
+                                               + (f" — lote {item['numero_lote']}" if item['numero_lote'] else ""))
+        except ScanError as e:
+            st.session_state.ultima_leitura = ("error", f"❌ {str(e)}")
+        finally:
+            conn.close()
+
+    def gravar_leituras():
+        try:
+            with st.session_state.db_manager.write_connection() as conn:
+                gravadas = sessao.flush(conn)
+            invalidate_stock_caches()
+            if sessao.recusadas:
+                recusadas = "; ".join(f"{item['medicamento']}: {item['erro']}" for item in sessao.recusadas)
+                st.session_state.ultima_leitura = ("warning", f"⚠️ {gravadas} leituras gravadas, "
+                                                   f"{len(sessao.recusadas)} recusadas — {recusadas}")
+            elif gravadas:
+                st.session_state.ultima_leitura = ("success", f"💾 {gravadas} leituras gravadas")
+        except Exception as e:
+            # Erro fora de uma leitura (banco ocupado, por exemplo): as leituras continuam pendentes
+            st.session_state.ultima_leitura = ("error", f"❌ Erro ao gravar leituras: {str(e)}")
+
+    st.text_input("Código lido", key="codigo_lido", on_change=registrar_leitura,
+                  placeholder="Posicione o cursor aqui e leia os códigos")
+
+    # Cada leitura reexecuta o fragmento: grava aqui quando o micro-lote enche ou o intervalo vence
+    if sessao.should_flush():
+        gravar_leituras()
+
+    if 'ultima_leitura' in st.session_state:
+        nivel, mensagem = st.session_state.ultima_leitura
+        getattr(st, nivel)(mensagem)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Pendentes", len(sessao.pendentes))
+    with col2:
+        st.metric("Gravadas", sessao.gravadas)
+    with col3:
+        if st.button("💾 Gravar agora", use_container_width=True, disabled=not sessao.pendentes):
+            gravar_leituras()
+            st.rerun(scope="fragment")
+        if st.button("🗑️ Descartar", use_container_width=True, disabled=not sessao.pendentes):
+            sessao.discard()
+            st.rerun(scope="fragment")
+
+    if sessao.pendentes:
+        st.caption(f"Leituras pendentes são gravadas a cada {sessao.tamanho} leituras, na próxima leitura após "
+                   f"{sessao.intervalo} s ou pelo botão 💾 Gravar agora.")
+        pendentes = pd.DataFrame(sessao.pendentes)
+        resumo = pendentes.fillna({'numero_lote': 'FEFO'}).groupby(
+            ['medicamento', 'numero_lote'], dropna=False).size().reset_index(name='leituras')
+        st.dataframe(resumo, use_container_width=True, hide_index=True)
+
 def show_estoque():
     """Módulo de estoque avançado"""
     st.markdown("## 📦 Gestão de Estoque Inteligente")
@@ -987,68 +813,27 @@ def show_estoque():
             setor_filter = st.selectbox("🏢 Setor", ["Todos"] + 
                 pd.read_sql("SELECT DISTINCT setor FROM lotes WHERE setor IS NOT NULL", conn)['setor'].tolist())
         
-        # Query base avançada
-        query = """
-            SELECT 
-                m.nome as medicamento,
-                m.principio_ativo,
-                m.controlado,
-                l.numero_lote,
-                l.data_validade,
-                l.quantidade_atual,
-                l.local_armazenamento,
-                l.setor,
-                l.prateleira,
-                l.posicao,
-                l.fornecedor,
-                l.preco_unitario,
-                julianday(l.data_validade) - julianday('now') as dias_vencimento,
-                CASE 
-                    WHEN l.quantidade_atual = 0 THEN 'Sem estoque'
-                    WHEN l.quantidade_atual <= 10 THEN 'Estoque baixo'
-                    WHEN DATE(l.data_validade) <= DATE('now', '+30 days') THEN 'Próximo ao vencimento'
-                    ELSE 'Normal'
-                END as status
-            FROM lotes l
-            JOIN medicamentos m ON l.medicamento_id = m.id
-            WHERE l.ativo = 1 AND m.ativo = 1
-        """
-        params = []
-        
-        if search_term:
-            query += " AND m.nome LIKE ?"
-            params.append(f"%{search_term}%")
+        # Filtros aplicados no SQL; a lista é paginada por chave
+        filtros = stock_filters(search_term, local_filter, setor_filter, status_filter)
         
-        if local_filter != "Todos":
-            query += " AND l.local_armazenamento = ?"
-            params.append(local_filter)
+        # Filtros novos voltam para a primeira página
+        assinatura_filtros = (search_term, local_filter, setor_filter, status_filter)
+        if st.session_state.get('estoque_filtros') != assinatura_filtros:
+            st.session_state.estoque_filtros = assinatura_filtros
+            st.session_state.estoque_cursores = [None]
         
-        if setor_filter != "Todos":
-            query += " AND l.setor = ?"
-            params.append(setor_filter)
-        
-        if status_filter != "Todos":
-            if status_filter == "Em estoque":
-                query += " AND l.quantidade_atual > 10"
-            elif status_filter == "Estoque baixo":
-                query += " AND l.quantidade_atual > 0 AND l.quantidade_atual <= 10"
-            elif status_filter == "Sem estoque":
-                query += " AND l.quantidade_atual = 0"
-            elif status_filter == "Próximo ao vencimento":
-                query += " AND DATE(l.data_validade) <= DATE('now', '+30 days') AND l.quantidade_atual > 0"
-        
-        query += " ORDER BY m.nome, l.data_validade"
-        
-        df_estoque = pd.read_sql(query, conn, params=params)
+        cursores = st.session_state.estoque_cursores
+        totais = load_stock_totals(conn, filtros)
+        df_estoque, proximo_cursor = load_stock_page(conn, filtros, cursor=cursores[-1])
         conn.close()
         
-        if not df_estoque.empty:
+        if totais['total_lotes'] > 0:
             # Resumo inteligente
-            total_lotes = len(df_estoque)
-            sem_estoque = len(df_estoque[df_estoque['quantidade_atual'] == 0])
-            estoque_baixo = len(df_estoque[(df_estoque['quantidade_atual'] > 0) & (df_estoque['quantidade_atual'] <= 10)])
-            proximo_vencimento = len(df_estoque[df_estoque['status'] == 'Próximo ao vencimento'])
-            medicamentos_controlados = len(df_estoque[df_estoque['controlado'] == 1])
+            total_lotes = totais['total_lotes']
+            sem_estoque = totais['sem_estoque']
+            estoque_baixo = totais['estoque_baixo']
+            proximo_vencimento = totais['proximo_vencimento']
+            medicamentos_controlados = totais['controlados']
             
             col1, col2, col3, col4, col5 = st.columns(5)
             
@@ -1081,20 +866,58 @@ def show_estoque():
             # Lista avançada com localização
             st.markdown("### 📋 Lista Detalhada com Localização")
             
-            for _, item in df_estoque.iterrows():
-                # Cor baseada no status
-                if item['status'] == 'Sem estoque':
-                    status_color = '🔴'
-                elif item['status'] == 'Estoque baixo':
-                    status_color = '🟡'
-                elif item['status'] == 'Próximo ao vencimento':
-                    status_color = '⚠️'
-                else:
-                    status_color = '🟢'
-                
+            status_icones = {
+                'Sem estoque': '🔴',
+                'Estoque baixo': '🟡',
+                'Próximo ao vencimento': '⚠️'
+            }
+            
+            tabela = pd.DataFrame({
+                'Status': df_estoque['status'].map(status_icones).fillna('🟢') + ' ' + df_estoque['status'],
+                'Medicamento': df_estoque['medicamento'] + df_estoque['controlado'].map({1: ' 🔒'}).fillna(''),
+                'Lote': df_estoque['numero_lote'],
+                'Quantidade': df_estoque['quantidade_atual'],
+                'Validade': df_estoque['data_validade'],
+                'Local': df_estoque['local_armazenamento'],
+                'Setor': df_estoque['setor']
+            })
+            
+            pagina_atual = len(cursores)
+            total_paginas = -(-total_lotes // Config.ITEMS_PER_PAGE)
+            
+            selecao = st.dataframe(
+                tabela,
+                hide_index=True,
+                use_container_width=True,
+                on_select="rerun",
+                selection_mode="single-row",
+                key=f"estoque_tabela_{pagina_atual}"
+            )
+            
+            col1, col2, col3 = st.columns([1, 2, 1])
+            
+            with col1:
+                if st.button("⬅️ Anterior", disabled=pagina_atual == 1, use_container_width=True):
+                    cursores.pop()
+                    st.rerun()
+            
+            with col2:
+                st.markdown(f"<div style='text-align: center'>Página {pagina_atual} de {total_paginas}</div>", unsafe_allow_html=True)
+            
+            with col3:
+                if st.button("Próxima ➡️", disabled=proximo_cursor is None, use_container_width=True):
+                    cursores.append(proximo_cursor)
+                    st.rerun()
+            
+            # Detalhes apenas do lote selecionado na tabela
+            if selecao.selection.rows:
+                item = df_estoque.iloc[selecao.selection.rows[0]]
+                status_color = status_icones.get(item['status'], '🟢')
                 controlado_badge = ' 🔒' if item['controlado'] else ''
                 
-                with st.expander(f"{status_color} {item['medicamento']}{controlado_badge} - Lote: {item['numero_lote']}"):
+                st.markdown(f"#### {status_color} {item['medicamento']}{controlado_badge} - Lote: {item['numero_lote']}")
+                
+                with st.container(border=True):
                     col1, col2, col3 = st.columns(3)
                     
                     with col1:
@@ -1194,37 +1017,36 @@ def show_estoque():
                             st.error("❌ A data de validade deve ser futura!")
                         else:
                             try:
-                                conn = st.session_state.db_manager.get_connection()
-                                cursor = conn.cursor()
+                                with st.session_state.db_manager.write_connection() as conn:
+                                    cursor = conn.cursor()
                                 
-                                medicamento_id = medicamento_options[medicamento_selecionado]
+                                    medicamento_id = medicamento_options[medicamento_selecionado]
                                 
-                                # Inserir lote com localização
-                                cursor.execute("""
-                                    INSERT INTO lotes (
+                                    # Inserir lote com localização
+                                    cursor.execute("""
+                                        INSERT INTO lotes (
+                                            medicamento_id, numero_lote, data_fabricacao, data_validade,
+                                            quantidade_inicial, quantidade_atual, preco_unitario, fornecedor,
+                                            local_armazenamento, setor, prateleira, posicao, observacoes, 
+                                            responsavel_entrada
+                                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                    """, (
                                         medicamento_id, numero_lote, data_fabricacao, data_validade,
-                                        quantidade_inicial, quantidade_atual, preco_unitario, fornecedor,
-                                        local_armazenamento, setor, prateleira, posicao, observacoes, 
-                                        responsavel_entrada
-                                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                """, (
-                                    medicamento_id, numero_lote, data_fabricacao, data_validade,
-                                    quantidade_inicial, quantidade_inicial, preco_unitario, fornecedor,
-                                    local_armazenamento, setor, prateleira, posicao, observacoes,
-                                    st.session_state.user['id']
-                                ))
+                                        quantidade_inicial, quantidade_inicial, preco_unitario, fornecedor,
+                                        local_armazenamento, setor, prateleira, posicao, observacoes,
+                                        st.session_state.user['id']
+                                    ))
                                 
-                                lote_id = cursor.lastrowid
+                                    lote_id = cursor.lastrowid
                                 
-                                # Registrar movimentação
-                                cursor.execute("""
-                                    INSERT INTO movimentacoes (
-                                        lote_id, tipo_movimento, quantidade, motivo, responsavel
-                                    ) VALUES (?, 'Entrada', ?, 'Entrada de novo lote', ?)
-                                """, (lote_id, quantidade_inicial, st.session_state.user['id']))
+                                    # Registrar movimentação
+                                    cursor.execute("""
+                                        INSERT INTO movimentacoes (
+                                            lote_id, tipo_movimento, quantidade, motivo, responsavel
+                                        ) VALUES (?, 'Entrada', ?, 'Entrada de novo lote', ?)
+                                    """, (lote_id, quantidade_inicial, st.session_state.user['id']))
                                 
-                                conn.commit()
-                                conn.close()
+                                invalidate_stock_caches()
                                 
                                 # Criar alerta inteligente se próximo ao vencimento
                                 dias_para_vencer = (data_validade - date.today()).days
@@ -1243,7 +1065,36 @@ def show_estoque():
                                 
                             except Exception as e:
                                 st.error(f"❌ Erro ao registrar lote: {str(e)}")
-    
+
+                # Recebimento em lote: arquivo lido e gravado em blocos
+                with st.expander("📥 Recebimento em Lote (CSV ou XML da NF-e)"):
+                    st.caption("Colunas do CSV: codigo_barras ou medicamento, numero_lote, data_validade, quantidade "
+                               "e, opcionalmente, data_fabricacao, preco_unitario, fornecedor, local_armazenamento, "
+                               "setor, prateleira, posicao")
+                    arquivo = st.file_uploader("Arquivo do fornecedor", type=["csv", "xml"], key="arquivo_recebimento")
+
+                    if arquivo is not None and st.button("📥 Importar lotes", use_container_width=True):
+                        try:
+                            with st.spinner("Importando lotes..."):
+                                with st.session_state.db_manager.write_connection() as conn:
+                                    resultado = import_lots(conn, read_chunks(arquivo), st.session_state.user['id'])
+                            invalidate_stock_caches()
+
+                            st.success(f"✅ {resultado['importadas']} de {resultado['linhas']} linhas importadas "
+                                       f"em {resultado['segundos']:.1f} s")
+                            if not resultado['erros'].empty:
+                                st.warning(f"⚠️ {len(resultado['erros'])} linhas com erro não foram importadas")
+                                st.dataframe(resultado['erros'], use_container_width=True, hide_index=True)
+                                st.download_button("📄 Baixar relatório de erros",
+                                                   resultado['erros'].to_csv(index=False).encode("utf-8"),
+                                                   file_name="erros_recebimento.csv", mime="text/csv")
+                        except Exception as e:
+                            st.error(f"❌ Erro ao importar arquivo: {str(e)}")
+
+                # Modo leitura: leitor em modo teclado, gravação em micro-lotes
+                with st.expander("🔫 Modo Leitura (código de barras)"):
+                    show_scan_mode()
+
     with tab3:
         st.markdown("### 📊 Histórico Inteligente de Movimentações")
         
@@ -1262,82 +1113,57 @@ def show_estoque():
         with col4:
             medicamento_filtro = st.text_input("Filtrar Medicamento", placeholder="Nome do medicamento")
         
-        # Buscar movimentações
-        query = """
-            SELECT 
-                m.nome as medicamento,
-                l.numero_lote,
-                l.local_armazenamento,
-                l.setor,
-                mov.tipo_movimento,
-                mov.quantidade,
-                mov.motivo,
-                mov.data_movimento,
-                u.nome_completo as responsavel,
-                mov.observacoes
-            FROM movimentacoes mov
-            JOIN lotes l ON mov.lote_id = l.id
-            JOIN medicamentos m ON l.medicamento_id = m.id
-            JOIN usuarios u ON mov.responsavel = u.id
-            WHERE DATE(mov.data_movimento) BETWEEN ? AND ?
-        """
-        params = [data_inicio, data_fim]
-        
-        if tipo_movimento != "Todos":
-            query += " AND mov.tipo_movimento = ?"
-            params.append(tipo_movimento)
-        
-        if medicamento_filtro:
-            query += " AND m.nome LIKE ?"
-            params.append(f"%{medicamento_filtro}%")
-        
-        query += " ORDER BY mov.data_movimento DESC"
+        # Filtros novos voltam para a primeira página
+        assinatura_filtros = (data_inicio, data_fim, tipo_movimento, medicamento_filtro)
+        if st.session_state.get('movimentacoes_filtros') != assinatura_filtros:
+            st.session_state.movimentacoes_filtros = assinatura_filtros
+            st.session_state.movimentacoes_cursores = [None]
+        cursores = st.session_state.movimentacoes_cursores
         
+        # Gráfico e totais do acumulado diário; lista paginada por chave
         conn = st.session_state.db_manager.get_connection()
-        df_movimentacoes = pd.read_sql(query, conn, params=params)
+        df_resumo = load_movement_summary(conn, data_inicio, data_fim, tipo_movimento, medicamento_filtro)
+        df_movimentacoes, proximo_cursor = load_movement_page(
+            conn, data_inicio, data_fim, tipo_movimento, medicamento_filtro, cursor=cursores[-1]
+        )
+        inicio_banco = hot_start(conn)
+        conn.close()
         
-        # Estatísticas das movimentações
-        if not df_movimentacoes.empty:
+        # Estatísticas e gráfico do acumulado diário, que cobre também os períodos arquivados
+        if not df_resumo.empty:
+            por_tipo = df_resumo.groupby('tipo_movimento')['quantidade'].sum()
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                entradas = len(df_movimentacoes[df_movimentacoes['tipo_movimento'] == 'Entrada'])
-                st.metric("📥 Entradas", entradas)
+                st.metric("📥 Entradas", int(por_tipo.get('Entrada', 0)))
             
             with col2:
-                saidas = len(df_movimentacoes[df_movimentacoes['tipo_movimento'] == 'Saída'])
-                st.metric("📤 Saídas", saidas)
+                st.metric("📤 Saídas", int(por_tipo.get('Saída', 0)))
             
             with col3:
-                ajustes = len(df_movimentacoes[df_movimentacoes['tipo_movimento'] == 'Ajuste'])
-                st.metric("🔧 Ajustes", ajustes)
+                st.metric("🔧 Ajustes", int(por_tipo.get('Ajuste', 0)))
             
             # Gráfico de movimentações por dia
             st.markdown("### 📈 Movimentações por Dia")
-            df_grafico = df_movimentacoes.copy()
-            df_grafico['data'] = pd.to_datetime(df_grafico['data_movimento']).dt.date
-            df_resumo = df_grafico.groupby(['data', 'tipo_movimento']).size().reset_index(name='quantidade')
-            
-            if not df_resumo.empty:
-                fig = px.bar(df_resumo, x='data', y='quantidade', color='tipo_movimento', 
-                           title="Movimentações por Tipo e Data")
-                st.plotly_chart(fig, use_container_width=True)
             
-            # Lista detalhada
+            fig = px.bar(df_resumo, x='data', y='quantidade', color='tipo_movimento', 
+                       title="Movimentações por Tipo e Data")
+            st.plotly_chart(fig, use_container_width=True)
+        
+        # Lista paginada: só as movimentações ainda no banco
+        if not df_movimentacoes.empty:
             st.markdown("### 📋 Lista Detalhada")
+            tipo_icons = {
+                'Entrada': '📥',
+                'Saída': '📤', 
+                'Ajuste': '🔧',
+                'Transferência': '🔄'
+            }
             for _, mov in df_movimentacoes.iterrows():
                 # Ícone baseado no tipo
-                tipo_icons = {
-                    'Entrada': '📥',
-                    'Saída': '📤', 
-                    'Ajuste': '🔧',
-                    'Transferência': '🔄'
-                }
                 icon = tipo_icons.get(mov['tipo_movimento'], '📋')
                 
-                data_mov = datetime.strptime(mov['data_movimento'], '%Y-%m-%d %H:%M:%S')
-                
-                with st.expander(f"{icon} {mov['medicamento']} - {data_mov.strftime('%d/%m/%Y %H:%M')}"):
+                with st.expander(f"{icon} {mov['medicamento']} - {mov['data_hora']}"):
                     col1, col2, col3 = st.columns(3)
                     
                     with col1:
@@ -1349,18 +1175,48 @@ def show_estoque():
                     with col2:
                         st.write(f"**Local:** {mov['local_armazenamento'] or 'N/A'}")
                         st.write(f"**Setor:** {mov['setor'] or 'N/A'}")
-                        st.write(f"**Responsável:** {mov['responsavel']}")
-                        st.write(f"**Data/Hora:** {data_mov.strftime('%d/%m/%Y %H:%M')}")
+                        st.write(f"**Responsável:** {mov['responsavel'] or 'N/A'}")
+                        st.write(f"**Data/Hora:** {mov['data_hora']}")
                     
                     with col3:
                         st.write(f"**Motivo:** {mov['motivo'] or 'N/A'}")
                         if mov['observacoes']:
                             st.write(f"**Observações:** {mov['observacoes']}")
+            
+            pagina_atual = len(cursores)
+            # Dias anteriores à movimentação mais antiga do banco estão no arquivo, fora da lista
+            resumo_banco = df_resumo[df_resumo['data'] >= inicio_banco[:10]] if inicio_banco else df_resumo
+            total_paginas = max(1, -(-int(resumo_banco['quantidade'].sum()) // Config.ITEMS_PER_PAGE))
+            
+            col1, col2, col3 = st.columns([1, 2, 1])
+            
+            with col1:
+                if st.button("⬅️ Anterior", key="movimentacoes_anterior", disabled=pagina_atual == 1, use_container_width=True):
+                    cursores.pop()
+                    st.rerun()
+            
+            with col2:
+                st.markdown(f"<div style='text-align: center'>Página {pagina_atual} de {total_paginas}</div>", unsafe_allow_html=True)
+            
+            with col3:
+                if st.button("Próxima ➡️", key="movimentacoes_proxima", disabled=proximo_cursor is None, use_container_width=True):
+                    cursores.append(proximo_cursor)
+                    st.rerun()
         
-        conn.close()
-        
-        if df_movimentacoes.empty:
+        if df_resumo.empty:
             st.info("Nenhuma movimentação encontrada no período selecionado.")
+        
+        # Períodos arquivados: o gráfico já os inclui; a lista mostra só o banco
+        if inicio_banco and data_inicio.isoformat() < inicio_banco[:10]:
+            st.info(f"📦 Movimentações anteriores a {inicio_banco[:10]} estão no arquivo e não aparecem na lista.")
+            if st.button("📄 Gerar relatório completo do período (banco + arquivo)", key="movimentacoes_relatorio"):
+                conn = st.session_state.db_manager.get_connection()
+                df_completo = load_movements(conn, data_inicio, data_fim + timedelta(days=1),
+                                             tipo=None if tipo_movimento == "Todos" else tipo_movimento,
+                                             busca_medicamento=medicamento_filtro)
+                conn.close()
+                st.download_button("📥 Baixar relatório (CSV)", df_completo.to_csv(index=False).encode("utf-8"),
+                                   file_name=f"movimentacoes_{data_inicio}_{data_fim}.csv", mime="text/csv")
     
     with tab4:
         st.markdown("### 🗺️ Mapa 3D do Estoque")
@@ -1372,122 +1228,128 @@ def show_estoque():
         </div>
         """, unsafe_allow_html=True)
         
-        # Buscar dados para o mapa
+        # Uma linha por posição (local → setor → prateleira → posição), agregada no banco
         conn = st.session_state.db_manager.get_connection()
-        df_mapa = pd.read_sql("""
-            SELECT 
-                m.nome as medicamento,
-                l.local_armazenamento,
-                l.setor,
-                l.prateleira,
-                l.posicao,
-                l.quantidade_atual,
-                l.numero_lote,
-                CASE 
-                    WHEN l.quantidade_atual = 0 THEN 'Vazio'
-                    WHEN l.quantidade_atual <= 10 THEN 'Baixo'
-                    WHEN DATE(l.data_validade) <= DATE('now', '+30 days') THEN 'Vencendo'
-                    ELSE 'Normal'
-                END as status
-            FROM lotes l
-            JOIN medicamentos m ON l.medicamento_id = m.id
-            WHERE l.ativo = 1 AND l.local_armazenamento IS NOT NULL
-            ORDER BY l.local_armazenamento, l.setor, l.prateleira, l.posicao
-        """, conn)
+        df_mapa = load_stock_map(conn)
         conn.close()
         
         if not df_mapa.empty:
-            # Agrupar por local
-            locais_unicos = df_mapa['local_armazenamento'].unique()
+            col1, col2, col3, col4 = st.columns(4)
             
-            for local in locais_unicos:
-                st.markdown(f"### 🏢 {local}")
-                
-                local_data = df_mapa[df_mapa['local_armazenamento'] == local]
-                
-                # Criar grid visual
-                setores = local_data['setor'].unique()
-                
-                if len(setores) > 1:
-                    cols = st.columns(len(setores))
-                    
-                    for i, setor in enumerate(setores):
-                        if pd.notna(setor):
-                            with cols[i]:
-                                st.markdown(f"**🏢 Setor {setor}**")
-                                
-                                setor_data = local_data[local_data['setor'] == setor]
-                                
-                                for _, item in setor_data.iterrows():
-                                    # Cor baseada no status
-                                    if item['status'] == 'Vazio':
-                                        cor = 'red'
-                                    elif item['status'] == 'Baixo':
-                                        cor = 'orange'
-                                    elif item['status'] == 'Vencendo':
-                                        cor = 'yellow'
-                                    else:
-                                        cor = 'green'
-                                    
-                                    st.markdown(f"""
-                                    <div style="background-color: {cor}; padding: 0.3rem; margin: 0.2rem; border-radius: 3px; color: white; font-size: 0.8rem;">
-                                        <strong>{item['medicamento'][:15]}...</strong><br>
-                                        📍 P{item['prateleira'] or '?'}-{item['posicao'] or '?'}<br>
-                                        📦 {item['quantidade_atual']} unidades
-                                    </div>
-                                    """, unsafe_allow_html=True)
-                else:
-                    # Layout simples para local sem setores
-                    for _, item in local_data.iterrows():
-                        col1, col2, col3, col4 = st.columns(4)
-                        
-                        with col1:
-                            st.write(f"**💊 {item['medicamento'][:20]}...**")
-                        with col2:
-                            st.write(f"📍 P{item['prateleira'] or '?'}-{item['posicao'] or '?'}")
-                        with col3:
-                            st.write(f"📦 {item['quantidade_atual']} un.")
-                        with col4:
-                            if item['status'] == 'Vazio':
-                                st.write("🔴 Vazio")
-                            elif item['status'] == 'Baixo':
-                                st.write("🟡 Baixo")
-                            elif item['status'] == 'Vencendo':
-                                st.write("⚠️ Vencendo")
-                            else:
-                                st.write("🟢 OK")
-                
-                st.markdown("---")
+            with col1:
+                st.metric("📍 Posições", len(df_mapa))
+            with col2:
+                st.metric("📦 Lotes", int(df_mapa['lotes'].sum()))
+            with col3:
+                st.metric("🔴 Posições com lote vazio", int((df_mapa['status'] == 'Vazio').sum()))
+            with col4:
+                st.metric("⚠️ Posições que pedem atenção", int((df_mapa['status'] != 'Normal').sum()))
+            
+            # Um único mapa: área = lotes, cor = fração de lotes vazios, baixos ou vencendo;
+            # clicar em um bloco aprofunda no local, setor e prateleira
+            fig = px.treemap(
+                df_mapa,
+                path=[px.Constant("Estoque"), 'rotulo_local', 'rotulo_setor', 'rotulo_prateleira', 'rotulo_posicao'],
+                values='lotes',
+                color='atencao',
+                color_continuous_scale="RdYlGn_r",
+                range_color=(0, 1),
+                hover_data={'quantidade': True, 'status': True},
+                labels={'atencao': "Atenção", 'lotes': "Lotes", 'quantidade': "Unidades", 'status': "Status"}
+            )
+            fig.update_layout(margin=dict(t=30, l=0, r=0, b=0), height=600)
+            st.plotly_chart(fig, use_container_width=True)
+            
+            show_stock_map_detail(df_mapa)
         else:
             st.info("Nenhum medicamento com localização definida.")
 
+@st.fragment
+def show_stock_map_detail(df_mapa):
+    """Posições do mapa com os lotes só da posição selecionada; trocar de posição roda só este trecho"""
+    st.markdown("#### 📍 Posições")
+    
+    posicoes = df_mapa.sort_values(['atencao', 'lotes'], ascending=False, ignore_index=True)
+    icones = {'Vazio': "🔴 Vazio", 'Baixo': "🟡 Baixo", 'Vencendo': "⚠️ Vencendo", 'Normal': "🟢 OK"}
+    tabela = pd.DataFrame({
+        'Local': posicoes['rotulo_local'],
+        'Setor': posicoes['rotulo_setor'],
+        'Prateleira': posicoes['rotulo_prateleira'],
+        'Posição': posicoes['rotulo_posicao'],
+        'Lotes': posicoes['lotes'],
+        'Unidades': posicoes['quantidade'],
+        'Status': posicoes['status'].map(icones)
+    })
+    
+    selecao = st.dataframe(
+        tabela,
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key="mapa_posicoes"
+    )
+    
+    # Lotes apenas da posição selecionada
+    if selecao.selection.rows:
+        posicao = posicoes.iloc[selecao.selection.rows[0]]
+        conn = st.session_state.db_manager.get_connection()
+        df_lotes = load_location_lots(conn, posicao['local_armazenamento'], posicao['setor'],
+                                      posicao['prateleira'], posicao['posicao'])
+        conn.close()
+        
+        st.markdown(f"**🏢 {posicao['rotulo_local']} · Setor {posicao['rotulo_setor']} · "
+                    f"{posicao['rotulo_prateleira']}-{posicao['rotulo_posicao']}**")
+        df_lotes['status'] = df_lotes['status'].map(icones)
+        st.dataframe(df_lotes, use_container_width=True, hide_index=True)
+    else:
+        st.caption("Selecione uma posição para ver os seus lotes.")
+
+@st.fragment
+def show_scenario_simulator(cenarios, medicamento_id, prazo_entrega):
+    """Simulador de cenários: mover o controle roda só este trecho, sobre curvas já calculadas"""
+    curvas = cenarios.loc[medicamento_id]
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        multiplicador = st.select_slider("Consumo Diário Simulado",
+                                         options=curvas.index.tolist(),
+                                         value=1.0,
+                                         format_func=lambda m: f"{m:.2f}× o previsto",
+                                         key=f"sim_{medicamento_id}")
+    
+    cenario = curvas.loc[multiplicador]
+    with col2:
+        st.write(f"**Novo Cenário:**")
+        st.write(f"Consumo de {cenario['consumo_diario']:.1f} unidades/dia")
+        st.write(f"Durará {int(cenario['dias_restantes'])} dias")
+        st.write(f"Até {cenario['data_ruptura'].strftime('%d/%m/%Y')}")
+        if cenario['dias_ate_pedido'] < 0:
+            st.write(f"⚠️ Com entrega em {prazo_entrega:.0f} dias, o pedido já está atrasado")
+        else:
+            st.write(f"Pedir até {cenario['data_pedido'].strftime('%d/%m/%Y')} (entrega em {prazo_entrega:.0f} dias)")
+    
+    fig = px.line(curvas.reset_index(), x='multiplicador', y='dias_restantes', title="Dias até acabar por cenário de consumo")
+    fig.add_hline(y=prazo_entrega, line_dash="dash", annotation_text=f"Prazo de entrega: {prazo_entrega:.0f} dias")
+    fig.add_vline(x=multiplicador, line_dash="dot")
+    st.plotly_chart(fig, use_container_width=True)
+
+
 def show_analise_preditiva():
     """Módulo de análise preditiva avançado com IA"""
     st.markdown("## 🔮 Análise Preditiva Inteligente")
     
     conn = st.session_state.db_manager.get_connection()
     
-    # Buscar medicamentos com movimentação
-    query = """
-        SELECT 
-            m.id,
-            m.nome as medicamento,
-            m.principio_ativo,
-            m.categoria,
-            SUM(l.quantidade_atual) as estoque_atual,
-            COUNT(DISTINCT mov.id) as total_movimentacoes,
-            AVG(CASE WHEN mov.tipo_movimento = 'Saída' THEN mov.quantidade ELSE 0 END) as consumo_medio,
-            MAX(mov.data_movimento) as ultima_movimentacao
-        FROM medicamentos m
-        JOIN lotes l ON m.id = l.medicamento_id
-        LEFT JOIN movimentacoes mov ON l.id = mov.lote_id
-        WHERE m.ativo = 1 AND l.ativo = 1 AND l.quantidade_atual > 0
-        GROUP BY m.id, m.nome, m.principio_ativo, m.categoria
-        HAVING total_movimentacoes > 0
-        ORDER BY consumo_medio DESC
-    """
+    # Só os medicamentos movimentados desde a última atualização são recalculados
+    if has_new_movements(conn):
+        with st.session_state.db_manager.write_connection() as escrita:
+            refresh_forecasts(escrita)
     
-    df_medicamentos_pred = pd.read_sql(query, conn)
+    # Base com as previsões gravadas e consumo diário de todos os medicamentos
+    df_medicamentos_pred, df_previsoes, df_consumo = load_forecasts(conn)
+    df_entregas = load_deliveries(conn)
+    conn.close()
     
     if df_medicamentos_pred.empty:
         st.markdown("""
@@ -1506,7 +1368,6 @@ def show_analise_preditiva():
         4. **Aguarde alguns dias** para acumular histórico
         5. **Volte aqui** para ver as previsões inteligentes!
         """)
-        conn.close()
         return
     
     # Dashboard de análise preditiva
@@ -1516,6 +1377,7 @@ def show_analise_preditiva():
     total_medicamentos = len(df_medicamentos_pred)
     medicamentos_criticos = len(df_medicamentos_pred[df_medicamentos_pred['estoque_atual'] <= 10])
     medicamentos_sem_movimentacao = len(df_medicamentos_pred[df_medicamentos_pred['total_movimentacoes'] <= 2])
+    previsoes_urgentes = int(df_previsoes['urgencia'].isin(["Crítico", "Atenção"]).sum())
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -1526,9 +1388,35 @@ def show_analise_preditiva():
     with col3:
         st.metric("📊 Baixa Movimentação", medicamentos_sem_movimentacao)
     with col4:
-        previsoes_urgentes = 0  # Calculado abaixo
         st.metric("⚠️ Previsões Urgentes", previsoes_urgentes)
     
+    # Plano de reposição de todo o catálogo em uma passada vetorizada
+    st.markdown("### 🛒 Plano de Reposição")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        nivel_servico = st.slider("Nível de serviço (%)", min_value=80.0, max_value=99.9,
+                                  value=Config.NIVEL_SERVICO * 100, step=0.5, key="reposicao_nivel")
+    with col2:
+        dias_cobertura = st.number_input("Dias de cobertura do pedido", min_value=1,
+                                         value=Config.ESTOQUE_SUGERIDO_DIAS, key="reposicao_dias")
+    
+    plano = plan_replenishment(df_previsoes, df_entregas, nivel_servico / 100, int(dias_cobertura))
+    itens_compra, totais_fornecedor = purchase_list(plano)
+    st.caption(f"Prazo de entrega: o configurado por fornecedor (PRAZO_ENTREGA_FORNECEDOR) ou "
+               f"{Config.PRAZO_ENTREGA_PADRAO} dias (padrão). Os lotes não registram a data do pedido, então o "
+               f"histórico de entregas só estima a variação do prazo, pela regularidade dos intervalos.")
+    
+    if itens_compra.empty:
+        st.success("✅ Nenhum medicamento abaixo do ponto de pedido.")
+    else:
+        st.dataframe(totais_fornecedor, use_container_width=True)
+        with st.expander(f"📋 Lista de compras ({len(itens_compra)} itens)"):
+            st.dataframe(itens_compra, use_container_width=True, hide_index=True)
+        st.download_button("📥 Baixar lista de compras por fornecedor (CSV)",
+                           itens_compra.to_csv(index=False).encode("utf-8"),
+                           file_name=f"lista_compras_{date.today()}.csv", mime="text/csv")
+    
     # Análise individual por medicamento
     st.markdown("### 🔍 Análise Detalhada por Medicamento")
     
@@ -1543,88 +1431,11 @@ def show_analise_preditiva():
         urgencia_filter = st.selectbox("⚠️ Filtrar por Urgência", 
             ["Todas", "Crítico (< 7 dias)", "Atenção (< 15 dias)", "Normal (> 30 dias)"])
     
-    # Processar cada medicamento
-    medicamentos_processados = []
-    
-    for _, med in df_medicamentos_pred.iterrows():
-        # Calcular consumo médio dos últimos 30 dias
-        query_consumo = """
-            SELECT 
-                DATE(mov.data_movimento) as data,
-                SUM(CASE WHEN mov.tipo_movimento = 'Saída' THEN mov.quantidade ELSE 0 END) as consumo_diario
-            FROM movimentacoes mov
-            JOIN lotes l ON mov.lote_id = l.id
-            WHERE l.medicamento_id = ? 
-            AND mov.data_movimento >= DATE('now', '-30 days')
-            AND mov.tipo_movimento = 'Saída'
-            GROUP BY DATE(mov.data_movimento)
-            ORDER BY data DESC
-        """
-        
-        df_consumo = pd.read_sql(query_consumo, conn, params=[med['id']])
-        
-        if not df_consumo.empty:
-            consumo_medio_diario = df_consumo['consumo_diario'].mean()
-            consumo_total_30dias = df_consumo['consumo_diario'].sum()
-            
-            # Previsões inteligentes
-            if consumo_medio_diario > 0:
-                dias_para_acabar = med['estoque_atual'] / consumo_medio_diario
-                data_previsao_fim = datetime.now() + timedelta(days=int(dias_para_acabar))
-                
-                # Classificar urgência
-                if dias_para_acabar < 7:
-                    urgencia = "Crítico"
-                    urgencia_cor = "🔴"
-                elif dias_para_acabar < 15:
-                    urgencia = "Atenção"
-                    urgencia_cor = "🟡"
-                elif dias_para_acabar < 30:
-                    urgencia = "Baixo"
-                    urgencia_cor = "🟠"
-                else:
-                    urgencia = "Normal"
-                    urgencia_cor = "🟢"
-                
-                # Sugestões inteligentes de IA
-                sugestoes = []
-                if dias_para_acabar < 15:
-                    quantidade_sugerida = consumo_medio_diario * 60  # 60 dias
-                    sugestoes.append(f"Repor {quantidade_sugerida:.0f} unidades para 60 dias")
-                
-                if consumo_medio_diario > med['estoque_atual'] / 30:
-                    sugestoes.append("Consumo acelerado detectado - monitorar de perto")
-                
-                if len(df_consumo) < 5:
-                    sugestoes.append("Poucos dados históricos - previsão pode ser imprecisa")
-                
-                # Análise de tendência
-                if len(df_consumo) >= 7:
-                    consumo_recente = df_consumo.head(7)['consumo_diario'].mean()
-                    consumo_anterior = df_consumo.tail(7)['consumo_diario'].mean()
-                    
-                    if consumo_recente > consumo_anterior * 1.2:
-                        sugestoes.append("Tendência de aumento no consumo")
-                    elif consumo_recente < consumo_anterior * 0.8:
-                        sugestoes.append("Tendência de redução no consumo")
-                
-                medicamentos_processados.append({
-                    'medicamento': med,
-                    'consumo_medio_diario': consumo_medio_diario,
-                    'dias_para_acabar': dias_para_acabar,
-                    'data_previsao_fim': data_previsao_fim,
-                    'urgencia': urgencia,
-                    'urgencia_cor': urgencia_cor,
-                    'sugestoes': sugestoes,
-                    'df_consumo': df_consumo
-                })
-    
     # Aplicar filtros
-    medicamentos_filtrados = medicamentos_processados.copy()
+    medicamentos_filtrados = df_previsoes
     
     if categoria_filter != "Todas":
-        medicamentos_filtrados = [m for m in medicamentos_filtrados 
-                                if m['medicamento']['categoria'] == categoria_filter]
+        medicamentos_filtrados = medicamentos_filtrados[medicamentos_filtrados['categoria'] == categoria_filter]
     
     if urgencia_filter != "Todas":
         urgencia_map = {
@@ -1633,20 +1444,18 @@ def show_analise_preditiva():
             "Normal (> 30 dias)": "Normal"
         }
         urgencia_target = urgencia_map[urgencia_filter]
-        medicamentos_filtrados = [m for m in medicamentos_filtrados 
-                                if m['urgencia'] == urgencia_target]
-    
-    # Contar previsões urgentes
-    previsoes_urgentes = len([m for m in medicamentos_processados if m['urgencia'] in ["Crítico", "Atenção"]])
+        medicamentos_filtrados = medicamentos_filtrados[medicamentos_filtrados['urgencia'] == urgencia_target]
     
-    # Exibir medicamentos processados
-    if medicamentos_filtrados:
-        for item in sorted(medicamentos_filtrados, key=lambda x: x['dias_para_acabar']):
-            med = item['medicamento']
-            
+    # Exibir medicamentos processados (o frame já vem ordenado por dias até acabar)
+    if not medicamentos_filtrados.empty:
+        consumo_por_medicamento = dict(tuple(df_consumo.groupby('medicamento_id')))
+        cenarios = scenario_curves(plano)
+        prazos_entrega = plano.set_index('id')['prazo_entrega']
+        
+        for _, item in medicamentos_filtrados.iterrows():
             st.markdown(f"""
             <div class="medicamento-card">
-                <h4>{item['urgencia_cor']} {med['nome']} - {item['urgencia'].upper()}</h4>
+                <h4>{item['urgencia_cor']} {item['medicamento']} - {item['urgencia'].upper()}</h4>
                 <p><strong>Previsão:</strong> Acabará em {int(item['dias_para_acabar'])} dias ({item['data_previsao_fim'].strftime('%d/%m/%Y')})</p>
             </div>
             """, unsafe_allow_html=True)
@@ -1656,24 +1465,25 @@ def show_analise_preditiva():
                 
                 with col1:
                     st.markdown("**📊 Métricas Atuais**")
-                    st.write(f"**Estoque Atual:** {med['estoque_atual']} unidades")
-                    st.write(f"**Consumo Médio:** {item['consumo_medio_diario']:.1f} unidades/dia")
+                    st.write(f"**Estoque Atual:** {item['estoque_atual']} unidades")
+                    st.write(f"**Consumo Previsto:** {item['consumo_medio_diario']:.1f} unidades/dia ({item['modelo']})")
                     st.write(f"**Dias Restantes:** {int(item['dias_para_acabar'])} dias")
-                    st.write(f"**Categoria:** {med['categoria'] or 'N/A'}")
+                    st.write(f"**Categoria:** {item['categoria'] or 'N/A'}")
                 
                 with col2:
                     st.markdown("**🎯 Previsão Inteligente**")
                     st.write(f"**Data Prevista:** {item['data_previsao_fim'].strftime('%d/%m/%Y')}")
                     st.write(f"**Urgência:** {item['urgencia']}")
-                    st.write(f"**Total Movimentações:** {med['total_movimentacoes']}")
-                    if med['ultima_movimentacao']:
-                        ultima = datetime.strptime(med['ultima_movimentacao'], '%Y-%m-%d %H:%M:%S')
+                    st.write(f"**Total Movimentações:** {item['total_movimentacoes']}")
+                    if item['ultima_movimentacao']:
+                        ultima = datetime.strptime(item['ultima_movimentacao'], '%Y-%m-%d %H:%M:%S')
                         st.write(f"**Última Movimentação:** {ultima.strftime('%d/%m/%Y')}")
                 
                 with col3:
                     st.markdown("**🤖 Sugestões da IA**")
-                    if item['sugestoes']:
-                        for sugestao in item['sugestoes']:
+                    sugestoes = suggestions(item)
+                    if sugestoes:
+                        for sugestao in sugestoes:
                             st.write(f"• {sugestao}")
                     else:
                         st.write("• Estoque adequado")
@@ -1696,54 +1506,35 @@ def show_analise_preditiva():
                     """, unsafe_allow_html=True)
                 
                 # Gráfico de consumo
-                if len(item['df_consumo']) > 1:
+                df_consumo_med = consumo_por_medicamento.get(item['id'])
+                if df_consumo_med is not None and len(df_consumo_med) > 1:
                     st.markdown("**📈 Tendência de Consumo (30 dias)**")
                     
-                    fig = px.line(item['df_consumo'], x='data', y='consumo_diario', 
+                    fig = px.line(df_consumo_med.sort_values('data'), x='data', y='consumo_diario', 
                                  title="Consumo Diário", markers=True)
                     fig.add_hline(y=item['consumo_medio_diario'], line_dash="dash", 
-                                 annotation_text=f"Média: {item['consumo_medio_diario']:.1f}")
+                                 annotation_text=f"Previsão: {item['consumo_medio_diario']:.1f}")
                     st.plotly_chart(fig, use_container_width=True)
                 
-                # Simulador de cenários
+                # Simulador de cenários: curvas calculadas aqui, o controle só escolhe um ponto
                 st.markdown("**🎲 Simulador de Cenários**")
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    novo_consumo = st.slider("Consumo Diário Simulado", 
-                                           min_value=0.0, 
-                                           max_value=item['consumo_medio_diario'] * 3,
-                                           value=item['consumo_medio_diario'],
-                                           step=0.1,
-                                           key=f"sim_{med['id']}")
-                
-                with col2:
-                    if novo_consumo > 0:
-                        novos_dias = med['estoque_atual'] / novo_consumo
-                        nova_data = datetime.now() + timedelta(days=int(novos_dias))
-                        st.write(f"**Novo Cenário:**")
-                        st.write(f"Durará {int(novos_dias)} dias")
-                        st.write(f"Até {nova_data.strftime('%d/%m/%Y')}")
+                show_scenario_simulator(cenarios, item['id'], prazos_entrega[item['id']])
     else:
         st.info("Nenhum medicamento encontrado com os filtros aplicados.")
-    
-    conn.close()
+
 
 def create_smart_alert(tipo_alerta, prioridade, titulo, mensagem, paciente_id=None, medicamento_id=None, usuario_destinatario=None):
     """Criar alerta inteligente"""
     try:
-        conn = st.session_state.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO alertas_inteligentes (
-                tipo_alerta, prioridade, titulo, mensagem, paciente_id, 
-                medicamento_id, usuario_destinatario
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (tipo_alerta, prioridade, titulo, mensagem, paciente_id, medicamento_id, usuario_destinatario))
+        with st.session_state.db_manager.write_connection() as conn:
+            cursor = conn.cursor()
         
-        conn.commit()
-        conn.close()
+            cursor.execute("""
+                INSERT INTO alertas_inteligentes (
+                    tipo_alerta, prioridade, titulo, mensagem, paciente_id, 
+                    medicamento_id, usuario_destinatario
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (tipo_alerta, prioridade, titulo, mensagem, paciente_id, medicamento_id, usuario_destinatario))
     except Exception as e:
         print(f"Erro ao criar alerta: {e}")
 
@@ -1772,62 +1563,10 @@ def show_pacientes():
             plano_filter = st.selectbox("🏥 Plano de Saúde", ["Todos"] + planos)
         
         with col3:
-            idade_filter = st.selectbox("👶 Faixa Etária", ["Todas", "Criança (0-12)", "Adolescente (13-17)", "Adulto (18-64)", "Idoso (65+)"])
+            idade_filter = st.selectbox("👶 Faixa Etária", ["Todas"] + list(FAIXAS_ETARIAS))
         
-        # Buscar pacientes com estatísticas
-        query = """
-            SELECT 
-                p.*,
-                u.nome_completo as cadastrado_por_nome,
-                COUNT(DISTINCT c.id) as total_consultas,
-                COUNT(DISTINCT r.id) as total_receitas,
-                COUNT(DISTINCT pr.id) as total_prontuario,
-                MAX(c.data_consulta) as ultima_consulta
-            FROM pacientes p
-            LEFT JOIN usuarios u ON p.cadastrado_por = u.id
-            LEFT JOIN consultas c ON p.id = c.paciente_id
-            LEFT JOIN receitas r ON p.id = r.paciente_id
-            LEFT JOIN prontuario pr ON p.id = pr.paciente_id
-            WHERE p.ativo = 1
-        """
-        params = []
-        
-        if search_term:
-            query += " AND (p.nome_completo LIKE ? OR p.cpf LIKE ?)"
-            params.extend([f"%{search_term}%", f"%{search_term}%"])
-        
-        if plano_filter != "Todos":
-            query += " AND p.plano_saude = ?"
-            params.append(plano_filter)
-        
-        query += " GROUP BY p.id ORDER BY p.nome_completo"
-        
-        df_pacientes = pd.read_sql(query, conn, params=params)
-        
-        # Aplicar filtro de idade
-        if idade_filter != "Todas" and not df_pacientes.empty:
-            hoje = datetime.now().date()
-            df_pacientes_filtrados = []
-            
-            for _, pac in df_pacientes.iterrows():
-                if pac['data_nascimento']:
-                    nascimento = datetime.strptime(pac['data_nascimento'], '%Y-%m-%d').date()
-                    idade = (hoje - nascimento).days // 365
-                    
-                    incluir = False
-                    if idade_filter == "Criança (0-12)" and idade <= 12:
-                        incluir = True
-                    elif idade_filter == "Adolescente (13-17)" and 13 <= idade <= 17:
-                        incluir = True
-                    elif idade_filter == "Adulto (18-64)" and 18 <= idade <= 64:
-                        incluir = True
-                    elif idade_filter == "Idoso (65+)" and idade >= 65:
-                        incluir = True
-                    
-                    if incluir:
-                        df_pacientes_filtrados.append(pac)
-            
-            df_pacientes = pd.DataFrame(df_pacientes_filtrados)
+        # Buscar pacientes com estatísticas (faixa etária filtrada no SQL)
+        df_pacientes = load_patients(conn, search_term, plano_filter, idade_filter)
         
         conn.close()
         
@@ -1847,11 +1586,7 @@ def show_pacientes():
             
             # Lista inteligente de pacientes
             for _, pac in df_pacientes.iterrows():
-                # Calcular idade
-                idade = "N/A"
-                if pac['data_nascimento']:
-                    nascimento = datetime.strptime(pac['data_nascimento'], '%Y-%m-%d').date()
-                    idade = (datetime.now().date() - nascimento).days // 365
+                idade = pac['idade'] if pd.notna(pac['idade']) else "N/A"
                 
                 # Status do paciente
                 if pac['total_consultas'] == 0:
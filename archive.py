@@ -0,0 +1,197 @@
+"""
+🏥 MedStock360 - Arquivo de Movimentações
+Movimentações antigas em Parquet particionado por mês e consultas que unem banco e arquivo
+Versão: 3.0 Advanced
+"""
+
+import glob
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import Config, get_archive_path
+from search import fts_query
+from stock import run_immediate
+
+# Movimentação com o medicamento do lote: o arquivo não depende de lotes existentes
+QUERY_MOVIMENTACOES_ARQUIVO = """
+    SELECT
+        mov.id,
+        mov.lote_id,
+        l.medicamento_id,
+        mov.tipo_movimento,
+        mov.quantidade,
+        mov.motivo,
+        mov.observacoes,
+        mov.responsavel,
+        mov.data_movimento
+    FROM movimentacoes mov
+    LEFT JOIN lotes l ON mov.lote_id = l.id
+    WHERE mov.data_movimento >= ? AND mov.data_movimento < ?
+"""
+
+# Esquema fixo de todas as partições: um mês com uma coluna toda NULL não pode gravá-la
+# como tipo null, senão a leitura conjunta com meses preenchidos falha
+ESQUEMA = pa.schema([
+    ("id", pa.int64()),
+    ("lote_id", pa.int64()),
+    ("medicamento_id", pa.int64()),
+    ("tipo_movimento", pa.string()),
+    ("quantidade", pa.int64()),
+    ("motivo", pa.string()),
+    ("observacoes", pa.string()),
+    ("responsavel", pa.int64()),
+    ("data_movimento", pa.string()),
+])
+
+COLUNAS = ESQUEMA.names
+
+def hot_start(conn):
+    """Data/hora da movimentação mais antiga ainda no banco (None se vazio)"""
+    return conn.execute("SELECT MIN(data_movimento) FROM movimentacoes").fetchone()[0]
+
+def _month_start(dia):
+    return dia.replace(day=1)
+
+def _next_month(dia):
+    return (dia.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def _partition_dir(pasta, mes):
+    return os.path.join(pasta, f"mes={mes:%Y-%m}")
+
+# ==========================================
+# ARQUIVAMENTO
+# ==========================================
+
+def _archive_month(conn, pasta, inicio, fim):
+    """Gravar as movimentações de [inicio, fim) em Parquet e removê-las do banco"""
+    df = pd.read_sql(QUERY_MOVIMENTACOES_ARQUIVO + " ORDER BY mov.id", conn,
+                     params=[inicio.isoformat(), fim.isoformat()])
+    if df.empty:
+        return 0
+
+    # Nome determinístico: repetir um arquivamento interrompido sobrescreve o arquivo
+    particao = _partition_dir(pasta, inicio)
+    os.makedirs(particao, exist_ok=True)
+    arquivo = os.path.join(particao, f"parte-{df['id'].iloc[0]:012d}-{df['id'].iloc[-1]:012d}.parquet")
+    temporario = arquivo + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df[COLUNAS], schema=ESQUEMA, preserve_index=False),
+                   temporario, compression="zstd")
+    with open(temporario, "rb") as gravado:
+        os.fsync(gravado.fileno())
+    os.replace(temporario, arquivo)
+
+    # Só então as linhas saem do banco; os saldos dos lotes não são tocados
+    conn.execute("DELETE FROM movimentacoes WHERE data_movimento >= ? AND data_movimento < ?",
+                 (inicio.isoformat(), fim.isoformat()))
+    return len(df)
+
+def archive_movements(conn, horizonte=None, hoje=None, pasta=None):
+    """Mover para o arquivo frio, mês a mês, as movimentações anteriores ao horizonte"""
+    horizonte = horizonte or Config.ARCHIVE_HORIZON_DAYS
+    if horizonte <= Config.PERIODO_ANALISE_CONSUMO:
+        raise ValueError("O horizonte de arquivamento deve cobrir o período de análise de consumo")
+    hoje = hoje or datetime.now(timezone.utc).date()
+    pasta = pasta or get_archive_path()
+    corte = hoje - timedelta(days=horizonte)
+
+    inicio = time.perf_counter()
+    mais_antiga = hot_start(conn)
+    meses = []
+    if mais_antiga and mais_antiga < corte.isoformat():
+        mes = _month_start(date.fromisoformat(mais_antiga[:10]))
+        while mes < corte:
+            meses.append((mes, min(_next_month(mes), corte)))
+            mes = _next_month(mes)
+
+    # Um mês por transação: leitura, arquivo e exclusão veem as mesmas linhas
+    arquivadas = 0
+    for mes_inicio, mes_fim in meses:
+        arquivadas += run_immediate(conn, lambda c: _archive_month(c, pasta, mes_inicio, mes_fim))
+
+    return {'arquivadas': arquivadas, 'meses': len(meses), 'corte': corte.isoformat(),
+            'segundos': time.perf_counter() - inicio}
+
+def compact_database(conn):
+    """Devolver ao sistema de arquivos as páginas liberadas pelo arquivamento"""
+    conn.execute("VACUUM")
+
+# ==========================================
+# CONSULTA QUENTE + FRIA
+# ==========================================
+
+def _cold_files(pasta, inicio, fim):
+    """Arquivos das partições mensais que cruzam [inicio, fim)"""
+    arquivos = []
+    mes = _month_start(inicio)
+    while mes < fim:
+        arquivos.extend(sorted(glob.glob(os.path.join(_partition_dir(pasta, mes), "*.parquet"))))
+        mes = _next_month(mes)
+    return arquivos
+
+def load_movements(conn, inicio, fim, tipo=None, medicamento_id=None, busca_medicamento="", pasta=None):
+    """Movimentações de [inicio, fim), do banco e, se o período for antigo, do arquivo frio"""
+    clausulas, params = "", [inicio.isoformat(), fim.isoformat()]
+    filtros = [("data_movimento", ">=", inicio.isoformat()), ("data_movimento", "<", fim.isoformat())]
+    if tipo:
+        clausulas += " AND mov.tipo_movimento = ?"
+        params.append(tipo)
+        filtros.append(("tipo_movimento", "==", tipo))
+    if medicamento_id is not None:
+        clausulas += " AND l.medicamento_id = ?"
+        params.append(medicamento_id)
+        filtros.append(("medicamento_id", "==", medicamento_id))
+
+    # Busca por nome, como na lista do histórico; o arquivo frio recebe os ids encontrados
+    busca = fts_query(busca_medicamento)
+    if busca:
+        encontrados = [row[0] for row in conn.execute(
+            "SELECT rowid FROM medicamentos_fts WHERE medicamentos_fts MATCH ?", (busca,))]
+        clausulas += f" AND l.medicamento_id IN ({','.join('?' * len(encontrados)) or 'NULL'})"
+        params.extend(encontrados)
+        filtros.append(("medicamento_id", "in", encontrados))
+
+    quentes = pd.read_sql(QUERY_MOVIMENTACOES_ARQUIVO + clausulas, conn, params=params)
+
+    # O arquivo só é lido quando o período começa antes da movimentação mais antiga do banco
+    mais_antiga = hot_start(conn)
+    if mais_antiga is not None and inicio.isoformat() >= mais_antiga:
+        return quentes.sort_values("data_movimento", ignore_index=True)
+
+    arquivos = _cold_files(pasta or get_archive_path(), inicio, fim)
+    if not arquivos:
+        return quentes.sort_values("data_movimento", ignore_index=True)
+    # O esquema explícito também lê partições antigas gravadas com colunas do tipo null
+    frias = pq.ParquetDataset(arquivos, schema=ESQUEMA, filters=filtros).read(columns=COLUNAS).to_pandas()
+
+    # Um arquivamento interrompido pode deixar a mesma linha nos dois lados
+    todas = pd.concat([quentes, frias[~frias["id"].isin(quentes["id"])]], ignore_index=True)
+    return todas.sort_values("data_movimento", ignore_index=True)
+
+# ==========================================
+# LINHA DE COMANDO
+# ==========================================
+
+if __name__ == "__main__":
+    from config import get_database_path
+
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    db_path = argumentos[0] if argumentos else get_database_path()
+    horizonte = int(argumentos[1]) if len(argumentos) > 1 else None
+
+    conn = sqlite3.connect(db_path, timeout=Config.DB_BUSY_TIMEOUT)
+    resultado = archive_movements(conn, horizonte)
+    print(f"✅ {resultado['arquivadas']:,} movimentações anteriores a {resultado['corte']} arquivadas "
+          f"em {resultado['meses']} partições mensais ({resultado['segundos']:.1f} s)")
+
+    if "--compactar" in sys.argv:
+        antes = os.path.getsize(db_path)
+        compact_database(conn)
+        print(f"🗜️ Banco compactado: {antes / 1e6:,.1f} MB → {os.path.getsize(db_path) / 1e6:,.1f} MB")
+    conn.close()
@@ -0,0 +1,169 @@
+"""
+🏥 MedStock360 - Backup Automático
+Cópias online de um instantâneo de leitura, compactadas, verificadas e com retenção, em segundo plano
+Versão: 3.0 Advanced
+"""
+
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import Config, get_backup_path
+
+PREFIXO = "medstock360_"
+FORMATO_DATA = "%Y%m%d_%H%M%S"
+
+class BackupError(Exception):
+    """Cópia que não passou na verificação de integridade"""
+
+def _backup_time(arquivo):
+    """Momento (UTC) da cópia, lido do nome do arquivo"""
+    nome = os.path.basename(arquivo)[len(PREFIXO):].split(".")[0]
+    return datetime.strptime(nome, FORMATO_DATA).replace(tzinfo=timezone.utc)
+
+def list_backups(pasta=None):
+    """Cópias existentes, da mais antiga para a mais recente"""
+    return sorted(glob.glob(os.path.join(pasta or get_backup_path(), f"{PREFIXO}*.db.gz")))
+
+# ==========================================
+# CÓPIA ONLINE
+# ==========================================
+
+def create_backup(db_path, pasta=None, pausa=None):
+    """Copiar o banco de um único instantâneo de leitura, verificar a cópia e compactá-la"""
+    pasta = pasta or get_backup_path()
+    pausa = Config.BACKUP_COMPRESS_PAUSE if pausa is None else pausa
+    os.makedirs(pasta, exist_ok=True)
+
+    inicio = time.perf_counter()
+    destino = os.path.join(pasta, f"{PREFIXO}{datetime.now(timezone.utc):{FORMATO_DATA}}.db")
+
+    origem = sqlite3.connect(db_path, timeout=Config.DB_BUSY_TIMEOUT)
+    copia = sqlite3.connect(destino)
+    try:
+        # Um passo só: a cópia em vários passos recomeça do zero a cada commit de outra
+        # conexão. Em WAL a leitura não bloqueia os escritores durante a cópia
+        origem.backup(copia, pages=-1)
+        resultado = copia.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        copia.close()
+        origem.close()
+
+    if resultado != "ok":
+        os.remove(destino)
+        raise BackupError(f"Cópia de {db_path} falhou na verificação de integridade: {resultado}")
+
+    # Compactação em blocos de 1 MiB com uma pausa entre blocos
+    with open(destino, "rb") as entrada, \
+            gzip.open(destino + ".gz", "wb", compresslevel=Config.BACKUP_COMPRESS_LEVEL) as saida:
+        while bloco := entrada.read(1024 * 1024):
+            saida.write(bloco)
+            time.sleep(pausa)
+    tamanho = os.path.getsize(destino)
+    os.remove(destino)
+
+    return {'arquivo': destino + ".gz", 'bytes': tamanho, 'bytes_compactados': os.path.getsize(destino + ".gz"),
+            'segundos': time.perf_counter() - inicio}
+
+def prune_backups(pasta=None, retencao_dias=None, agora=None):
+    """Remover as cópias mais antigas que a retenção; a mais recente é sempre mantida"""
+    retencao_dias = retencao_dias or Config.BACKUP_RETENTION_DAYS
+    agora = agora or datetime.now(timezone.utc)
+    limite = agora - timedelta(days=retencao_dias)
+
+    removidas = []
+    for arquivo in list_backups(pasta)[:-1]:
+        if _backup_time(arquivo) < limite:
+            os.remove(arquivo)
+            removidas.append(arquivo)
+    return removidas
+
+def restore_backup(arquivo, db_path):
+    """Descompactar uma cópia em db_path (que não pode estar em uso)"""
+    # WAL e índice de memória de antes da restauração seriam reaplicados sobre a cópia
+    for sufixo in ("-wal", "-shm"):
+        if os.path.exists(db_path + sufixo):
+            os.remove(db_path + sufixo)
+    with gzip.open(arquivo, "rb") as entrada, open(db_path, "wb") as saida:
+        shutil.copyfileobj(entrada, saida, length=1024 * 1024)
+
+# ==========================================
+# AGENDAMENTO EM SEGUNDO PLANO
+# ==========================================
+
+class BackupScheduler:
+    """Thread que faz uma cópia a cada AUTO_BACKUP_INTERVAL horas e aplica a retenção"""
+
+    def __init__(self, db_path, pasta=None, intervalo_horas=None):
+        self.db_path = db_path
+        self.pasta = pasta or get_backup_path()
+        self.intervalo = (intervalo_horas or Config.AUTO_BACKUP_INTERVAL) * 3600
+        self._parar = threading.Event()
+        self._thread = None
+        self._stats = {'copias': 0, 'falhas': 0, 'ultima': None, 'ultimo_erro': None}
+
+    def _next_wait(self):
+        """Segundos até a próxima cópia, a partir da mais recente existente"""
+        copias = list_backups(self.pasta)
+        if not copias:
+            return 0
+        decorrido = (datetime.now(timezone.utc) - _backup_time(copias[-1])).total_seconds()
+        return max(0, self.intervalo - decorrido)
+
+    def run_once(self):
+        try:
+            resultado = create_backup(self.db_path, self.pasta)
+            prune_backups(self.pasta)
+            self._stats['copias'] += 1
+            self._stats['ultima'] = resultado
+            return resultado
+        except (sqlite3.Error, OSError, BackupError) as erro:
+            self._stats['falhas'] += 1
+            self._stats['ultimo_erro'] = str(erro)
+            return None
+
+    def _loop(self):
+        # Após reiniciar o processo, respeita o intervalo desde a última cópia em disco
+        while not self._parar.wait(self._next_wait()):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name="backup-automatico", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._parar.set()
+
+    def stats(self):
+        estatisticas = dict(self._stats)
+        estatisticas['ativo'] = self._thread is not None and self._thread.is_alive()
+        estatisticas['copias_em_disco'] = len(list_backups(self.pasta))
+        return estatisticas
+
+# ==========================================
+# LINHA DE COMANDO
+# ==========================================
+
+if __name__ == "__main__":
+    from config import get_database_path
+
+    if len(sys.argv) > 2 and sys.argv[1] == "restaurar":
+        destino = sys.argv[3] if len(sys.argv) > 3 else get_database_path()
+        restore_backup(sys.argv[2], destino)
+        print(f"✅ {sys.argv[2]} restaurado em {destino}")
+        sys.exit(0)
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else get_database_path()
+    resultado = create_backup(db_path)
+    removidas = prune_backups()
+    print(f"✅ Backup verificado em {resultado['arquivo']} ({resultado['bytes'] / 1e6:,.1f} MB → "
+          f"{resultado['bytes_compactados'] / 1e6:,.1f} MB, {resultado['segundos']:.1f} s); {len(removidas)} cópias antigas removidas")
@@ -0,0 +1,1079 @@
+"""
+🏥 MedStock360 - Benchmarks
+Medições de desempenho das consultas das páginas em bancos sintéticos
+Versão: 3.0 Advanced
+"""
+
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from archive import archive_movements, hot_start, load_movements
+from backup import create_backup, restore_backup
+from cache import TTLCache
+from config import Config
+from database import ConnectionPool
+from dispensing import dispense_prescription
+from forecasting import (
+    MODELOS, backtest, compute_forecasts, forecast_rates, has_new_movements, load_daily_consumption,
+    load_forecasts, refresh_forecasts
+)
+from receiving import import_lots, read_chunks
+from replenishment import MULTIPLICADORES_CENARIO, load_deliveries, plan_replenishment, purchase_list, scenario_curves
+from scanning import BarcodeIndex, ScanSession
+from migrations import bootstrap_database, create_base_tables, create_default_admin, get_schema_version
+from stock import InsufficientStockError, dispense_lot, verify_stock_summary
+from replication import WalReplicator, restore
+from queries import (
+    QUERY_ALERTA_VENCIMENTO, QUERY_ALERTA_ESTOQUE_BAIXO, QUERY_ALERTA_SEM_ESTOQUE, QUERY_PREVISAO_BASE,
+    FAIXAS_ETARIAS, load_dashboard_snapshot, load_movement_summary, load_movement_page,
+    stock_filters, load_stock_totals, load_stock_page, load_stock_map, load_location_lots, load_patients
+)
+from synthetic import generate_hospital
+
+def _tempo(func, repeticoes=3):
+    """Tempo médio em milissegundos e o resultado da última execução"""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = func()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+def _percentil(tempos, fracao):
+    """Percentil por posição mais próxima de uma lista já ordenada"""
+    return tempos[max(math.ceil(fracao * len(tempos)) - 1, 0)]
+
+# ==========================================
+# LISTA DE PACIENTES: JOIN EM LEQUE x SUBCONSULTAS
+# ==========================================
+
+# Consulta anterior da lista de pacientes, mantida apenas para comparação
+QUERY_PACIENTES_LEQUE = """
+    SELECT
+        p.*,
+        u.nome_completo as cadastrado_por_nome,
+        COUNT(DISTINCT c.id) as total_consultas,
+        COUNT(DISTINCT r.id) as total_receitas,
+        COUNT(DISTINCT pr.id) as total_prontuario,
+        MAX(c.data_consulta) as ultima_consulta
+    FROM pacientes p
+    LEFT JOIN usuarios u ON p.cadastrado_por = u.id
+    LEFT JOIN consultas c ON p.id = c.paciente_id
+    LEFT JOIN receitas r ON p.id = r.paciente_id
+    LEFT JOIN prontuario pr ON p.id = pr.paciente_id
+    WHERE p.ativo = 1
+    GROUP BY p.id ORDER BY p.nome_completo
+"""
+
+def _populate_chronic_care(conn, pacientes, por_paciente, seed=42):
+    """Pacientes crônicos com `por_paciente` consultas e receitas e 4× entradas de prontuário"""
+    rnd = random.Random(seed)
+    conn.executemany(
+        "INSERT INTO pacientes (id, nome_completo, plano_saude) VALUES (?, ?, ?)",
+        ((i, f"Paciente Crônico {i:05d}", rnd.choice(["SUS", "Unimed", "Amil"])) for i in range(1, pacientes + 1))
+    )
+    datas = [f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} 10:00:00" for _ in range(por_paciente * 4)]
+    conn.executemany(
+        "INSERT INTO consultas (paciente_id, medico_id, data_consulta) VALUES (?, 1, ?)",
+        ((p, datas[k]) for p in range(1, pacientes + 1) for k in range(por_paciente))
+    )
+    conn.executemany(
+        "INSERT INTO receitas (paciente_id, medico_id, data_receita) VALUES (?, 1, ?)",
+        ((p, datas[k]) for p in range(1, pacientes + 1) for k in range(por_paciente))
+    )
+    conn.executemany(
+        "INSERT INTO prontuario (paciente_id, data_entrada, tipo_entrada, descricao) VALUES (?, ?, 'Evolução', 'Acompanhamento')",
+        ((p, datas[k]) for p in range(1, pacientes + 1) for k in range(por_paciente * 4))
+    )
+    conn.commit()
+
+def benchmark_patient_list(pacientes=200, escalas="5,10,20"):
+    """Comparar a lista de pacientes em leque com a versão por subconsultas, por volume de filhos"""
+    pacientes = int(pacientes)
+    escalas = [int(e) for e in str(escalas).split(",")]
+    print(f"Lista de pacientes: {pacientes} pacientes crônicos")
+    print(f"{'filhos/pac.':>12}{'linhas filhas':>15}{'leque (ms)':>12}{'subconsultas (ms)':>19}{'µs/linha':>10}")
+
+    resultados = []
+    for por_paciente in escalas:
+        conn = sqlite3.connect(":memory:")
+        create_base_tables(conn)
+        _populate_chronic_care(conn, pacientes, por_paciente)
+        linhas = pacientes * por_paciente * 6
+
+        ms_leque, df_leque = _tempo(lambda: pd.read_sql(QUERY_PACIENTES_LEQUE, conn), repeticoes=1)
+        ms_novo, df_novo = _tempo(lambda: load_patients(conn))
+        conn.close()
+
+        # As duas consultas precisam produzir os mesmos totais
+        colunas = ['id', 'total_consultas', 'total_receitas', 'total_prontuario', 'ultima_consulta']
+        assert df_leque[colunas].equals(df_novo[colunas]), "totais divergentes entre as consultas"
+
+        print(f"{por_paciente:>12}{linhas:>15,}{ms_leque:>12.1f}{ms_novo:>19.1f}{ms_novo * 1000 / linhas:>10.2f}")
+        resultados.append({'por_paciente': por_paciente, 'linhas_filhas': linhas,
+                           'leque_ms': ms_leque, 'subconsultas_ms': ms_novo})
+    return resultados
+
+# ==========================================
+# FILTRO DE FAIXA ETÁRIA: LAÇO EM PYTHON x INTERVALO NO SQL
+# ==========================================
+
+def _filter_age_loop(df_pacientes, faixa):
+    """Filtro anterior: idade calculada linha a linha e DataFrame reconstruído"""
+    minimo, maximo = FAIXAS_ETARIAS[faixa]
+    hoje = datetime.now().date()
+    filtrados = []
+    for _, pac in df_pacientes.iterrows():
+        if pac['data_nascimento']:
+            nascimento = datetime.strptime(pac['data_nascimento'], '%Y-%m-%d').date()
+            idade = (hoje - nascimento).days // 365
+            if idade >= minimo and (maximo is None or idade <= maximo):
+                filtrados.append(pac)
+    return pd.DataFrame(filtrados)
+
+def benchmark_age_filter(pacientes=200_000, seed=42):
+    """Comparar o filtro de faixa etária em Python com o intervalo de datas no SQL"""
+    pacientes, seed = int(pacientes), int(seed)
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    create_base_tables(conn)
+    conn.executemany(
+        "INSERT INTO pacientes (nome_completo, data_nascimento) VALUES (?, ?)",
+        ((f"Paciente {i:06d}", f"{rnd.randint(1925, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}")
+         for i in range(pacientes))
+    )
+    conn.commit()
+
+    print(f"Filtro de faixa etária: {pacientes:,} pacientes")
+    print(f"{'faixa':<22}{'laço (ms)':>12}{'SQL (ms)':>10}{'pacientes':>11}")
+    resultados = []
+    for faixa in FAIXAS_ETARIAS:
+        ms_laco, _ = _tempo(lambda: _filter_age_loop(load_patients(conn), faixa), repeticoes=1)
+        ms_sql, df = _tempo(lambda: load_patients(conn, faixa=faixa))
+        print(f"{faixa:<22}{ms_laco:>12.1f}{ms_sql:>10.1f}{len(df):>11,}")
+        resultados.append({'faixa': faixa, 'laco_ms': ms_laco, 'sql_ms': ms_sql, 'pacientes': len(df)})
+    conn.close()
+    return resultados
+
+# ==========================================
+# DISPENSAÇÃO FEFO
+# ==========================================
+
+def benchmark_dispensing(receitas=50, itens=20, escala=10, seed=42):
+    """Tempo para dispensar receitas de `itens` medicamentos em um hospital sintético"""
+    receitas, itens, escala, seed = int(receitas), int(itens), float(escala), int(seed)
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    generate_hospital(conn, escala)
+    com_estoque = [row[0] for row in conn.execute("""
+        SELECT medicamento_id FROM lotes
+        WHERE ativo = 1 AND data_validade >= DATE('now')
+        GROUP BY medicamento_id HAVING SUM(quantidade_atual) >= 1000
+    """)]
+
+    tempos = []
+    for _ in range(receitas):
+        receita_id = conn.execute(
+            "INSERT INTO receitas (paciente_id, medico_id, data_receita) VALUES (1, 1, DATE('now'))"
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO receita_itens (receita_id, medicamento_id, quantidade) VALUES (?, ?, ?)",
+            [(receita_id, medicamento_id, rnd.randint(1, 30)) for medicamento_id in rnd.sample(com_estoque, itens)]
+        )
+        conn.commit()
+
+        inicio = time.perf_counter()
+        dispense_prescription(conn, receita_id, responsavel=1)
+        conn.commit()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    conn.close()
+
+    tempos.sort()
+    resultado = {'receitas': receitas, 'itens': itens, 'mediana_ms': tempos[len(tempos) // 2], 'max_ms': tempos[-1]}
+    print(f"Dispensação FEFO ({escala:g}×): {receitas} receitas de {itens} itens — "
+          f"mediana {resultado['mediana_ms']:.2f} ms, máximo {resultado['max_ms']:.2f} ms")
+    return resultado
+
+# ==========================================
+# CONCORRÊNCIA: BAIXAS ATÔMICAS
+# ==========================================
+
+def benchmark_contention(escritores=50, unidades=5000):
+    """Escritores simultâneos baixando o mesmo lote até zerar; nenhuma baixa pode se perder"""
+    escritores, unidades = int(escritores), int(unidades)
+    with tempfile.TemporaryDirectory() as pasta:
+        db_path = os.path.join(pasta, "concorrencia.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        create_base_tables(conn)
+        medicamento_id = conn.execute("INSERT INTO medicamentos (nome) VALUES ('Dipirona Sódica 500mg')").lastrowid
+        lote_id = conn.execute("""
+            INSERT INTO lotes (medicamento_id, numero_lote, data_validade, quantidade_inicial, quantidade_atual)
+            VALUES (?, 'DISPUTA', DATE('now', '+1 year'), ?, ?)
+        """, (medicamento_id, unidades, unidades)).lastrowid
+        conn.commit()
+
+        contagem = {'baixas': 0, 'sem_saldo': 0, 'desistencias': 0}
+        trava = threading.Lock()
+        largada = threading.Barrier(escritores)
+
+        def escritor():
+            # Uma conexão por escritor, como sessões ou processos distintos
+            local = sqlite3.connect(db_path, timeout=1.0)
+            largada.wait()
+            baixas = desistencias = 0
+            while True:
+                try:
+                    dispense_lot(local, lote_id, 1, responsavel=1, motivo="Benchmark de concorrência")
+                    baixas += 1
+                except InsufficientStockError:
+                    break
+                except sqlite3.OperationalError:
+                    desistencias += 1
+            local.close()
+            with trava:
+                contagem['baixas'] += baixas
+                contagem['sem_saldo'] += 1
+                contagem['desistencias'] += desistencias
+
+        threads = [threading.Thread(target=escritor) for _ in range(escritores)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+
+        saldo = conn.execute("SELECT quantidade_atual FROM lotes WHERE id = ?", (lote_id,)).fetchone()[0]
+        saidas = conn.execute(
+            "SELECT COALESCE(SUM(quantidade), 0) FROM movimentacoes WHERE lote_id = ? AND tipo_movimento = 'Saída'",
+            (lote_id,)
+        ).fetchone()[0]
+        divergentes = verify_stock_summary(conn)
+        conn.close()
+
+    perdidas = unidades - saldo - contagem['baixas']
+    print(f"Concorrência: {escritores} escritores, lote com {unidades:,} unidades")
+    print(f"   {contagem['baixas']:,} baixas em {duracao:.2f} s ({contagem['baixas'] / duracao:,.0f} baixas/s)")
+    print(f"   saldo final {saldo}, saídas registradas {saidas:,}, desistências por banco ocupado {contagem['desistencias']}")
+    print(f"   baixas perdidas: {perdidas}, resumo divergente: {len(divergentes)}")
+    assert saldo == 0 and perdidas == 0 and saidas == contagem['baixas'] and not divergentes
+    return {'escritores': escritores, 'baixas': contagem['baixas'], 'baixas_por_s': contagem['baixas'] / duracao,
+            'perdidas': perdidas, 'desistencias': contagem['desistencias']}
+
+# ==========================================
+# PARTIDA DE SESSÕES (PICO DE LOGINS)
+# ==========================================
+
+def _session_storm(pool, sessoes, preparar):
+    """Tempo (ms) até a primeira consulta de cada sessão, com todas iniciando juntas"""
+    tempos = []
+    trava = threading.Lock()
+    largada = threading.Barrier(sessoes)
+
+    def sessao():
+        largada.wait()
+        inicio = time.perf_counter()
+        preparar()
+        conn = pool.connection()
+        conn.execute("SELECT id, password_hash FROM usuarios WHERE username = 'admin' AND ativo = 1").fetchone()
+        conn.close()
+        with trava:
+            tempos.append((time.perf_counter() - inicio) * 1000)
+
+    threads = [threading.Thread(target=sessao) for _ in range(sessoes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(tempos)
+
+def benchmark_cold_start(sessoes=50):
+    """Primeira resposta de novas sessões: DDL a cada sessão x bootstrap único do processo"""
+    sessoes = int(sessoes)
+    with tempfile.TemporaryDirectory() as pasta:
+        db_path = os.path.join(pasta, "partida.db")
+        pool = ConnectionPool(db_path)
+
+        inicio = time.perf_counter()
+        with pool.writer() as conn:
+            versao = bootstrap_database(conn)
+        bootstrap_ms = (time.perf_counter() - inicio) * 1000
+
+        def ddl_por_sessao():
+            # Comportamento anterior do DatabaseManager.__init__
+            with pool.writer() as conn:
+                create_base_tables(conn)
+                create_default_admin(conn)
+
+        resultados = {}
+        for nome, preparar in (("antes", ddl_por_sessao), ("depois", lambda: None)):
+            tempos = _session_storm(pool, sessoes, preparar)
+            resultados[nome] = {'mediana_ms': tempos[len(tempos) // 2],
+                                'p95_ms': _percentil(tempos, 0.95), 'max_ms': tempos[-1]}
+
+    print(f"Partida de {sessoes} sessões simultâneas (schema v{versao}, bootstrap único em {bootstrap_ms:.1f} ms)")
+    print(f"{'':<8}{'mediana (ms)':>14}{'p95 (ms)':>12}{'máx (ms)':>12}")
+    for nome, medida in resultados.items():
+        print(f"{nome:<8}{medida['mediana_ms']:>14.2f}{medida['p95_ms']:>12.2f}{medida['max_ms']:>12.2f}")
+    return resultados
+
+# ==========================================
+# RECEBIMENTO EM LOTE
+# ==========================================
+
+def benchmark_import(linhas=100_000, seed=42):
+    """Importar um CSV de `linhas` lotes (metade por código de barras, metade por nome)"""
+    linhas = int(linhas)
+    rnd = random.Random(seed)
+    with tempfile.TemporaryDirectory() as pasta:
+        conn = sqlite3.connect(os.path.join(pasta, "recebimento.db"))
+        conn.execute("PRAGMA journal_mode = WAL")
+        generate_hospital(conn)
+        medicamentos = conn.execute("SELECT nome, codigo_barras FROM medicamentos").fetchall()
+
+        arquivo = os.path.join(pasta, "entrega.csv")
+        with open(arquivo, "w", encoding="utf-8") as csv:
+            csv.write("codigo_barras;medicamento;numero_lote;data_validade;quantidade;preco_unitario;fornecedor\n")
+            for i in range(linhas):
+                nome, codigo = rnd.choice(medicamentos)
+                identificacao = f"{codigo};" if i % 2 else f";{nome.upper()}"
+                csv.write(f"{identificacao};NF{i:07d};31/12/2028;{rnd.randint(1, 500)};"
+                          f"{rnd.uniform(0.5, 80):.2f};Farmalog\n")
+
+        resultado = import_lots(conn, read_chunks(arquivo), responsavel=1)
+        divergentes = verify_stock_summary(conn)
+        conn.close()
+
+    por_minuto = resultado['linhas'] / resultado['segundos'] * 60
+    print(f"Recebimento em lote: {resultado['importadas']:,} de {resultado['linhas']:,} linhas "
+          f"em {resultado['segundos']:.1f} s ({por_minuto:,.0f} linhas/min), "
+          f"{len(resultado['erros'])} erros, resumo divergente: {len(divergentes)}")
+    return {'linhas': resultado['linhas'], 'segundos': resultado['segundos'], 'linhas_por_minuto': por_minuto}
+
+def benchmark_scanning(leituras=10_000, seed=42):
+    """Leituras GS1 de recebimento resolvidas pelo índice em memória e gravadas em micro-lotes"""
+    leituras = int(leituras)
+    rnd = random.Random(seed)
+    with tempfile.TemporaryDirectory() as pasta:
+        conn = sqlite3.connect(os.path.join(pasta, "leitura.db"))
+        conn.execute("PRAGMA journal_mode = WAL")
+        generate_hospital(conn)
+        codigos = [row[0] for row in conn.execute("SELECT codigo_barras FROM medicamentos")]
+
+        sessao = ScanSession(BarcodeIndex(), "Recebimento", responsavel=1)
+        resolucoes, gravacoes = [], []
+        for i in range(leituras):
+            leitura = f"010{rnd.choice(codigos)}17281231" + f"10CX{i % 50:03d}"
+            inicio = time.perf_counter()
+            sessao.scan(conn, leitura)
+            resolucoes.append(time.perf_counter() - inicio)
+            if len(sessao.pendentes) >= sessao.tamanho:
+                inicio = time.perf_counter()
+                sessao.flush(conn)
+                gravacoes.append(time.perf_counter() - inicio)
+        sessao.flush(conn)
+        divergentes = verify_stock_summary(conn)
+        conn.close()
+
+    resolucao_ms = sorted(resolucoes)[len(resolucoes) // 2] * 1000
+    gravacao_ms = sorted(gravacoes)[len(gravacoes) // 2] * 1000
+    por_segundo = leituras / (sum(resolucoes) + sum(gravacoes))
+    print(f"Modo leitura: {leituras:,} leituras, resolução mediana {resolucao_ms:.3f} ms, "
+          f"gravação mediana de {sessao.tamanho} leituras {gravacao_ms:.1f} ms "
+          f"({por_segundo:,.0f} leituras/s), resumo divergente: {len(divergentes)}")
+    return {'leituras': leituras, 'resolucao_ms': resolucao_ms, 'gravacao_ms': gravacao_ms}
+
+# ==========================================
+# DASHBOARD: OITO CONSULTAS POR SESSÃO x SNAPSHOT COMPARTILHADO
+# ==========================================
+
+# Consultas anteriores do dashboard, mantidas apenas para comparação
+DASHBOARD_ANTERIOR_TOTAL_MEDICAMENTOS = "SELECT COUNT(*) FROM medicamentos WHERE ativo = 1"
+
+DASHBOARD_ANTERIOR_TOTAL_LOTES = "SELECT COUNT(*) FROM lotes WHERE ativo = 1"
+
+DASHBOARD_ANTERIOR_TOTAL_PACIENTES = "SELECT COUNT(*) FROM pacientes WHERE ativo = 1"
+
+DASHBOARD_ANTERIOR_MOVIMENTACOES_HOJE = """
+    SELECT COUNT(*) FROM movimentacoes
+    WHERE data_movimento >= DATE('now') AND data_movimento < DATE('now', '+1 day')
+"""
+
+DASHBOARD_ANTERIOR_MEDICAMENTOS_POR_CATEGORIA = """
+    SELECT categoria, COUNT(*) as quantidade
+    FROM medicamentos
+    WHERE ativo = 1 AND categoria IS NOT NULL
+    GROUP BY categoria
+    ORDER BY quantidade DESC
+"""
+
+DASHBOARD_ANTERIOR_MOVIMENTACOES_7_DIAS = """
+    SELECT
+        DATE(data_movimento) as data,
+        tipo_movimento,
+        COUNT(*) as quantidade
+    FROM movimentacoes
+    WHERE data_movimento >= DATE('now', '-7 days')
+    GROUP BY DATE(data_movimento), tipo_movimento
+    ORDER BY data
+"""
+
+DASHBOARD_ANTERIOR_PROXIMOS_VENCIMENTO = """
+    SELECT
+        m.nome,
+        l.numero_lote,
+        l.data_validade,
+        l.quantidade_atual,
+        julianday(l.data_validade) - julianday('now') as dias_vencimento
+    FROM lotes l
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    WHERE l.ativo = 1 AND l.data_validade <= DATE('now', '+30 days')
+    AND l.quantidade_atual > 0
+    ORDER BY l.data_validade
+    LIMIT 5
+"""
+
+DASHBOARD_ANTERIOR_LOTES_ESTOQUE_BAIXO = """
+    SELECT
+        m.nome,
+        l.numero_lote,
+        l.quantidade_atual,
+        l.local_armazenamento
+    FROM lotes l
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    WHERE l.ativo = 1 AND l.quantidade_atual > 0 AND l.quantidade_atual <= 10
+    ORDER BY l.quantidade_atual
+    LIMIT 5
+"""
+
+def _dashboard_per_session(conn):
+    # Comportamento anterior: cada sessão executa as oito consultas
+    for query in (DASHBOARD_ANTERIOR_TOTAL_MEDICAMENTOS, DASHBOARD_ANTERIOR_TOTAL_LOTES,
+                  DASHBOARD_ANTERIOR_TOTAL_PACIENTES, DASHBOARD_ANTERIOR_MOVIMENTACOES_HOJE,
+                  DASHBOARD_ANTERIOR_MEDICAMENTOS_POR_CATEGORIA, DASHBOARD_ANTERIOR_MOVIMENTACOES_7_DIAS,
+                  DASHBOARD_ANTERIOR_PROXIMOS_VENCIMENTO, DASHBOARD_ANTERIOR_LOTES_ESTOQUE_BAIXO):
+        pd.read_sql(query, conn)
+
+def benchmark_dashboard(sessoes=30, escala=10):
+    """Sessões abrindo o dashboard juntas: consultas por sessão x snapshot com TTL compartilhado"""
+    sessoes, escala = int(sessoes), float(escala)
+    with tempfile.TemporaryDirectory() as pasta:
+        db_path = os.path.join(pasta, "dashboard.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        generate_hospital(conn, escala)
+        conn.close()
+        pool = ConnectionPool(db_path)
+
+        cache = TTLCache(ttl=60)
+        calculos = []
+
+        def snapshot_compartilhado(conn):
+            def calcular():
+                calculos.append(1)
+                return load_dashboard_snapshot(conn)
+            cache.get_or_compute("snapshot", calcular)
+
+        resultados = {}
+        for nome, render in (("antes", _dashboard_per_session), ("depois", snapshot_compartilhado)):
+            largada = threading.Barrier(sessoes)
+
+            def sessao():
+                local = pool.connection()
+                largada.wait()
+                render(local)
+
+            threads = [threading.Thread(target=sessao) for _ in range(sessoes)]
+            inicio = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            resultados[nome] = (time.perf_counter() - inicio) * 1000
+
+    print(f"Dashboard com {sessoes} sessões simultâneas ({escala:g}×)")
+    print(f"   antes:  {resultados['antes']:.1f} ms ({sessoes * 8} consultas)")
+    print(f"   depois: {resultados['depois']:.1f} ms ({len(calculos)} cálculo(s) do snapshot)")
+    return {'antes_ms': resultados['antes'], 'depois_ms': resultados['depois'], 'calculos': len(calculos)}
+
+# ==========================================
+# HISTÓRICO DE MOVIMENTAÇÕES: FILTRO POR DATE() x INTERVALO + ACUMULADO DIÁRIO
+# ==========================================
+
+# Consulta anterior do histórico, mantida apenas para comparação
+HISTORICO_ANTERIOR = """
+    SELECT
+        m.nome as medicamento, l.numero_lote, l.local_armazenamento, l.setor,
+        mov.tipo_movimento, mov.quantidade, mov.motivo, mov.data_movimento,
+        u.nome_completo as responsavel, mov.observacoes
+    FROM movimentacoes mov
+    JOIN lotes l ON mov.lote_id = l.id
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    JOIN usuarios u ON mov.responsavel = u.id
+    WHERE DATE(mov.data_movimento) BETWEEN ? AND ?
+    ORDER BY mov.data_movimento DESC
+"""
+
+def _history_before(conn, inicio, fim):
+    # Tudo do período em memória, agrupado no pandas e datas convertidas linha a linha
+    df = pd.read_sql(HISTORICO_ANTERIOR, conn, params=[inicio, fim])
+    df['data'] = pd.to_datetime(df['data_movimento']).dt.date
+    df.groupby(['data', 'tipo_movimento']).size()
+    for valor in df['data_movimento']:
+        datetime.strptime(valor, '%Y-%m-%d %H:%M:%S')
+
+def _history_after(conn, inicio, fim):
+    load_movement_summary(conn, inicio, fim)
+    load_movement_page(conn, inicio, fim)
+
+def benchmark_history(escala=10, periodos="1,30,365"):
+    """Renderização do histórico para períodos de 1 dia a 1 ano, antes e depois"""
+    escala = float(escala)
+    conn = sqlite3.connect(":memory:")
+    generate_hospital(conn, escala)
+    # Um ano de histórico: as saídas sintéticas são replicadas para os 275 dias anteriores
+    conn.execute("""
+        INSERT INTO movimentacoes (lote_id, tipo_movimento, quantidade, motivo, responsavel, data_movimento)
+        SELECT lote_id, tipo_movimento, quantidade, motivo, responsavel, DATETIME(data_movimento, '-' || (90 * k) || ' days')
+        FROM movimentacoes, (SELECT 1 as k UNION ALL SELECT 2 UNION ALL SELECT 3)
+        WHERE tipo_movimento = 'Saída'
+    """)
+    conn.commit()
+    total = conn.execute("SELECT COUNT(*) FROM movimentacoes").fetchone()[0]
+
+    hoje = datetime.now(timezone.utc).date()
+    print(f"Histórico de movimentações ({escala:g}×, {total:,} movimentações)")
+    print(f"{'período':>9}{'antes (ms)':>13}{'depois (ms)':>13}")
+    resultados = {}
+    for dias in (int(p) for p in str(periodos).split(",")):
+        inicio = hoje - timedelta(days=dias - 1)
+        antes, _ = _tempo(lambda: _history_before(conn, inicio, hoje))
+        depois, _ = _tempo(lambda: _history_after(conn, inicio, hoje))
+        resultados[dias] = {'antes_ms': antes, 'depois_ms': depois}
+        print(f"{dias:>7} d{antes:>13.1f}{depois:>13.1f}")
+    conn.close()
+    return resultados
+
+def benchmark_archive(escala=1):
+    """Arquivar tudo em Parquet com observações só em alguns meses e ler de volta o período inteiro"""
+    escala = float(escala)
+    conn = sqlite3.connect(":memory:")
+    generate_hospital(conn, escala)
+    # Só o último mês tem observações: os demais gravam a coluna inteira como NULL
+    conn.execute("""
+        UPDATE movimentacoes SET observacoes = 'Conferido'
+        WHERE data_movimento >= (SELECT DATE(MAX(data_movimento), 'start of month') FROM movimentacoes)
+    """)
+    conn.commit()
+    total, com_observacao = conn.execute("SELECT COUNT(*), COUNT(observacoes) FROM movimentacoes").fetchone()
+    mais_antiga = date.fromisoformat(hot_start(conn)[:10])
+    # Filtro por nome: o mesmo resultado antes (só banco) e depois (só arquivo) do arquivamento
+    nome = conn.execute("SELECT nome FROM medicamentos ORDER BY id LIMIT 1").fetchone()[0]
+    hoje = datetime.now(timezone.utc).date() + timedelta(days=Config.ARCHIVE_HORIZON_DAYS + 1)
+    filtradas = len(load_movements(conn, mais_antiga, hoje, busca_medicamento=nome))
+
+    with tempfile.TemporaryDirectory() as pasta:
+        # "Hoje" um horizonte depois da última movimentação: todos os meses vão para o arquivo
+        resultado = archive_movements(conn, hoje=hoje, pasta=pasta)
+        leitura_ms, df = _tempo(lambda: load_movements(conn, mais_antiga, hoje, pasta=pasta))
+        df_nome = load_movements(conn, mais_antiga, hoje, busca_medicamento=nome, pasta=pasta)
+    conn.close()
+
+    print(f"Arquivo de movimentações ({escala:g}×): {resultado['arquivadas']:,} de {total:,} movimentações "
+          f"em {resultado['meses']} partições ({resultado['segundos']:.1f} s)")
+    print(f"   leitura do período inteiro: {len(df):,} linhas, {df['observacoes'].notna().sum():,} com observações "
+          f"em {leitura_ms:.1f} ms")
+    print(f"   filtro \"{nome}\": {len(df_nome):,} linhas no arquivo, {filtradas:,} no banco antes de arquivar")
+    assert len(df) == total and df['observacoes'].notna().sum() == com_observacao
+    assert len(df_nome) == filtradas and 0 < filtradas < total
+    return {'arquivadas': resultado['arquivadas'], 'leitura_ms': leitura_ms}
+
+# ==========================================
+# BACKUP ONLINE: IMPACTO NAS PÁGINAS
+# ==========================================
+
+def _page_loads(db_path, parar):
+    """Latências (ms) de renderizações completas das páginas até `parar` ser sinalizado"""
+    conn = sqlite3.connect(db_path)
+    tempos = []
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        for pagina in PAGINAS.values():
+            pagina(conn)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    conn.close()
+    return sorted(tempos)
+
+def _timed_writes(db_path, parar, lote_id):
+    """Latências (ms) de baixas com movimentação a cada ~2 ms até `parar` ser sinalizado"""
+    conn = sqlite3.connect(db_path, timeout=Config.DB_BUSY_TIMEOUT)
+    tempos = []
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        dispense_lot(conn, lote_id, 1, responsavel=1, motivo="Benchmark de backup")
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        time.sleep(0.002)
+    conn.close()
+    return sorted(tempos)
+
+def _pages_and_writes(db_path, parar, lote_id):
+    """Renderizações de páginas e baixas concorrentes até `parar`; retorna (páginas, commits)"""
+    commits = []
+    escritor = threading.Thread(target=lambda: commits.extend(_timed_writes(db_path, parar, lote_id)))
+    escritor.start()
+    paginas = _page_loads(db_path, parar)
+    escritor.join()
+    return paginas, commits
+
+def benchmark_backup(escala=10, segundos=5):
+    """Latência das páginas e dos commits sem e durante um backup online, e restauração da cópia"""
+    escala, segundos = float(escala), float(segundos)
+    with tempfile.TemporaryDirectory() as pasta:
+        db_path = os.path.join(pasta, "sintetico.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        generate_hospital(conn, escala)
+        lote_id = conn.execute("""
+            INSERT INTO lotes (medicamento_id, numero_lote, data_validade, quantidade_inicial, quantidade_atual)
+            VALUES (1, 'BACKUP', DATE('now', '+1 year'), 1000000, 1000000)
+        """).lastrowid
+        conn.commit()
+        conn.close()
+
+        parar = threading.Event()
+        threading.Timer(segundos, parar.set).start()
+        sem_backup = _pages_and_writes(db_path, parar, lote_id)
+
+        copia = {}
+        parar = threading.Event()
+        def copiar():
+            # Mesma janela de medição; o backup começa depois de as sessões aquecerem
+            time.sleep(0.5)
+            copia.update(create_backup(db_path, os.path.join(pasta, "backups")))
+            parar.set()
+        thread = threading.Thread(target=copiar)
+        thread.start()
+        com_backup = _pages_and_writes(db_path, parar, lote_id)
+        thread.join()
+
+        restaurado = os.path.join(pasta, "restaurado.db")
+        restore_backup(copia['arquivo'], restaurado)
+        conn = sqlite3.connect(restaurado)
+        integridade = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        movimentacoes = conn.execute("SELECT COUNT(*) FROM movimentacoes").fetchone()[0]
+        conn.close()
+
+    resultados = {}
+    for nome, (paginas, commits) in (("sem backup", sem_backup), ("com backup", com_backup)):
+        resultados[nome] = {
+            'renderizacoes': len(paginas), 'mediana_ms': _percentil(paginas, 0.5), 'p95_ms': _percentil(paginas, 0.95),
+            'commits': len(commits), 'commit_mediana_ms': _percentil(commits, 0.5),
+            'commit_p95_ms': _percentil(commits, 0.95),
+        }
+
+    print(f"Backup de {copia['bytes'] / 1e6:,.1f} MB → {copia['bytes_compactados'] / 1e6:,.1f} MB "
+          f"em {copia['segundos']:.1f} s com baixas concorrentes; restauração: {integridade}, "
+          f"{movimentacoes:,} movimentações")
+    print(f"{'':<12}{'páginas':>9}{'mediana (ms)':>14}{'p95 (ms)':>12}{'commits':>10}{'mediana (ms)':>14}{'p95 (ms)':>12}")
+    for nome, m in resultados.items():
+        print(f"{nome:<12}{m['renderizacoes']:>9}{m['mediana_ms']:>14.2f}{m['p95_ms']:>12.2f}"
+              f"{m['commits']:>10}{m['commit_mediana_ms']:>14.2f}{m['commit_p95_ms']:>12.2f}")
+    if resultados['com backup']['renderizacoes'] < 20:
+        print("⚠️ Poucas renderizações durante o backup: o p95 das páginas é pouco estável")
+    for rotulo, chave in (("das páginas", 'p95_ms'), ("dos commits", 'commit_p95_ms')):
+        antes, durante = resultados['sem backup'][chave], resultados['com backup'][chave]
+        print(f"Lentidão no p95 {rotulo} durante o backup: {(durante / antes - 1) * 100:+.0f}%")
+    return resultados
+
+# ==========================================
+# REPLICAÇÃO DO WAL: LATÊNCIA DOS COMMITS
+# ==========================================
+
+def _commit_latencies(pool, lote_id, baixas):
+    """Latência (ms) de cada baixa de lote com movimentação, pelo escritor do pool"""
+    tempos = []
+    for _ in range(baixas):
+        inicio = time.perf_counter()
+        with pool.writer() as conn:
+            dispense_lot(conn, lote_id, 1, responsavel=1, motivo="Benchmark de replicação")
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        time.sleep(0.001)
+    return sorted(tempos)
+
+def benchmark_replication(baixas=5000, intervalo=0.2):
+    """Commits em lotes/movimentações sem e com replicação do WAL, e restauração da réplica"""
+    baixas, intervalo = int(baixas), float(intervalo)
+    resultados = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        for nome, replicar in (("sem réplica", False), ("com réplica", True)):
+            db_path = os.path.join(pasta, f"{'replica' if replicar else 'local'}.db")
+            pool = ConnectionPool(db_path, auto_checkpoint=not replicar)
+            with pool.writer() as conn:
+                bootstrap_database(conn)
+                medicamento_id = conn.execute("INSERT INTO medicamentos (nome) VALUES ('Dipirona Sódica 500mg')").lastrowid
+                lote_id = conn.execute("""
+                    INSERT INTO lotes (medicamento_id, numero_lote, data_validade, quantidade_inicial, quantidade_atual)
+                    VALUES (?, 'REPLICA', DATE('now', '+1 year'), ?, ?)
+                """, (medicamento_id, baixas, baixas)).lastrowid
+
+            replicador = WalReplicator(pool, os.path.join(pasta, "standby"), intervalo).start() if replicar else None
+            tempos = _commit_latencies(pool, lote_id, baixas)
+            resultados[nome] = {'mediana_ms': tempos[len(tempos) // 2], 'p99_ms': _percentil(tempos, 0.99),
+                                'max_ms': tempos[-1]}
+            if replicador is None:
+                pool.close_all()
+                continue
+
+            replicador.stop()
+            conn = pool.connection()
+            esperado = conn.execute("SELECT quantidade_atual, (SELECT COUNT(*) FROM movimentacoes) FROM lotes WHERE id = ?",
+                                    (lote_id,)).fetchone()
+            conn.close()
+            pool.close_all()
+            restaurado = restore(os.path.join(pasta, "restaurado.db"), pasta=os.path.join(pasta, "standby"))
+            conn = sqlite3.connect(os.path.join(pasta, "restaurado.db"))
+            obtido = conn.execute("SELECT quantidade_atual, (SELECT COUNT(*) FROM movimentacoes) FROM lotes WHERE id = ?",
+                                  (lote_id,)).fetchone()
+            conn.close()
+            estatisticas = replicador.stats()
+
+    print(f"Replicação do WAL: {baixas:,} baixas, envio a cada {intervalo:g} s")
+    print(f"{'':<13}{'mediana (ms)':>14}{'p99 (ms)':>12}{'máx (ms)':>12}")
+    for nome, medida in resultados.items():
+        print(f"{nome:<13}{medida['mediana_ms']:>14.3f}{medida['p99_ms']:>12.3f}{medida['max_ms']:>12.3f}")
+    print(f"Réplica: {estatisticas['segmentos']} segmentos, {estatisticas['quadros']:,} quadros; restauração "
+          f"{restaurado['integridade']}, saldo/movimentações {tuple(obtido)} (banco: {tuple(esperado)})")
+    assert restaurado['integridade'] == "ok" and tuple(obtido) == tuple(esperado)
+    return resultados
+
+# ==========================================
+# PREVISÃO: MODELOS E BACKTEST COM ORIGEM MÓVEL
+# ==========================================
+
+def _synthetic_demand(skus, dias, seed=42):
+    """Demanda diária sintética: 40% regular, 20% com tendência e 40% intermitente"""
+    rng = np.random.default_rng(seed)
+    tipo = rng.choice(3, size=skus, p=[0.4, 0.2, 0.4])
+    base = rng.gamma(2.0, 5.0, size=(skus, 1))
+    t = np.arange(dias) / dias
+    sazonal = 1 + 0.15 * np.sin(2 * np.pi * np.arange(dias) / 7)
+    media = np.where(tipo[:, None] == 1, base * (0.5 + rng.uniform(0, 1.5, (skus, 1)) * t), base) * sazonal
+    regular = rng.poisson(media)
+    # Intermitente: poucas saídas, de tamanho variável
+    ocorre = rng.random((skus, dias)) < rng.uniform(0.03, 0.4, (skus, 1))
+    intermitente = ocorre * (1 + rng.poisson(base))
+    return np.where(tipo[:, None] == 2, intermitente, regular).astype(float)
+
+def benchmark_forecasting(skus=10_000, dias=730, horizonte=7, origens=12):
+    """Ajustar os modelos em todos os medicamentos e avaliar com origem móvel"""
+    skus, dias, horizonte, origens = int(skus), int(dias), int(horizonte), int(origens)
+    Y = _synthetic_demand(skus, dias)
+
+    inicio = time.perf_counter()
+    _, modelos = forecast_rates(Y)
+    previsao_s = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    resultado = backtest(Y, horizonte, origens)
+    backtest_s = time.perf_counter() - inicio
+
+    print(f"Previsão de {skus:,} medicamentos × {dias} dias: ajuste e seleção em {previsao_s:.2f} s, "
+          f"backtest ({origens} origens, {horizonte} dias à frente) em {backtest_s:.2f} s")
+    print("   modelos escolhidos: " + ", ".join(f"{m} {np.mean(modelos == m) * 100:.0f}%" for m in MODELOS))
+    print(f"{'modelo':<26}{'MAPE (%)':>10}{'viés (%)':>10}{'MAE':>9}")
+    for modelo, linha in resultado.iterrows():
+        # Métricas sem demanda real para comparar vêm como None
+        mape, vies, mae = (f"{valor:{formato}}" if pd.notna(valor) else "—"
+                           for valor, formato in ((linha['mape'], ".1f"), (linha['vies'], "+.1f"), (linha['mae'], ".2f")))
+        print(f"{modelo:<26}{mape:>10}{vies:>10}{mae:>9}")
+    return {'previsao_s': previsao_s, 'backtest_s': backtest_s, 'metricas': resultado.to_dict('index')}
+
+def benchmark_forecast_refresh(escala=10, movimentos=200, seed=42):
+    """Atualização das previsões gravadas após `movimentos` saídas x recálculo de todo o catálogo"""
+    escala, movimentos = float(escala), int(movimentos)
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    generate_hospital(conn, escala)
+
+    inicio = time.perf_counter()
+    catalogo = refresh_forecasts(conn)
+    primeira_ms = (time.perf_counter() - inicio) * 1000
+
+    # Um dia de atividade: saídas espalhadas por uma fração dos lotes
+    lotes = [row[0] for row in conn.execute("SELECT id FROM lotes WHERE quantidade_atual >= 5")]
+    for lote_id in rnd.choices(lotes, k=movimentos):
+        try:
+            dispense_lot(conn, lote_id, 1, responsavel=1, motivo="Benchmark de previsão")
+        except InsufficientStockError:
+            pass
+
+    sem_novidade_ms, _ = _tempo(lambda: has_new_movements(conn))
+    inicio = time.perf_counter()
+    recalculados = refresh_forecasts(conn)
+    incremental_ms = (time.perf_counter() - inicio) * 1000
+    completo_ms, _ = _tempo(lambda: compute_forecasts(pd.read_sql(QUERY_PREVISAO_BASE, conn),
+                                                      load_daily_consumption(conn)))
+
+    colunas = ['id', 'consumo_medio_diario', 'modelo', 'urgencia']
+    _, gravadas, consumo = load_forecasts(conn)
+    recalculo = compute_forecasts(pd.read_sql(QUERY_PREVISAO_BASE, conn), consumo)
+    iguais = gravadas[colunas].sort_values('id', ignore_index=True).equals(
+        recalculo[colunas].sort_values('id', ignore_index=True))
+    conn.close()
+
+    print(f"Previsões gravadas na escala {escala:g}× ({catalogo:,} medicamentos): primeira carga {primeira_ms:.0f} ms")
+    print(f"   após {movimentos} saídas: {recalculados} medicamentos recalculados em {incremental_ms:.1f} ms "
+          f"(recálculo completo: {completo_ms:.1f} ms; verificação sem novidade: {sem_novidade_ms:.2f} ms)")
+    print(f"   previsões gravadas iguais ao recálculo completo: {iguais}")
+    assert iguais
+    return {'recalculados': recalculados, 'incremental_ms': incremental_ms, 'completo_ms': completo_ms}
+
+# ==========================================
+# PLANO DE REPOSIÇÃO
+# ==========================================
+
+def benchmark_replenishment(medicamentos=10_000, fornecedores=40, entregas=6, seed=42):
+    """Plano de reposição e lista de compras de `medicamentos` com histórico sintético de entregas"""
+    medicamentos, fornecedores, entregas = int(medicamentos), int(fornecedores), int(entregas)
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, medicamentos + 1)
+    demanda = rng.gamma(1.5, 4.0, medicamentos)
+    df_previsoes = pd.DataFrame({
+        'id': ids,
+        'medicamento': [f"Medicamento #{i}" for i in ids],
+        'estoque_atual': rng.integers(0, 400, medicamentos),
+        'consumo_medio_diario': demanda,
+        'desvio_padrao': demanda * rng.uniform(0.3, 1.2, medicamentos),
+    })
+
+    # Cada fornecedor entrega em ciclos próprios (média de 5 a 20 dias)
+    fornecedor = rng.integers(0, fornecedores, medicamentos)
+    ciclo = rng.uniform(5, 20, fornecedores)[fornecedor]
+    intervalos = rng.gamma(4.0, ciclo[:, None] / 4.0, (medicamentos, entregas))
+    datas = pd.Timestamp("2026-01-01") + pd.to_timedelta(np.cumsum(intervalos, axis=1).ravel(), unit="D")
+    df_entregas = pd.DataFrame({
+        'medicamento_id': np.repeat(ids, entregas),
+        'fornecedor': np.repeat([f"Fornecedor {f:02d}" for f in fornecedor], entregas),
+        'data_entrada': datas,
+        'preco_unitario': np.repeat(rng.uniform(1, 80, medicamentos).round(2), entregas),
+    })
+
+    tempo_ms, plano = _tempo(lambda: plan_replenishment(df_previsoes, df_entregas))
+    lista_ms, (itens, totais) = _tempo(lambda: purchase_list(plano))
+
+    print(f"Plano de reposição: {medicamentos:,} medicamentos, {len(df_entregas):,} entregas de {fornecedores} fornecedores")
+    print(f"   plano em {tempo_ms:.0f} ms, lista de compras em {lista_ms:.1f} ms")
+    print(f"   {len(itens):,} itens a comprar, R$ {totais['valor_estimado'].sum():,.2f}; "
+          f"prazo {Config.PRAZO_ENTREGA_PADRAO} dias (padrão), desvio médio do prazo {plano['prazo_desvio'].mean():.1f} dias "
+          f"(ciclos sintéticos: {ciclo.mean():.1f})")
+    return {'plano_ms': tempo_ms, 'lista_ms': lista_ms, 'itens': len(itens)}
+
+def benchmark_scenarios(escala=10, movimentos=20):
+    """Simulador: página inteira a cada movimento do controle x fragmento sobre curvas pré-calculadas"""
+    escala, movimentos = float(escala), int(movimentos)
+    conn = sqlite3.connect(":memory:")
+    generate_hospital(conn, escala)
+    refresh_forecasts(conn)
+
+    def pagina():
+        _, df_previsoes, _ = load_forecasts(conn)
+        plano = plan_replenishment(df_previsoes, load_deliveries(conn))
+        return plano, scenario_curves(plano)
+
+    pagina_ms, (plano, cenarios) = _tempo(pagina)
+    grade_ms, _ = _tempo(lambda: scenario_curves(plano))
+    medicamento = plano['id'].iloc[0]
+
+    def fragmento():
+        # O que roda a cada movimento: recortar as curvas do medicamento e escolher o ponto
+        for multiplicador in MULTIPLICADORES_CENARIO[:movimentos]:
+            cenarios.loc[medicamento].loc[multiplicador]
+
+    fragmento_ms, _ = _tempo(fragmento)
+    conn.close()
+
+    print(f"Simulador de cenários na escala {escala:g}× ({len(plano):,} medicamentos, "
+          f"{len(MULTIPLICADORES_CENARIO)} multiplicadores por curva)")
+    print(f"   página inteira por movimento: {pagina_ms:.0f} ms (grade de cenários: {grade_ms:.1f} ms); "
+          f"fragmento: {fragmento_ms / movimentos:.2f} ms por movimento")
+    return {'pagina_ms': pagina_ms, 'grade_ms': grade_ms, 'fragmento_ms': fragmento_ms / movimentos}
+
+# ==========================================
+# MAPA DO ESTOQUE
+# ==========================================
+
+# Mapa antigo: uma linha (e um bloco HTML) por lote
+_QUERY_MAPA_POR_LOTE = """
+    SELECT m.nome as medicamento, l.local_armazenamento, l.setor, l.prateleira, l.posicao,
+           l.quantidade_atual, l.numero_lote
+    FROM lotes l
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    WHERE l.ativo = 1 AND l.local_armazenamento IS NOT NULL
+    ORDER BY l.local_armazenamento, l.setor, l.prateleira, l.posicao
+"""
+
+def benchmark_stock_map(escala=10):
+    """Mapa do estoque: linhas e tempo por lote x agregado por posição + lotes de uma posição"""
+    escala = float(escala)
+    conn = sqlite3.connect(":memory:")
+    generate_hospital(conn, escala)
+
+    lotes_ms, por_lote = _tempo(lambda: pd.read_sql(_QUERY_MAPA_POR_LOTE, conn))
+    mapa_ms, mapa = _tempo(lambda: load_stock_map(conn))
+    posicao = mapa.sort_values('lotes').iloc[-1]
+    detalhe_ms, detalhe = _tempo(lambda: load_location_lots(conn, posicao['local_armazenamento'], posicao['setor'],
+                                                            posicao['prateleira'], posicao['posicao']))
+    conn.close()
+
+    print(f"Mapa do estoque na escala {escala:g}×")
+    print(f"   por lote: {len(por_lote):,} linhas em {lotes_ms:.1f} ms "
+          f"({por_lote.memory_usage(deep=True).sum() / 1e6:.1f} MB)")
+    print(f"   por posição: {len(mapa):,} linhas em {mapa_ms:.1f} ms "
+          f"({mapa.memory_usage(deep=True).sum() / 1e6:.2f} MB); "
+          f"lotes da maior posição: {len(detalhe)} em {detalhe_ms:.2f} ms")
+    assert mapa['lotes'].sum() == len(por_lote)
+    return {'lotes': len(por_lote), 'posicoes': len(mapa), 'por_lote_ms': lotes_ms, 'mapa_ms': mapa_ms}
+
+# ==========================================
+# PÁGINAS: LATÊNCIA E NÚMERO DE CONSULTAS POR ESCALA
+# ==========================================
+
+def _page_sidebar(conn):
+    for query in (QUERY_ALERTA_VENCIMENTO, QUERY_ALERTA_ESTOQUE_BAIXO, QUERY_ALERTA_SEM_ESTOQUE):
+        conn.execute(query).fetchone()
+
+def _page_dashboard(conn):
+    load_dashboard_snapshot(conn)
+
+def _page_estoque(conn):
+    pd.read_sql("SELECT DISTINCT local_armazenamento FROM lotes WHERE local_armazenamento IS NOT NULL", conn)
+    pd.read_sql("SELECT DISTINCT setor FROM lotes WHERE setor IS NOT NULL", conn)
+    filtros = stock_filters()
+    load_stock_totals(conn, filtros)
+    load_stock_page(conn, filtros)
+    load_stock_map(conn)
+
+def _page_analise_preditiva(conn):
+    if has_new_movements(conn):
+        refresh_forecasts(conn)
+    load_forecasts(conn)
+
+def _page_pacientes(conn):
+    pd.read_sql("SELECT DISTINCT plano_saude FROM pacientes WHERE plano_saude IS NOT NULL", conn)
+    load_patients(conn)
+
+# Consultas que cada página executa em uma renderização, na mesma ordem do app
+PAGINAS = {
+    "sidebar": _page_sidebar,
+    "dashboard": _page_dashboard,
+    "estoque": _page_estoque,
+    "analise_preditiva": _page_analise_preditiva,
+    "pacientes": _page_pacientes,
+}
+
+def profile_pages(conn, repeticoes=3):
+    """Latência média (ms) e número de comandos SQL de cada página"""
+    perfil = {}
+    for nome, pagina in PAGINAS.items():
+        comandos = []
+        conn.set_trace_callback(comandos.append)
+        pagina(conn)
+        conn.set_trace_callback(None)
+
+        ms, _ = _tempo(lambda: pagina(conn), repeticoes=repeticoes)
+        perfil[nome] = {'latencia_ms': round(ms, 2), 'consultas': len(comandos)}
+    return perfil
+
+def benchmark_pages(saida="benchmark_baseline.json", escalas="1,10,100"):
+    """Gerar hospitais sintéticos nas escalas dadas e gravar a linha de base das páginas em JSON"""
+    linha_de_base = {
+        'gerado_em': datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        'sqlite': sqlite3.sqlite_version,
+        'escalas': {},
+    }
+
+    print(f"{'escala':>7}  {'página':<20}{'latência (ms)':>15}{'consultas':>11}")
+    for escala in (float(e) for e in escalas.split(",")):
+        with tempfile.TemporaryDirectory() as pasta:
+            conn = sqlite3.connect(os.path.join(pasta, "sintetico.db"))
+            conn.execute("PRAGMA journal_mode = WAL")
+            inicio = time.perf_counter()
+            contagens = generate_hospital(conn, escala)
+            geracao_s = time.perf_counter() - inicio
+
+            linha_de_base['schema'] = get_schema_version(conn)
+            paginas = profile_pages(conn)
+            conn.close()
+
+        linha_de_base['escalas'][f"{escala:g}x"] = {
+            'contagens': contagens, 'geracao_s': round(geracao_s, 2), 'paginas': paginas,
+        }
+        for nome, medida in paginas.items():
+            print(f"{escala:>6g}×  {nome:<20}{medida['latencia_ms']:>15.2f}{medida['consultas']:>11}")
+
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(linha_de_base, arquivo, indent=2, ensure_ascii=False)
+    print(f"✅ Linha de base gravada em {saida}")
+    return linha_de_base
+
+def compare_baselines(anterior, atual):
+    """Comparar duas linhas de base de páginas (razão atual / anterior da latência)"""
+    with open(anterior, encoding="utf-8") as arquivo:
+        base = json.load(arquivo)
+    with open(atual, encoding="utf-8") as arquivo:
+        nova = json.load(arquivo)
+
+    print(f"{'escala':>7}  {'página':<20}{'antes (ms)':>12}{'depois (ms)':>13}{'razão':>8}{'consultas':>13}")
+    for escala, medidas in nova['escalas'].items():
+        anteriores = base['escalas'].get(escala, {}).get('paginas', {})
+        for nome, medida in medidas['paginas'].items():
+            if nome not in anteriores:
+                continue
+            antes = anteriores[nome]
+            razao = medida['latencia_ms'] / antes['latencia_ms'] if antes['latencia_ms'] else float("nan")
+            print(f"{escala:>7}  {nome:<20}{antes['latencia_ms']:>12.2f}{medida['latencia_ms']:>13.2f}"
+                  f"{razao:>8.2f}{antes['consultas']:>6} → {medida['consultas']:<4}")
+
+# ==========================================
+# LINHA DE COMANDO
+# ==========================================
+
+BENCHMARKS = {
+    "pacientes": benchmark_patient_list,
+    "faixa_etaria": benchmark_age_filter,
+    "dispensacao": benchmark_dispensing,
+    "concorrencia": benchmark_contention,
+    "partida": benchmark_cold_start,
+    "dashboard": benchmark_dashboard,
+    "historico": benchmark_history,
+    "arquivo": benchmark_archive,
+    "importacao": benchmark_import,
+    "leitura": benchmark_scanning,
+    "backup": benchmark_backup,
+    "replicacao": benchmark_replication,
+    "previsao": benchmark_forecasting,
+    "previsoes_gravadas": benchmark_forecast_refresh,
+    "reposicao": benchmark_replenishment,
+    "simulador": benchmark_scenarios,
+    "mapa": benchmark_stock_map,
+    "paginas": benchmark_pages,
+    "comparar": compare_baselines,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Uso: python benchmark.py {'|'.join(BENCHMARKS)} [argumentos]")
+        print("     python benchmark.py paginas [saida.json] [escalas, ex: 1,10,100]")
+        print("     python benchmark.py comparar anterior.json atual.json")
+        sys.exit(2)
+
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
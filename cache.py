@@ -0,0 +1,67 @@
+"""
+🏥 MedStock360 - Cache Compartilhado
+Cache com expiração (TTL) e invalidação explícita, compartilhado entre sessões
+Versão: 3.0 Advanced
+"""
+
+import threading
+import time
+
+class TTLCache:
+    """Cache chave → valor com TTL, invalidação explícita e estatísticas de acerto"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Serializa os recálculos: sessões simultâneas esperam um único cálculo
+        self._compute_lock = threading.Lock()
+        self._stats = {'acertos': 0, 'falhas': 0, 'invalidacoes': 0, 'expiracoes': 0}
+
+    def _lookup(self, key):
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is None:
+                return None
+            valor, expira_em = entrada
+            if time.monotonic() >= expira_em:
+                del self._entries[key]
+                self._stats['expiracoes'] += 1
+                return None
+            return entrada
+
+    def get_or_compute(self, key, compute):
+        """Valor em cache para a chave, calculado por compute() quando ausente ou expirado"""
+        entrada = self._lookup(key)
+        if entrada is None:
+            with self._compute_lock:
+                # Outra sessão pode ter calculado enquanto esperávamos
+                entrada = self._lookup(key)
+                if entrada is None:
+                    valor = compute()
+                    with self._lock:
+                        self._entries[key] = (valor, time.monotonic() + self.ttl)
+                        self._stats['falhas'] += 1
+                    return valor
+
+        with self._lock:
+            self._stats['acertos'] += 1
+        return entrada[0]
+
+    def invalidate(self, key=None):
+        """Descartar uma chave, ou todo o cache quando key é None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._stats['invalidacoes'] += 1
+
+    def stats(self):
+        """Estatísticas de acertos e falhas"""
+        with self._lock:
+            estatisticas = dict(self._stats)
+            estatisticas['entradas'] = len(self._entries)
+        consultas = estatisticas['acertos'] + estatisticas['falhas']
+        estatisticas['taxa_acerto'] = estatisticas['acertos'] / consultas if consultas else 0.0
+        return estatisticas
@@ -29,6 +29,23 @@ class Config:
     
     # Retenção de backups (em dias)
     BACKUP_RETENTION_DAYS = 30
+    BACKUP_COMPRESS_PAUSE = 0.005        # pausa (s) entre blocos compactados, cedendo a CPU às sessões
+    BACKUP_COMPRESS_LEVEL = 1            # gzip rápido: a CPU do servidor é das páginas
+    
+    # Replicação contínua do WAL para um diretório de espera (standby); desligada por padrão
+    REPLICATION_ENABLED = False
+    STANDBY_PATH = "standby/"
+    REPLICATION_INTERVAL = 1             # segundos entre envios de quadros do WAL
+    
+    # Arquivo frio de movimentações (Parquet particionado por mês)
+    ARCHIVE_PATH = "data/arquivo/movimentacoes/"
+    ARCHIVE_HORIZON_DAYS = 365           # movimentações mais antigas saem do SQLite
+    
+    # Pool de conexões (modo WAL)
+    DB_BUSY_TIMEOUT = 30                 # segundos aguardando lock de escrita
+    DB_MMAP_SIZE = 256 * 1024 * 1024     # bytes mapeados em memória
+    DB_CACHE_SIZE_KB = 64 * 1024         # cache de páginas por conexão (KiB)
+    DB_RETRY_BACKOFF = 0.05              # espera inicial (s) entre tentativas de escrita
     
     # ==========================================
     # CONFIGURAÇÕES DE SEGURANÇA
@@ -62,6 +79,13 @@ class Config:
     VENCIMENTO_ATENCAO = 30   # dias
     VENCIMENTO_ALERTA = 60    # dias
     
+    # Recebimento em lote (linhas gravadas por transação)
+    IMPORT_CHUNK_SIZE = 5000
+    
+    # Modo leitura de código de barras (leituras por gravação / segundos máximos pendentes)
+    SCAN_BATCH_SIZE = 20
+    SCAN_FLUSH_SECONDS = 2
+    
     # ==========================================
     # ANÁLISE PREDITIVA
     # ==========================================
@@ -75,6 +99,16 @@ class Config:
     # Mínimo de movimentações para análise
     MIN_MOVIMENTACOES_ANALISE = 3
     
+    # Suavização exponencial (SES/Holt) e Croston/SBA para demanda intermitente
+    PREVISAO_ALPHA = 0.2                 # peso do dia mais recente no nível
+    PREVISAO_BETA = 0.1                  # peso da variação recente na tendência (Holt)
+    PREVISAO_HORIZONTE = 30              # dias à frente usados no consumo previsto
+    
+    # Plano de reposição
+    NIVEL_SERVICO = 0.95                 # probabilidade de não faltar durante o prazo de entrega
+    PRAZO_ENTREGA_PADRAO = 7             # dias, para fornecedores sem prazo configurado
+    PRAZO_ENTREGA_FORNECEDOR = {}        # dias por fornecedor, ex: {"Distribuidora X": 10}
+    
     # ==========================================
     # CONFIGURAÇÕES DE INTERFACE
     # ==========================================
@@ -129,6 +163,9 @@ class Config:
     # Cache de sessão (em segundos)
     CACHE_TIMEOUT = 3600  # 1 hora
     
+    # Snapshot do dashboard compartilhado entre sessões (em segundos)
+    DASHBOARD_CACHE_TTL = 60
+    
     # Número máximo de tentativas de reconexão com banco
     MAX_DB_RETRIES = 3
     
@@ -257,6 +294,16 @@ def get_backup_path():
     os.makedirs(Config.BACKUP_PATH, exist_ok=True)
     return Config.BACKUP_PATH
 
+def get_standby_path():
+    """Obter caminho da réplica em espera"""
+    os.makedirs(Config.STANDBY_PATH, exist_ok=True)
+    return Config.STANDBY_PATH
+
+def get_archive_path():
+    """Obter caminho do arquivo frio de movimentações"""
+    os.makedirs(Config.ARCHIVE_PATH, exist_ok=True)
+    return Config.ARCHIVE_PATH
+
 def get_logs_path():
     """Obter caminho dos logs"""
     os.makedirs(Config.LOGS_PATH, exist_ok=True)
@@ -282,6 +329,10 @@ def validate_config():
     if Config.VENCIMENTO_CRITICO >= Config.VENCIMENTO_ATENCAO:
         errors.append("VENCIMENTO_CRITICO deve ser menor que VENCIMENTO_ATENCAO")
     
+    # O consumo recente da análise preditiva precisa continuar no banco
+    if Config.ARCHIVE_HORIZON_DAYS <= Config.PERIODO_ANALISE_CONSUMO:
+        errors.append("ARCHIVE_HORIZON_DAYS deve ser maior que PERIODO_ANALISE_CONSUMO")
+    
     return errors
 
 # Executar validação na importação
@@ -0,0 +1,131 @@
+"""
+🏥 MedStock360 - Pool de Conexões
+Conexões SQLite em modo WAL compartilhadas entre as sessões do Streamlit
+Versão: 3.0 Advanced
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from config import Config
+
+class PooledConnection(sqlite3.Connection):
+    """Conexão do pool: close() apenas encerra a transação pendente"""
+
+    def close(self):
+        # Igual ao close() do sqlite3: o que não foi commitado é descartado
+        if self.in_transaction:
+            self.rollback()
+
+    def close_physical(self):
+        super().close()
+
+class ConnectionPool:
+    """Pool com uma conexão de leitura por thread e um único escritor serializado"""
+
+    def __init__(self, db_path, auto_checkpoint=True):
+        self.db_path = db_path
+        # Sem checkpoint automático quando a replicação do WAL é quem faz os checkpoints
+        self.auto_checkpoint = auto_checkpoint
+        self._readers = {}
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._stats = {
+            'conexoes_abertas': 0,
+            'conexoes_descartadas': 0,
+            'leituras': 0,
+            'escritas': 0,
+            'escritas_com_erro': 0,
+            'espera_escrita_total': 0.0,
+            'espera_escrita_max': 0.0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=Config.DB_BUSY_TIMEOUT,
+            check_same_thread=False,
+            factory=PooledConnection
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA mmap_size = {int(Config.DB_MMAP_SIZE)}")
+        # Valor negativo = tamanho em KiB, independente do page_size
+        conn.execute(f"PRAGMA cache_size = -{int(Config.DB_CACHE_SIZE_KB)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if not self.auto_checkpoint:
+            conn.execute("PRAGMA wal_autocheckpoint = 0")
+        return conn
+
+    def _prune_readers(self):
+        # O Streamlit cria uma thread por execução do script; conexões de
+        # threads encerradas são fechadas para não acumular descritores
+        vivas = {t.ident for t in threading.enumerate()}
+        for ident in [i for i in self._readers if i not in vivas]:
+            self._readers.pop(ident).close_physical()
+            self._stats['conexoes_descartadas'] += 1
+
+    def connection(self):
+        """Conexão de leitura da thread atual"""
+        ident = threading.get_ident()
+        with self._readers_lock:
+            conn = self._readers.get(ident)
+            self._stats['leituras'] += 1
+        if conn is not None:
+            return conn
+
+        # Abrir fora da trava: num pico de logins as sessões não esperam umas pelas outras
+        conn = self._connect()
+        with self._readers_lock:
+            self._prune_readers()
+            self._readers[ident] = conn
+            self._stats['conexoes_abertas'] += 1
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Conexão de escrita exclusiva; commit ao sair, rollback em caso de erro"""
+        inicio = time.perf_counter()
+        with self._write_lock:
+            espera = time.perf_counter() - inicio
+            self._stats['escritas'] += 1
+            self._stats['espera_escrita_total'] += espera
+            self._stats['espera_escrita_max'] = max(self._stats['espera_escrita_max'], espera)
+
+            if self._writer is None:
+                self._writer = self._connect()
+                self._stats['conexoes_abertas'] += 1
+
+            try:
+                yield self._writer
+                self._writer.commit()
+            except Exception:
+                self._writer.rollback()
+                self._stats['escritas_com_erro'] += 1
+                raise
+
+    def metrics(self):
+        """Métricas de uso do pool"""
+        with self._readers_lock:
+            metricas = dict(self._stats)
+            metricas['conexoes_leitura'] = len(self._readers)
+        metricas['escritor_ocupado'] = self._write_lock.locked()
+        if metricas['escritas']:
+            metricas['espera_escrita_media'] = metricas['espera_escrita_total'] / metricas['escritas']
+        else:
+            metricas['espera_escrita_media'] = 0.0
+        return metricas
+
+    def close_all(self):
+        """Fechar todas as conexões físicas do pool"""
+        with self._readers_lock:
+            for conn in self._readers.values():
+                conn.close_physical()
+            self._readers.clear()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close_physical()
+                self._writer = None
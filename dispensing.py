@@ -0,0 +1,101 @@
+"""
+🏥 MedStock360 - Dispensação
+Alocação de lotes por validade (FEFO: primeiro a vencer, primeiro a sair) para receitas
+Versão: 3.0 Advanced
+"""
+
+from datetime import datetime, timezone
+
+from queries import QUERY_LOTES_FEFO
+from stock import SQL_BAIXA_LOTE
+
+class DispensingError(Exception):
+    """Receita que não pode ser dispensada (inexistente, já dispensada, vencida ou sem estoque)"""
+
+QUERY_ITENS_RECEITA = """
+    SELECT ri.medicamento_id, m.nome as medicamento, SUM(ri.quantidade) as quantidade
+    FROM receita_itens ri
+    JOIN medicamentos m ON ri.medicamento_id = m.id
+    WHERE ri.receita_id = ?
+    GROUP BY ri.medicamento_id
+    ORDER BY MIN(ri.id)
+"""
+
+def allocate_fefo(conn, medicamento_id, quantidade, hoje=None):
+    """Lotes e quantidades que atendem a quantidade pedida, do que vence primeiro ao último"""
+    hoje = hoje or datetime.now(timezone.utc).date().isoformat()
+    cursor = conn.execute(QUERY_LOTES_FEFO, (medicamento_id, hoje))
+    colunas = [descricao[0] for descricao in cursor.description]
+
+    alocacoes = []
+    restante = quantidade
+    # A varredura para assim que a quantidade é atendida
+    for row in cursor:
+        lote = dict(zip(colunas, row))
+        retirar = min(restante, lote.pop('quantidade_atual'))
+        lote['quantidade'] = retirar
+        alocacoes.append(lote)
+        restante -= retirar
+        if restante == 0:
+            break
+    cursor.close()
+    return alocacoes, restante
+
+def dispense_prescription(conn, receita_id, responsavel, hoje=None):
+    """Dispensar todos os itens de uma receita por FEFO e retornar a lista de separação
+
+    Deve ser chamada dentro de uma transação de escrita (ex: stock.run_immediate);
+    nada é gravado se algum item não tiver estoque suficiente.
+    """
+    hoje = hoje or datetime.now(timezone.utc).date().isoformat()
+
+    receita = conn.execute(
+        "SELECT status, validade_receita FROM receitas WHERE id = ?", (receita_id,)
+    ).fetchone()
+    if receita is None:
+        raise DispensingError(f"Receita #{receita_id} não encontrada")
+    status, validade_receita = receita
+    if status != 'ativa':
+        raise DispensingError(f"Receita #{receita_id} não está ativa (status: {status})")
+    if validade_receita and validade_receita < hoje:
+        raise DispensingError(f"Receita #{receita_id} venceu em {validade_receita}")
+
+    itens = conn.execute(QUERY_ITENS_RECEITA, (receita_id,)).fetchall()
+    if not itens:
+        raise DispensingError(f"Receita #{receita_id} não possui itens")
+
+    # Alocar tudo antes de gravar: a receita é dispensada inteira ou não é
+    separacao = []
+    faltas = []
+    for medicamento_id, medicamento, quantidade in itens:
+        alocacoes, restante = allocate_fefo(conn, medicamento_id, quantidade, hoje)
+        if restante > 0:
+            faltas.append(f"{medicamento} (faltam {restante} de {quantidade})")
+            continue
+        for lote in alocacoes:
+            lote.update(medicamento_id=medicamento_id, medicamento=medicamento)
+            separacao.append(lote)
+    if faltas:
+        raise DispensingError("Estoque insuficiente: " + "; ".join(faltas))
+
+    # Baixa condicional: se outro operador consumiu o lote entre a alocação e a
+    # gravação, menos linhas são atualizadas e a transação inteira é desfeita
+    baixas = conn.executemany(
+        SQL_BAIXA_LOTE,
+        [(lote['quantidade'], lote['lote_id'], lote['quantidade']) for lote in separacao]
+    ).rowcount
+    if baixas != len(separacao):
+        raise DispensingError(f"Estoque alterado durante a dispensação da receita #{receita_id}")
+    conn.executemany(
+        """INSERT INTO dispensacoes (receita_id, lote_id, quantidade_dispensada, responsavel)
+           VALUES (?, ?, ?, ?)""",
+        [(receita_id, lote['lote_id'], lote['quantidade'], responsavel) for lote in separacao]
+    )
+    conn.executemany(
+        """INSERT INTO movimentacoes (lote_id, tipo_movimento, quantidade, motivo, responsavel)
+           VALUES (?, 'Saída', ?, ?, ?)""",
+        [(lote['lote_id'], lote['quantidade'], f"Dispensação da receita #{receita_id}", responsavel)
+         for lote in separacao]
+    )
+    conn.execute("UPDATE receitas SET status = 'dispensada' WHERE id = ?", (receita_id,))
+    return separacao
@@ -0,0 +1,353 @@
+"""
+🏥 MedStock360 - Motor de Previsão
+Previsões de consumo de todos os medicamentos calculadas em lote com pandas/NumPy:
+suavização exponencial simples, Holt e Croston/SBA em matrizes medicamento × dia
+Versão: 3.0 Advanced
+"""
+
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from queries import (
+    QUERY_PREVISAO_BASE, QUERY_CONSUMO_DIARIO, QUERY_CONSUMO_DIARIO_MEDICAMENTOS,
+    QUERY_PREVISOES_MARCA, QUERY_MOVIMENTOS_NOVOS
+)
+from stock import run_immediate
+
+# Limites de urgência em dias até o fim do estoque
+URGENCIAS = [
+    (7, "Crítico", "🔴"),
+    (15, "Atenção", "🟡"),
+    (30, "Baixo", "🟠"),
+]
+URGENCIA_NORMAL = ("Normal", "🟢")
+
+def load_daily_consumption(conn, dias=None, medicamentos=None):
+    """Consumo diário (medicamento_id, data, consumo_diario) de todos ou só dos medicamentos dados"""
+    dias = dias or Config.PERIODO_ANALISE_CONSUMO
+    if medicamentos is None:
+        df = pd.read_sql(QUERY_CONSUMO_DIARIO, conn, params=[f"-{int(dias)} days"])
+    else:
+        df = pd.read_sql(QUERY_CONSUMO_DIARIO_MEDICAMENTOS, conn,
+                         params=[json.dumps([int(m) for m in medicamentos]), f"-{int(dias)} days"])
+    df['data'] = pd.to_datetime(df['data'])
+    return df
+
+# ==========================================
+# MODELOS VETORIZADOS (MEDICAMENTO × DIA)
+# ==========================================
+
+MODELOS = ("SES", "Holt", "Croston/SBA")
+
+# Intervalo médio entre demandas acima do qual a série é intermitente (Syntetos-Boylan)
+ADI_INTERMITENTE = 1.32
+
+# Dias usados para o nível inicial dos modelos
+DIAS_INICIAIS = 7
+
+def consumption_matrix(df_consumo, dias, hoje):
+    """(ids, matriz medicamento × dia) com zero nos dias sem saída; a última coluna é hoje"""
+    inicio = hoje - pd.Timedelta(days=dias - 1)
+    df = df_consumo[(df_consumo['data'] >= inicio) & (df_consumo['data'] <= hoje)]
+    ids, linhas = np.unique(df['medicamento_id'].to_numpy(), return_inverse=True)
+    matriz = np.zeros((len(ids), dias))
+    np.add.at(matriz, (linhas, (df['data'] - inicio).dt.days.to_numpy()),
+              df['consumo_diario'].to_numpy(dtype=float))
+    return ids, matriz
+
+def fit_models(Y, alpha=None, beta=None):
+    """Estados de cada modelo ao fim de cada dia: {modelo: (nível ou taxa, tendência ou None)}"""
+    alpha = alpha or Config.PREVISAO_ALPHA
+    beta = beta or Config.PREVISAO_BETA
+    skus, dias = Y.shape
+
+    # Estados guardados em float32: 10 mil medicamentos × 2 anos cabem em ~30 MB por matriz
+    nivel_ses = np.empty((skus, dias), dtype=np.float32)
+    nivel_holt = np.empty((skus, dias), dtype=np.float32)
+    tendencia_holt = np.empty((skus, dias), dtype=np.float32)
+    taxa_croston = np.empty((skus, dias), dtype=np.float32)
+
+    ses = Y[:, :DIAS_INICIAIS].mean(axis=1)
+    nivel, tendencia = ses.copy(), np.zeros(skus)
+    tamanho, intervalo = np.zeros(skus), np.ones(skus)
+    decorridos, vista = np.zeros(skus), np.zeros(skus, dtype=bool)
+
+    # Laço só no tempo: cada passo atualiza todos os medicamentos de uma vez
+    for t in range(dias):
+        y = Y[:, t]
+        ses += alpha * (y - ses)
+        nivel_ses[:, t] = ses
+
+        anterior = nivel
+        nivel = alpha * y + (1 - alpha) * (nivel + tendencia)
+        tendencia = beta * (nivel - anterior) + (1 - beta) * tendencia
+        nivel_holt[:, t] = nivel
+        tendencia_holt[:, t] = tendencia
+
+        # Croston: tamanho e intervalo das demandas só mudam nos dias com saída
+        decorridos += 1
+        houve = y > 0
+        primeira = houve & ~vista
+        tamanho = np.where(primeira, y, np.where(houve, tamanho + alpha * (y - tamanho), tamanho))
+        intervalo = np.where(primeira, decorridos, np.where(houve, intervalo + alpha * (decorridos - intervalo), intervalo))
+        decorridos[houve] = 0
+        vista |= houve
+        taxa_croston[:, t] = tamanho / intervalo
+
+    # SBA: correção do viés positivo de Croston
+    taxa_croston *= 1 - alpha / 2
+    return {"SES": (nivel_ses, None), "Holt": (nivel_holt, tendencia_holt), "Croston/SBA": (taxa_croston, None)}
+
+def horizon_demand(estados, horizonte=None, colunas=slice(None)):
+    """Demanda prevista para os `horizonte` dias seguintes a cada coluna, por modelo"""
+    h = horizonte or Config.PREVISAO_HORIZONTE
+    previsoes = {}
+    for modelo, (nivel, tendencia) in estados.items():
+        previsao = nivel[:, colunas].astype(float) * h
+        if tendencia is not None:
+            previsao = np.maximum(previsao + tendencia[:, colunas] * (h * (h + 1) / 2), 0)
+        previsoes[modelo] = previsao
+    return previsoes
+
+def _cumulative(M):
+    """Somas acumuladas por linha com uma coluna zero à esquerda"""
+    acumulado = np.zeros((M.shape[0], M.shape[1] + 1))
+    np.cumsum(M, axis=1, out=acumulado[:, 1:])
+    return acumulado
+
+def select_models(Y, estados, colunas=-1, janela=None):
+    """Índice em MODELOS do modelo de cada medicamento, usando só o histórico até cada coluna"""
+    janela = janela or Config.PERIODO_ANALISE_CONSUMO
+    colunas = np.arange(Y.shape[1])[colunas]
+    inicio = np.maximum(colunas + 1 - janela, 0)
+
+    def na_janela(acumulado):
+        return acumulado[:, colunas + 1] - acumulado[:, inicio]
+
+    # Intermitente: poucos dias com saída na janela → Croston/SBA
+    demandas = na_janela(_cumulative(Y > 0))
+    intermitente = (demandas == 0) | ((colunas + 1 - inicio) / np.maximum(demandas, 1) > ADI_INTERMITENTE)
+
+    # Regular: SES ou Holt, o de menor erro absoluto um passo à frente na janela
+    erros = []
+    for modelo in ("SES", "Holt"):
+        nivel, tendencia = estados[modelo]
+        um_passo = nivel if tendencia is None else nivel + tendencia
+        erro = np.zeros_like(Y)
+        erro[:, 1:] = np.abs(Y[:, 1:] - um_passo[:, :-1])
+        erros.append(na_janela(_cumulative(erro)))
+    return np.where(intermitente, MODELOS.index("Croston/SBA"), np.where(erros[1] < erros[0], 1, 0))
+
+def forecast_rates(Y, horizonte=None, estados=None):
+    """(consumo diário previsto, modelo escolhido) de cada medicamento ao fim da matriz"""
+    h = horizonte or Config.PREVISAO_HORIZONTE
+    estados = estados or fit_models(Y)
+    previsoes = horizon_demand(estados, h, -1)
+    escolha = select_models(Y, estados)
+    taxa = np.choose(escolha, [previsoes[modelo] for modelo in MODELOS]) / h
+    return taxa, np.array(MODELOS)[escolha]
+
+def backtest(Y, horizonte=7, origens=12, janela=None):
+    """Origem móvel: demanda dos `horizonte` dias após cada origem, MAPE e viés (%) por modelo"""
+    janela = janela or Config.PERIODO_ANALISE_CONSUMO
+    colunas = Y.shape[1] - 1 - horizonte * np.arange(origens, 0, -1)
+    colunas = colunas[colunas >= janela]
+
+    estados = fit_models(Y)
+    previsoes = horizon_demand(estados, horizonte, colunas)
+    escolha = select_models(Y, estados, colunas, janela)
+    previsoes["Seleção por medicamento"] = np.choose(escolha, [previsoes[modelo] for modelo in MODELOS])
+
+    # Método anterior: média apenas dos dias com saída
+    acumulado, dias_com_saida = _cumulative(Y), _cumulative(Y > 0)
+    soma = acumulado[:, colunas + 1] - acumulado[:, colunas + 1 - janela]
+    com_saida = dias_com_saida[:, colunas + 1] - dias_com_saida[:, colunas + 1 - janela]
+    previsoes["Média dos dias com saída"] = soma / np.maximum(com_saida, 1) * horizonte
+
+    real = acumulado[:, colunas + 1 + horizonte] - acumulado[:, colunas + 1]
+    com_demanda = real > 0
+    total_real = real.sum()
+    linhas = []
+    for modelo, previsao in previsoes.items():
+        erro = np.abs(previsao - real)
+        # Sem demanda real nas janelas avaliadas, MAPE e viés (%) não têm denominador: None
+        linhas.append({
+            'modelo': modelo,
+            'mape': (erro[com_demanda] / real[com_demanda]).mean() * 100 if com_demanda.any() else None,
+            'vies': (previsao.sum() - total_real) / total_real * 100 if total_real > 0 else None,
+            'mae': erro.mean() if erro.size else None,
+        })
+    return pd.DataFrame(linhas).set_index('modelo')
+
+# ==========================================
+# PREVISÕES GRAVADAS (MARCA D'ÁGUA)
+# ==========================================
+
+# Colunas gravadas em previsoes por medicamento
+PREVISAO_COLUNAS = ['consumo_previsto', 'modelo', 'consumo_total', 'dias_com_consumo', 'recente', 'anterior',
+                    'desvio_padrao', 'holt_nivel', 'holt_tendencia']
+
+def _today(hoje=None):
+    # As datas do banco são gravadas em UTC (CURRENT_TIMESTAMP)
+    return pd.Timestamp(hoje or datetime.now(timezone.utc).date())
+
+def forecast_rows(df_consumo, hoje, dias=None):
+    """Previsão de cada medicamento presente no consumo diário, indexada por medicamento_id"""
+    dias = dias or Config.PERIODO_ANALISE_CONSUMO
+    ids, Y = consumption_matrix(df_consumo, dias, hoje)
+    estados = fit_models(Y)
+    taxa, modelo = forecast_rates(Y, estados=estados)
+    nivel_holt, tendencia_holt = estados["Holt"]
+    # Tendência: últimos 7 dias contra os 7 dias anteriores, contando os dias sem saída
+    return pd.DataFrame({
+        'consumo_previsto': taxa,
+        'modelo': modelo,
+        'consumo_total': Y.sum(axis=1),
+        'dias_com_consumo': (Y > 0).sum(axis=1),
+        'recente': Y[:, -7:].sum(axis=1) / 7,
+        'anterior': Y[:, -14:-7].sum(axis=1) / 7,
+        # Variabilidade diária (com os dias sem saída) para o estoque de segurança
+        'desvio_padrao': Y.std(axis=1),
+        # Estado final de Holt, para envelhecer a previsão sem recalcular
+        'holt_nivel': nivel_holt[:, -1].astype(float),
+        'holt_tendencia': tendencia_holt[:, -1].astype(float),
+    }, index=pd.Index(ids, name='medicamento_id'))
+
+def has_new_movements(conn):
+    """Há movimentações ainda não incorporadas às previsões gravadas?"""
+    marca = conn.execute(QUERY_PREVISOES_MARCA).fetchone()[0]
+    return conn.execute("SELECT EXISTS (SELECT 1 FROM movimentacoes WHERE id > ?)", (marca,)).fetchone()[0] == 1
+
+def refresh_forecasts(conn, hoje=None, dias=None):
+    """Recalcular e gravar só as previsões dos medicamentos movimentados após a marca d'água"""
+    hoje = _today(hoje)
+
+    def atualizar(conn):
+        marca = conn.execute(QUERY_PREVISOES_MARCA).fetchone()[0]
+        novos = pd.read_sql(QUERY_MOVIMENTOS_NOVOS, conn, params=[marca]).set_index('medicamento_id')
+        if novos.empty:
+            return 0
+
+        df_consumo = load_daily_consumption(conn, dias, novos.index)
+        # Medicamento só com entradas na janela: previsão zero, mas a marca avança
+        linhas = forecast_rows(df_consumo, hoje, dias).reindex(novos.index)
+        linhas = linhas.fillna({coluna: 0 for coluna in PREVISAO_COLUNAS if coluna != 'modelo'})
+        linhas['modelo'] = linhas['modelo'].fillna("SES")
+        linhas['ultima_movimentacao_id'] = novos['ultima_movimentacao_id']
+
+        conn.executemany("""
+            INSERT INTO previsoes (medicamento_id, consumo_previsto, modelo, consumo_total, dias_com_consumo,
+                                   recente, anterior, desvio_padrao, holt_nivel, holt_tendencia,
+                                   ultima_movimentacao_id, calculado_em)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (medicamento_id) DO UPDATE SET
+                consumo_previsto = excluded.consumo_previsto,
+                modelo = excluded.modelo,
+                consumo_total = excluded.consumo_total,
+                dias_com_consumo = excluded.dias_com_consumo,
+                recente = excluded.recente,
+                anterior = excluded.anterior,
+                desvio_padrao = excluded.desvio_padrao,
+                holt_nivel = excluded.holt_nivel,
+                holt_tendencia = excluded.holt_tendencia,
+                ultima_movimentacao_id = excluded.ultima_movimentacao_id,
+                calculado_em = excluded.calculado_em
+        """, [
+            (int(med_id), float(linha.consumo_previsto), linha.modelo, float(linha.consumo_total),
+             int(linha.dias_com_consumo), float(linha.recente), float(linha.anterior),
+             float(linha.desvio_padrao), float(linha.holt_nivel), float(linha.holt_tendencia),
+             int(linha.ultima_movimentacao_id), hoje.date().isoformat())
+            for med_id, linha in zip(linhas.index, linhas.itertuples(index=False))
+        ])
+        return len(linhas)
+
+    # Marca d'água, consumo e gravação na mesma transação: nenhuma movimentação fica de fora
+    return run_immediate(conn, atualizar)
+
+# ==========================================
+# PREVISÕES DA PÁGINA
+# ==========================================
+
+def _age_holt(nivel, tendencia, decorridos, alpha, beta, horizonte):
+    """Consumo diário previsto por Holt após `decorridos` dias sem saída a partir do estado gravado"""
+    nivel, tendencia = nivel.astype(float), tendencia.astype(float)
+    for dia in range(int(decorridos.max(initial=0))):
+        ativo = decorridos > dia
+        novo = (1 - alpha) * (nivel + tendencia)
+        tendencia = np.where(ativo, beta * (novo - nivel) + (1 - beta) * tendencia, tendencia)
+        nivel = np.where(ativo, novo, nivel)
+    h = horizonte
+    return np.maximum(nivel * h + tendencia * (h * (h + 1) / 2), 0) / h
+
+def derive_forecasts(df, hoje=None, alpha=None, beta=None):
+    """Trazer as previsões gravadas até hoje e calcular dias até acabar, urgência e sugestões"""
+    hoje = _today(hoje)
+    alpha = alpha or Config.PREVISAO_ALPHA
+    beta = beta or Config.PREVISAO_BETA
+    df = df[df['consumo_previsto'].notna()].copy()
+
+    # Dias sem movimentação desde o cálculo, aplicados como dias sem saída: SES decai por
+    # (1-α)^d, Holt avança nível e tendência gravados, Croston mantém a taxa; as janelas da
+    # tendência andam junto. O modelo escolhido no cálculo é mantido até a próxima movimentação
+    decorridos = (hoje - pd.to_datetime(df['calculado_em'])).dt.days.clip(lower=0).to_numpy()
+    modelo = df['modelo'].to_numpy()
+    holt = (modelo == "Holt") & (decorridos > 0)
+    taxa = df['consumo_previsto'].to_numpy(dtype=float) * np.where(modelo == "SES", (1 - alpha) ** decorridos, 1.0)
+    taxa[holt] = _age_holt(df['holt_nivel'].to_numpy()[holt], df['holt_tendencia'].to_numpy()[holt],
+                           decorridos[holt], alpha, beta, Config.PREVISAO_HORIZONTE)
+    df['consumo_medio_diario'] = taxa
+    df['anterior'] = np.select([decorridos >= 14, decorridos >= 7], [0.0, df['recente']], default=df['anterior'])
+    df['recente'] = np.where(decorridos >= 7, 0.0, df['recente'])
+    df = df[df['consumo_medio_diario'] > 0].copy()
+
+    df['dias_para_acabar'] = df['estoque_atual'] / df['consumo_medio_diario']
+    df['data_previsao_fim'] = hoje + pd.to_timedelta(np.floor(df['dias_para_acabar']), unit='D')
+
+    limites = [df['dias_para_acabar'] < limite for limite, _, _ in URGENCIAS]
+    df['urgencia'] = np.select(limites, [nome for _, nome, _ in URGENCIAS], default=URGENCIA_NORMAL[0])
+    df['urgencia_cor'] = np.select(limites, [cor for _, _, cor in URGENCIAS], default=URGENCIA_NORMAL[1])
+
+    com_historico = df['dias_com_consumo'] >= 7
+    df['tendencia'] = np.select(
+        [com_historico & (df['recente'] > df['anterior'] * 1.2),
+         com_historico & (df['recente'] < df['anterior'] * 0.8)],
+        ['aumento', 'redução'],
+        default=''
+    )
+
+    df['quantidade_sugerida'] = np.where(df['dias_para_acabar'] < 15,
+                                         df['consumo_medio_diario'] * Config.ESTOQUE_SUGERIDO_DIAS, 0.0)
+    df['consumo_acelerado'] = df['consumo_medio_diario'] > df['estoque_atual'] / 30
+    df['poucos_dados'] = df['dias_com_consumo'] < 5
+
+    return df.sort_values('dias_para_acabar').reset_index(drop=True)
+
+def compute_forecasts(df_base, df_consumo, hoje=None, dias=None):
+    """Recalcular do zero as previsões de todos os medicamentos, sem a tabela previsoes"""
+    hoje = _today(hoje)
+    linhas = forecast_rows(df_consumo, hoje, dias).assign(calculado_em=hoje)
+    df = df_base.drop(columns=[c for c in PREVISAO_COLUNAS + ['calculado_em'] if c in df_base])
+    return derive_forecasts(df.merge(linhas, left_on='id', right_index=True, how='inner'), hoje)
+
+def load_forecasts(conn, dias=None):
+    """Base com as previsões gravadas de todos os medicamentos e o consumo diário dos gráficos"""
+    df_base = pd.read_sql(QUERY_PREVISAO_BASE, conn)
+    df_consumo = load_daily_consumption(conn, dias)
+    return df_base, derive_forecasts(df_base), df_consumo
+
+def suggestions(previsao):
+    """Sugestões em texto para uma linha do frame de previsões"""
+    sugestoes = []
+    if previsao['quantidade_sugerida'] > 0:
+        sugestoes.append(f"Repor {previsao['quantidade_sugerida']:.0f} unidades para {Config.ESTOQUE_SUGERIDO_DIAS} dias")
+    if previsao['consumo_acelerado']:
+        sugestoes.append("Consumo acelerado detectado - monitorar de perto")
+    if previsao['poucos_dados']:
+        sugestoes.append("Poucos dados históricos - previsão pode ser imprecisa")
+    if previsao['tendencia']:
+        sugestoes.append(f"Tendência de {previsao['tendencia']} no consumo")
+    return sugestoes
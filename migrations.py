@@ -0,0 +1,771 @@
+"""
+🏥 MedStock360 - Migrações de Schema
+Tabelas base, passos versionados e preparação do banco na partida do processo
+Versão: 3.0 Advanced
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+
+from queries import QUERY_ESTOQUE_RESUMO_CALCULADO, ESTOQUE_RESUMO_COLUNAS
+
+# ==========================================
+# TRIGGERS DO RESUMO DE ESTOQUE
+# ==========================================
+
+def _sql_resumo_lotes(ref):
+    """Recalcular a parte de lotes do resumo do medicamento de NEW/OLD (busca indexada)"""
+    return f"""
+        INSERT INTO estoque_resumo (
+            medicamento_id, total_unidades, lotes_ativos, proxima_validade,
+            estoque_baixo, valor_estoque, atualizado_em
+        )
+        SELECT
+            {ref}.medicamento_id,
+            COALESCE(SUM(quantidade_atual), 0),
+            COUNT(*),
+            MIN(CASE WHEN quantidade_atual > 0 THEN data_validade END),
+            COALESCE(SUM(quantidade_atual), 0) <= 10,
+            COALESCE(SUM(quantidade_atual * COALESCE(preco_unitario, 0)), 0),
+            CURRENT_TIMESTAMP
+        FROM lotes
+        WHERE ativo = 1 AND medicamento_id = {ref}.medicamento_id
+        ON CONFLICT (medicamento_id) DO UPDATE SET
+            total_unidades = excluded.total_unidades,
+            lotes_ativos = excluded.lotes_ativos,
+            proxima_validade = excluded.proxima_validade,
+            estoque_baixo = excluded.estoque_baixo,
+            valor_estoque = excluded.valor_estoque,
+            atualizado_em = excluded.atualizado_em;
+    """
+
+def _sql_resumo_lote_inserido():
+    """Somar um lote novo ao resumo sem reagregar os demais lotes do medicamento"""
+    return """
+        INSERT INTO estoque_resumo (
+            medicamento_id, total_unidades, lotes_ativos, proxima_validade,
+            estoque_baixo, valor_estoque, atualizado_em
+        )
+        SELECT
+            NEW.medicamento_id,
+            NEW.quantidade_atual,
+            1,
+            CASE WHEN NEW.quantidade_atual > 0 THEN NEW.data_validade END,
+            NEW.quantidade_atual <= 10,
+            NEW.quantidade_atual * COALESCE(NEW.preco_unitario, 0),
+            CURRENT_TIMESTAMP
+        WHERE NEW.ativo = 1
+        ON CONFLICT (medicamento_id) DO UPDATE SET
+            total_unidades = total_unidades + excluded.total_unidades,
+            lotes_ativos = lotes_ativos + 1,
+            proxima_validade = COALESCE(MIN(proxima_validade, excluded.proxima_validade),
+                                        proxima_validade, excluded.proxima_validade),
+            estoque_baixo = total_unidades + excluded.total_unidades <= 10,
+            valor_estoque = valor_estoque + excluded.valor_estoque,
+            atualizado_em = excluded.atualizado_em;
+    """
+
+def _sql_resumo_movimento(ref, sinal):
+    """Somar (+) ou subtrair (-) a movimentação NEW/OLD dos contadores do medicamento"""
+    if sinal == "+":
+        ultima = f"MAX(COALESCE(ultima_movimentacao, ''), {ref}.data_movimento)"
+    else:
+        ultima = f"""(
+            SELECT MAX(mov.data_movimento) FROM movimentacoes mov
+            JOIN lotes l ON mov.lote_id = l.id
+            WHERE l.medicamento_id = estoque_resumo.medicamento_id
+        )"""
+    return f"""
+        UPDATE estoque_resumo SET
+            total_movimentacoes = total_movimentacoes {sinal} 1,
+            unidades_saida = unidades_saida {sinal}
+                CASE WHEN {ref}.tipo_movimento = 'Saída' THEN {ref}.quantidade ELSE 0 END,
+            ultima_movimentacao = {ultima},
+            atualizado_em = CURRENT_TIMESTAMP
+        WHERE medicamento_id = (SELECT medicamento_id FROM lotes WHERE id = {ref}.lote_id);
+    """
+
+def _sql_resumo_movimentos_recalculo(medicamentos):
+    """Recontar as movimentações dos medicamentos informados (troca ou exclusão de lote)"""
+    return f"""
+        UPDATE estoque_resumo SET
+            (total_movimentacoes, unidades_saida, ultima_movimentacao) = (
+                SELECT
+                    COUNT(*),
+                    COALESCE(SUM(CASE WHEN mov.tipo_movimento = 'Saída' THEN mov.quantidade ELSE 0 END), 0),
+                    MAX(mov.data_movimento)
+                FROM lotes l
+                JOIN movimentacoes mov ON mov.lote_id = l.id
+                WHERE l.medicamento_id = estoque_resumo.medicamento_id
+            ),
+            atualizado_em = CURRENT_TIMESTAMP
+        WHERE medicamento_id IN ({medicamentos});
+    """
+
+def _sql_movimento_diario(ref, sinal):
+    """Somar (+) ou subtrair (-) a movimentação NEW/OLD do acumulado diário do medicamento"""
+    if sinal == "-":
+        return f"""
+            UPDATE movimentacoes_diarias SET
+                movimentos = movimentos - 1,
+                unidades = unidades - {ref}.quantidade
+            WHERE data = DATE({ref}.data_movimento)
+            AND medicamento_id = (SELECT medicamento_id FROM lotes WHERE id = {ref}.lote_id)
+            AND tipo_movimento = {ref}.tipo_movimento;
+        """
+    return f"""
+        INSERT INTO movimentacoes_diarias (data, medicamento_id, tipo_movimento, movimentos, unidades)
+        SELECT DATE({ref}.data_movimento), medicamento_id, {ref}.tipo_movimento, 1, {ref}.quantidade
+        FROM lotes WHERE id = {ref}.lote_id
+        ON CONFLICT (data, tipo_movimento, medicamento_id) DO UPDATE SET
+            movimentos = movimentos + 1,
+            unidades = unidades + excluded.unidades;
+    """
+
+# ==========================================
+# BUSCA DE TEXTO COMPLETO
+# ==========================================
+
+def _sql_cpf_digitos(coluna):
+    """CPF apenas com dígitos, para que "123.456" e "123456" encontrem o mesmo paciente"""
+    return f"REPLACE(REPLACE(REPLACE({coluna}, '.', ''), '-', ''), '/', '')"
+
+# ==========================================
+# RECONSTRUÇÃO DE TABELAS
+# ==========================================
+
+def _rebuild_lotes_with_check(conn):
+    """Recriar lotes com CHECK (quantidade_atual >= 0), preservando índices e triggers"""
+    # O SQLite não adiciona CHECK a uma tabela existente: cria-se a nova, copia e renomeia
+    ddl = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'lotes'").fetchone()[0]
+    ddl_nova, trocas = re.subn(r"quantidade_atual INTEGER NOT NULL",
+                               "quantidade_atual INTEGER NOT NULL CHECK (quantidade_atual >= 0)", ddl)
+    if trocas != 1:
+        raise sqlite3.DatabaseError("Definição inesperada da tabela lotes")
+    ddl_nova = re.sub(r"^CREATE TABLE\s+\"?lotes\"?", "CREATE TABLE lotes_novo", ddl_nova)
+
+    dependentes = [row[0] for row in conn.execute("""
+        SELECT sql FROM sqlite_master
+        WHERE tbl_name = 'lotes' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    """)]
+
+    # Saldos negativos (atualizações perdidas) são zerados antes, pelos triggers do resumo;
+    # cada correção fica registrada como um Ajuste para o histórico continuar batendo com o saldo
+    conn.execute("""
+        INSERT INTO movimentacoes (lote_id, tipo_movimento, quantidade, motivo, observacoes, responsavel)
+        SELECT id, 'Ajuste', -quantidade_atual, 'Correção de saldo negativo',
+               'Saldo anterior: ' || quantidade_atual,
+               COALESCE((SELECT MIN(id) FROM usuarios WHERE perfil = 'admin'), responsavel_entrada,
+                        (SELECT MIN(id) FROM usuarios))
+        FROM lotes WHERE quantidade_atual < 0
+    """)
+    conn.execute("UPDATE lotes SET quantidade_atual = 0 WHERE quantidade_atual < 0")
+    conn.execute(ddl_nova)
+    conn.execute("INSERT INTO lotes_novo SELECT * FROM lotes")
+    conn.execute("DROP TABLE lotes")
+    # Sem o modo legado, o RENAME revalida os triggers de movimentacoes, que
+    # referenciam lotes e falhariam enquanto a tabela ainda se chama lotes_novo
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    conn.execute("ALTER TABLE lotes_novo RENAME TO lotes")
+    conn.execute("PRAGMA legacy_alter_table = OFF")
+    for sql in dependentes:
+        conn.execute(sql)
+
+def find_duplicate_barcodes(conn, limite=10):
+    """Códigos de barras usados por mais de um medicamento (impedem o índice único)"""
+    return [row[0] for row in conn.execute("""
+        SELECT codigo_barras FROM medicamentos
+        WHERE codigo_barras IS NOT NULL AND codigo_barras <> ''
+        GROUP BY codigo_barras HAVING COUNT(*) > 1
+        LIMIT ?
+    """, (limite,))]
+
+def ensure_barcode_index(conn):
+    """Índice do código de barras, único quando não há duplicados; retorna os duplicados encontrados"""
+    duplicados = find_duplicate_barcodes(conn)
+    indices = {row[1]: row[2] for row in conn.execute("PRAGMA index_list(medicamentos)")}
+    if not duplicados and indices.get('idx_medicamentos_codigo_barras') == 0:
+        # Duplicados corrigidos depois da migração: troca o índice simples pelo único
+        conn.execute("DROP INDEX idx_medicamentos_codigo_barras")
+    conn.execute(f"""CREATE {'' if duplicados else 'UNIQUE '}INDEX IF NOT EXISTS idx_medicamentos_codigo_barras
+                     ON medicamentos (codigo_barras)
+                     WHERE codigo_barras IS NOT NULL AND codigo_barras <> ''""")
+    return duplicados
+
+def _create_barcode_index(conn):
+    """Índice único do código de barras; com duplicados, um índice simples até a correção"""
+    duplicados = ensure_barcode_index(conn)
+    if duplicados:
+        # Bancos antigos aceitavam duplicados: avisa em vez de impedir a partida do app
+        print("⚠️ Códigos de barras duplicados em medicamentos: " + ", ".join(duplicados))
+        print("  - Corrija os cadastros e rode `python migrations.py` para criar o índice único")
+
+# ==========================================
+# MIGRAÇÕES VERSIONADAS
+# ==========================================
+
+# Cada migração é (versão, descrição, comandos); um comando é SQL ou uma função
+# que recebe a conexão. Nunca altere uma migração já publicada: crie uma nova
+# versão com os ajustes necessários.
+MIGRATIONS = [
+    (1, "Índices secundários para as consultas das páginas", [
+        # Alertas, dashboard e estoque: filtro por ativo + junção por medicamento
+        """CREATE INDEX IF NOT EXISTS idx_lotes_ativo_medicamento
+           ON lotes (ativo, medicamento_id, data_validade, quantidade_atual)""",
+        # Histórico e consumo por lote
+        """CREATE INDEX IF NOT EXISTS idx_movimentacoes_lote_data
+           ON movimentacoes (lote_id, data_movimento, tipo_movimento)""",
+        # Movimentações do dia / últimos 7 dias no dashboard
+        """CREATE INDEX IF NOT EXISTS idx_movimentacoes_data
+           ON movimentacoes (data_movimento, tipo_movimento)""",
+        """CREATE INDEX IF NOT EXISTS idx_medicamentos_ativo_categoria
+           ON medicamentos (ativo, categoria)""",
+        """CREATE INDEX IF NOT EXISTS idx_pacientes_ativo_nome
+           ON pacientes (ativo, nome_completo)""",
+        """CREATE INDEX IF NOT EXISTS idx_receitas_paciente
+           ON receitas (paciente_id)""",
+        """CREATE INDEX IF NOT EXISTS idx_consultas_paciente_data
+           ON consultas (paciente_id, data_consulta)""",
+        """CREATE INDEX IF NOT EXISTS idx_prontuario_paciente
+           ON prontuario (paciente_id)""",
+    ]),
+    (2, "Resumo materializado de estoque por medicamento", [
+        """CREATE TABLE IF NOT EXISTS estoque_resumo (
+            medicamento_id INTEGER PRIMARY KEY,
+            total_unidades INTEGER NOT NULL DEFAULT 0,
+            lotes_ativos INTEGER NOT NULL DEFAULT 0,
+            proxima_validade DATE,
+            estoque_baixo BOOLEAN NOT NULL DEFAULT 1,
+            valor_estoque REAL NOT NULL DEFAULT 0,
+            total_movimentacoes INTEGER NOT NULL DEFAULT 0,
+            unidades_saida INTEGER NOT NULL DEFAULT 0,
+            ultima_movimentacao TIMESTAMP,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (medicamento_id) REFERENCES medicamentos (id)
+        )""",
+        # Busca de lotes por medicamento sem o filtro de ativo (triggers de movimentação)
+        """CREATE INDEX IF NOT EXISTS idx_lotes_medicamento
+           ON lotes (medicamento_id)""",
+        f"""INSERT OR REPLACE INTO estoque_resumo ({ESTOQUE_RESUMO_COLUNAS})
+            {QUERY_ESTOQUE_RESUMO_CALCULADO}""",
+        """CREATE TRIGGER IF NOT EXISTS trg_medicamentos_resumo_insert
+           AFTER INSERT ON medicamentos BEGIN
+               INSERT OR IGNORE INTO estoque_resumo (medicamento_id) VALUES (NEW.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_medicamentos_resumo_delete
+           AFTER DELETE ON medicamentos BEGIN
+               DELETE FROM estoque_resumo WHERE medicamento_id = OLD.id;
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_lotes_resumo_insert
+            AFTER INSERT ON lotes BEGIN {_sql_resumo_lotes("NEW")} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_lotes_resumo_update
+            AFTER UPDATE OF medicamento_id, quantidade_atual, preco_unitario, data_validade, ativo
+            ON lotes BEGIN {_sql_resumo_lotes("NEW")} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_lotes_resumo_troca_medicamento
+            AFTER UPDATE OF medicamento_id ON lotes
+            WHEN OLD.medicamento_id <> NEW.medicamento_id BEGIN
+                {_sql_resumo_lotes("OLD")}
+                {_sql_resumo_movimentos_recalculo("OLD.medicamento_id, NEW.medicamento_id")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_lotes_resumo_delete
+            AFTER DELETE ON lotes BEGIN
+                {_sql_resumo_lotes("OLD")}
+                {_sql_resumo_movimentos_recalculo("OLD.medicamento_id")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_movimentacoes_resumo_insert
+            AFTER INSERT ON movimentacoes BEGIN {_sql_resumo_movimento("NEW", "+")} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_movimentacoes_resumo_update
+            AFTER UPDATE OF lote_id, tipo_movimento, quantidade, data_movimento ON movimentacoes BEGIN
+                {_sql_resumo_movimento("OLD", "-")}
+                {_sql_resumo_movimento("NEW", "+")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_movimentacoes_resumo_delete
+            AFTER DELETE ON movimentacoes BEGIN {_sql_resumo_movimento("OLD", "-")} END""",
+    ]),
+    (3, "Índice para a paginação por chave da lista de estoque", [
+        # Percorre os medicamentos em ordem de nome a partir do cursor e para no LIMIT
+        """CREATE INDEX IF NOT EXISTS idx_medicamentos_ativo_nome
+           ON medicamentos (ativo, nome)""",
+    ]),
+    (4, "Índices de texto completo (FTS5) para medicamentos e pacientes", [
+        # unicode61 com remove_diacritics: "sodica" encontra "Sódica"
+        """CREATE VIRTUAL TABLE IF NOT EXISTS medicamentos_fts USING fts5(
+            nome, principio_ativo, fabricante, codigo_barras,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )""",
+        """CREATE VIRTUAL TABLE IF NOT EXISTS pacientes_fts USING fts5(
+            nome_completo, cpf, cidade,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )""",
+        """INSERT INTO medicamentos_fts (rowid, nome, principio_ativo, fabricante, codigo_barras)
+           SELECT id, nome, principio_ativo, fabricante, codigo_barras FROM medicamentos""",
+        f"""INSERT INTO pacientes_fts (rowid, nome_completo, cpf, cidade)
+            SELECT id, nome_completo, {_sql_cpf_digitos("cpf")}, cidade FROM pacientes""",
+        """CREATE TRIGGER IF NOT EXISTS trg_medicamentos_fts_insert
+           AFTER INSERT ON medicamentos BEGIN
+               INSERT INTO medicamentos_fts (rowid, nome, principio_ativo, fabricante, codigo_barras)
+               VALUES (NEW.id, NEW.nome, NEW.principio_ativo, NEW.fabricante, NEW.codigo_barras);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_medicamentos_fts_update
+           AFTER UPDATE OF nome, principio_ativo, fabricante, codigo_barras ON medicamentos BEGIN
+               DELETE FROM medicamentos_fts WHERE rowid = OLD.id;
+               INSERT INTO medicamentos_fts (rowid, nome, principio_ativo, fabricante, codigo_barras)
+               VALUES (NEW.id, NEW.nome, NEW.principio_ativo, NEW.fabricante, NEW.codigo_barras);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_medicamentos_fts_delete
+           AFTER DELETE ON medicamentos BEGIN
+               DELETE FROM medicamentos_fts WHERE rowid = OLD.id;
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_pacientes_fts_insert
+            AFTER INSERT ON pacientes BEGIN
+                INSERT INTO pacientes_fts (rowid, nome_completo, cpf, cidade)
+                VALUES (NEW.id, NEW.nome_completo, {_sql_cpf_digitos("NEW.cpf")}, NEW.cidade);
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_pacientes_fts_update
+            AFTER UPDATE OF nome_completo, cpf, cidade ON pacientes BEGIN
+                DELETE FROM pacientes_fts WHERE rowid = OLD.id;
+                INSERT INTO pacientes_fts (rowid, nome_completo, cpf, cidade)
+                VALUES (NEW.id, NEW.nome_completo, {_sql_cpf_digitos("NEW.cpf")}, NEW.cidade);
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_pacientes_fts_delete
+           AFTER DELETE ON pacientes BEGIN
+               DELETE FROM pacientes_fts WHERE rowid = OLD.id;
+           END""",
+    ]),
+    (5, "Índice para o filtro de faixa etária dos pacientes", [
+        # A faixa etária vira um intervalo de datas de nascimento
+        """CREATE INDEX IF NOT EXISTS idx_pacientes_ativo_nascimento
+           ON pacientes (ativo, data_nascimento)""",
+    ]),
+    (6, "Restrição CHECK impedindo estoque negativo nos lotes", [
+        _rebuild_lotes_with_check,
+    ]),
+    (7, "Entrada de lotes somada ao resumo de forma incremental", [
+        # Reagregar todos os lotes a cada entrada tornava o recebimento em lote quadrático
+        "DROP TRIGGER IF EXISTS trg_lotes_resumo_insert",
+        f"""CREATE TRIGGER trg_lotes_resumo_insert
+            AFTER INSERT ON lotes BEGIN {_sql_resumo_lote_inserido()} END""",
+    ]),
+    (8, "Código de barras único e busca de lote por número para a leitura", [
+        _create_barcode_index,
+        # Leitura GS1: (medicamento, número do lote) → lote
+        """CREATE INDEX IF NOT EXISTS idx_lotes_medicamento_numero
+           ON lotes (medicamento_id, numero_lote)""",
+    ]),
+    (9, "Acumulado diário de movimentações por medicamento e tipo", [
+        # O gráfico do histórico lê poucas linhas por dia em vez de cada movimentação;
+        # exclusões (arquivamento) não alteram o histórico já acumulado
+        """CREATE TABLE IF NOT EXISTS movimentacoes_diarias (
+            data DATE NOT NULL,
+            medicamento_id INTEGER NOT NULL,
+            tipo_movimento TEXT NOT NULL,
+            movimentos INTEGER NOT NULL DEFAULT 0,
+            unidades INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (data, tipo_movimento, medicamento_id)
+        ) WITHOUT ROWID""",
+        """INSERT OR REPLACE INTO movimentacoes_diarias (data, medicamento_id, tipo_movimento, movimentos, unidades)
+           SELECT DATE(mov.data_movimento), l.medicamento_id, mov.tipo_movimento, COUNT(*), SUM(mov.quantidade)
+           FROM movimentacoes mov
+           JOIN lotes l ON mov.lote_id = l.id
+           GROUP BY DATE(mov.data_movimento), l.medicamento_id, mov.tipo_movimento""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_movimentacoes_diarias_insert
+            AFTER INSERT ON movimentacoes BEGIN {_sql_movimento_diario("NEW", "+")} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_movimentacoes_diarias_update
+            AFTER UPDATE OF lote_id, tipo_movimento, quantidade, data_movimento ON movimentacoes BEGIN
+                {_sql_movimento_diario("OLD", "-")}
+                {_sql_movimento_diario("NEW", "+")}
+            END""",
+    ]),
+    (10, "Previsões de consumo gravadas com marca d'água de movimentações", [
+        # Cada linha vale até a movimentação ultima_movimentacao_id; só medicamentos com
+        # movimentações posteriores são recalculados
+        """CREATE TABLE IF NOT EXISTS previsoes (
+            medicamento_id INTEGER PRIMARY KEY,
+            consumo_previsto REAL NOT NULL,
+            modelo TEXT NOT NULL,
+            consumo_total REAL NOT NULL,
+            dias_com_consumo INTEGER NOT NULL,
+            recente REAL NOT NULL,
+            anterior REAL NOT NULL,
+            ultima_movimentacao_id INTEGER NOT NULL,
+            calculado_em DATE NOT NULL,
+            FOREIGN KEY (medicamento_id) REFERENCES medicamentos (id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_previsoes_marca ON previsoes (ultima_movimentacao_id)",
+        """CREATE INDEX IF NOT EXISTS idx_movimentacoes_diarias_medicamento
+           ON movimentacoes_diarias (medicamento_id, tipo_movimento, data)""",
+    ]),
+    (11, "Desvio padrão do consumo diário nas previsões gravadas", [
+        "ALTER TABLE previsoes ADD COLUMN desvio_padrao REAL NOT NULL DEFAULT 0",
+        # Sem linhas, a marca d'água volta a zero e a próxima atualização recalcula tudo
+        "DELETE FROM previsoes",
+    ]),
+    (12, "Índice de localização dos lotes para o mapa do estoque", [
+        # Agregação por posição e lotes de uma posição; sem quantidade_atual na chave,
+        # as baixas não atualizam este índice
+        """CREATE INDEX IF NOT EXISTS idx_lotes_localizacao
+           ON lotes (ativo, local_armazenamento, setor, prateleira, posicao)""",
+    ]),
+    (13, "Estado de Holt nas previsões gravadas", [
+        # Nível e tendência finais: a previsão de Holt envelhece sem recalcular a série
+        "ALTER TABLE previsoes ADD COLUMN holt_nivel REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE previsoes ADD COLUMN holt_tendencia REAL NOT NULL DEFAULT 0",
+        # Sem linhas, a marca d'água volta a zero e a próxima atualização recalcula tudo
+        "DELETE FROM previsoes",
+    ]),
+]
+
+# Versão esperada pelo código atual; bancos nesta versão dispensam o DDL da partida
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    """Obter a última versão de migração aplicada"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    row = conn.execute("SELECT MAX(versao) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+def apply_migrations(conn):
+    """Aplicar as migrações pendentes, cada uma em sua própria transação"""
+    versao_atual = get_schema_version(conn)
+    conn.commit()
+
+    aplicadas = []
+    for versao, descricao, comandos in MIGRATIONS:
+        if versao <= versao_atual:
+            continue
+
+        try:
+            # O sqlite3 do Python não abre transação antes de DDL: sem o BEGIN explícito cada
+            # CREATE/ALTER seria gravado na hora e uma falha deixaria a migração pela metade
+            conn.execute("BEGIN")
+            for comando in comandos:
+                if callable(comando):
+                    comando(conn)
+                else:
+                    conn.execute(comando)
+            conn.execute(
+                "INSERT INTO schema_migrations (versao, descricao) VALUES (?, ?)",
+                (versao, descricao)
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+        aplicadas.append(versao)
+
+    if aplicadas:
+        # Atualizar estatísticas do planejador para os novos índices
+        conn.execute("PRAGMA optimize")
+
+    return aplicadas
+
+# ==========================================
+# SCHEMA BASE
+# ==========================================
+
+# Tabelas originais do sistema (anteriores às migrações versionadas)
+BASE_TABLES = [
+    # Tabela de usuários
+    """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            nome_completo TEXT NOT NULL,
+            email TEXT,
+            perfil TEXT NOT NULL DEFAULT 'operador',
+            crm TEXT,
+            especialidade TEXT,
+            telefone TEXT,
+            ativo BOOLEAN DEFAULT 1,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ultimo_acesso TIMESTAMP,
+            permissoes TEXT DEFAULT '{}'
+        )
+    """,
+
+    # Tabela de medicamentos
+    """
+        CREATE TABLE IF NOT EXISTS medicamentos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            principio_ativo TEXT,
+            categoria TEXT,
+            tipo TEXT,
+            concentracao TEXT,
+            forma_farmaceutica TEXT,
+            via_administracao TEXT,
+            controlado BOOLEAN DEFAULT 0,
+            refrigerado BOOLEAN DEFAULT 0,
+            prescricao_obrigatoria BOOLEAN DEFAULT 0,
+            tarja TEXT,
+            codigo_barras TEXT,
+            fabricante TEXT,
+            observacoes TEXT,
+            ativo BOOLEAN DEFAULT 1,
+            data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            cadastrado_por INTEGER,
+            FOREIGN KEY (cadastrado_por) REFERENCES usuarios (id)
+        )
+    """,
+
+    # Tabela de lotes
+    """
+        CREATE TABLE IF NOT EXISTS lotes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            medicamento_id INTEGER NOT NULL,
+            numero_lote TEXT NOT NULL,
+            data_fabricacao DATE,
+            data_validade DATE NOT NULL,
+            quantidade_inicial INTEGER NOT NULL,
+            quantidade_atual INTEGER NOT NULL,
+            preco_unitario REAL,
+            fornecedor TEXT,
+            local_armazenamento TEXT,
+            setor TEXT,
+            prateleira TEXT,
+            posicao TEXT,
+            observacoes TEXT,
+            ativo BOOLEAN DEFAULT 1,
+            responsavel_entrada INTEGER,
+            data_entrada TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (medicamento_id) REFERENCES medicamentos (id),
+            FOREIGN KEY (responsavel_entrada) REFERENCES usuarios (id)
+        )
+    """,
+
+    # Tabela de movimentações
+    """
+        CREATE TABLE IF NOT EXISTS movimentacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lote_id INTEGER NOT NULL,
+            tipo_movimento TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            motivo TEXT,
+            observacoes TEXT,
+            responsavel INTEGER NOT NULL,
+            data_movimento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (lote_id) REFERENCES lotes (id),
+            FOREIGN KEY (responsavel) REFERENCES usuarios (id)
+        )
+    """,
+
+    # Tabela de pacientes
+    """
+        CREATE TABLE IF NOT EXISTS pacientes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_completo TEXT NOT NULL,
+            cpf TEXT UNIQUE,
+            rg TEXT,
+            data_nascimento DATE,
+            sexo TEXT,
+            telefone TEXT,
+            email TEXT,
+            endereco TEXT,
+            cidade TEXT,
+            cep TEXT,
+            plano_saude TEXT,
+            numero_carteira TEXT,
+            contato_emergencia TEXT,
+            alergias TEXT,
+            medicamentos_uso_continuo TEXT,
+            historico_familiar TEXT,
+            observacoes TEXT,
+            ativo BOOLEAN DEFAULT 1,
+            data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            cadastrado_por INTEGER,
+            FOREIGN KEY (cadastrado_por) REFERENCES usuarios (id)
+        )
+    """,
+
+    # Tabela de consultas
+    """
+        CREATE TABLE IF NOT EXISTS consultas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paciente_id INTEGER NOT NULL,
+            medico_id INTEGER NOT NULL,
+            data_consulta DATETIME NOT NULL,
+            motivo TEXT,
+            sintomas TEXT,
+            diagnostico TEXT,
+            observacoes TEXT,
+            valor REAL,
+            status TEXT DEFAULT 'agendada',
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
+            FOREIGN KEY (medico_id) REFERENCES usuarios (id)
+        )
+    """,
+
+    # Tabela de receitas
+    """
+        CREATE TABLE IF NOT EXISTS receitas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paciente_id INTEGER NOT NULL,
+            medico_id INTEGER NOT NULL,
+            consulta_id INTEGER,
+            data_receita DATETIME NOT NULL,
+            observacoes TEXT,
+            validade_receita DATE,
+            status TEXT DEFAULT 'ativa',
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
+            FOREIGN KEY (medico_id) REFERENCES usuarios (id),
+            FOREIGN KEY (consulta_id) REFERENCES consultas (id)
+        )
+    """,
+
+    # Tabela de itens da receita
+    """
+        CREATE TABLE IF NOT EXISTS receita_itens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            receita_id INTEGER NOT NULL,
+            medicamento_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL,
+            posologia TEXT,
+            observacoes TEXT,
+            FOREIGN KEY (receita_id) REFERENCES receitas (id),
+            FOREIGN KEY (medicamento_id) REFERENCES medicamentos (id)
+        )
+    """,
+
+    # Tabela de dispensações
+    """
+        CREATE TABLE IF NOT EXISTS dispensacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            receita_id INTEGER NOT NULL,
+            lote_id INTEGER NOT NULL,
+            quantidade_dispensada INTEGER NOT NULL,
+            data_dispensacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            responsavel INTEGER NOT NULL,
+            observacoes TEXT,
+            FOREIGN KEY (receita_id) REFERENCES receitas (id),
+            FOREIGN KEY (lote_id) REFERENCES lotes (id),
+            FOREIGN KEY (responsavel) REFERENCES usuarios (id)
+        )
+    """,
+
+    # Tabela de prontuário
+    """
+        CREATE TABLE IF NOT EXISTS prontuario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paciente_id INTEGER NOT NULL,
+            consulta_id INTEGER,
+            data_entrada DATETIME NOT NULL,
+            tipo_entrada TEXT NOT NULL,
+            descricao TEXT NOT NULL,
+            medico_responsavel INTEGER,
+            anexos TEXT,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
+            FOREIGN KEY (consulta_id) REFERENCES consultas (id),
+            FOREIGN KEY (medico_responsavel) REFERENCES usuarios (id)
+        )
+    """,
+
+    # Tabela de alertas inteligentes
+    """
+        CREATE TABLE IF NOT EXISTS alertas_inteligentes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo_alerta TEXT NOT NULL,
+            prioridade TEXT NOT NULL,
+            titulo TEXT NOT NULL,
+            mensagem TEXT NOT NULL,
+            paciente_id INTEGER,
+            medicamento_id INTEGER,
+            usuario_destinatario INTEGER,
+            lido BOOLEAN DEFAULT 0,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_leitura TIMESTAMP,
+            FOREIGN KEY (paciente_id) REFERENCES pacientes (id),
+            FOREIGN KEY (medicamento_id) REFERENCES medicamentos (id),
+            FOREIGN KEY (usuario_destinatario) REFERENCES usuarios (id)
+        )
+    """,
+]
+
+def create_base_tables(conn):
+    """Criar as tabelas base e aplicar as migrações pendentes"""
+    for comando in BASE_TABLES:
+        conn.execute(comando)
+    conn.commit()
+
+    # Índices e demais passos versionados do schema
+    return apply_migrations(conn)
+
+# ==========================================
+# PARTIDA DO PROCESSO
+# ==========================================
+
+def create_default_admin(conn):
+    """Criar o usuário admin padrão se ainda não houver administrador"""
+    if conn.execute("SELECT 1 FROM usuarios WHERE perfil = 'admin' LIMIT 1").fetchone():
+        return
+
+    conn.execute("""
+        INSERT INTO usuarios (username, password_hash, nome_completo, perfil, permissoes)
+        VALUES (?, ?, ?, ?, ?)
+    """, (
+        "admin", hashlib.sha256("admin123".encode()).hexdigest(), "Administrador do Sistema", "admin",
+        json.dumps({"medicamentos": ["visualizar", "criar", "editar", "excluir"],
+                    "estoque": ["visualizar", "criar", "editar"],
+                    "pacientes": ["visualizar", "criar", "editar"],
+                    "consultas": ["visualizar", "criar", "editar"],
+                    "receitas": ["visualizar", "criar", "editar"],
+                    "relatorios": ["visualizar", "gerar"],
+                    "usuarios": ["visualizar", "criar", "editar", "excluir"]})
+    ))
+
+def bootstrap_database(conn):
+    """Preparar o banco uma vez por processo e retornar a versão do schema"""
+    # Banco já atualizado: uma leitura em vez das tabelas base e das migrações
+    if get_schema_version(conn) < SCHEMA_VERSION:
+        create_base_tables(conn)
+    create_default_admin(conn)
+    conn.commit()
+    return get_schema_version(conn)
+
+# ==========================================
+# LINHA DE COMANDO
+# ==========================================
+
+if __name__ == "__main__":
+    from config import get_database_path
+    from queries import check_query_plans
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else get_database_path()
+    conn = sqlite3.connect(db_path)
+
+    # Banco novo: as migrações partem das tabelas base, como na partida do app
+    aplicadas = create_base_tables(conn)
+    print(f"Versão do schema: {get_schema_version(conn)} (aplicadas agora: {aplicadas or 'nenhuma'})")
+
+    # Índice único do código de barras adiado pela migração 8 enquanto havia duplicados
+    duplicados = ensure_barcode_index(conn)
+    conn.commit()
+    if duplicados:
+        print("⚠️ Índice único do código de barras pendente; duplicados: " + ", ".join(duplicados))
+
+    # Regressão de planos: falha se alguma consulta de página varrer uma tabela inteira
+    problemas = check_query_plans(conn)
+    conn.close()
+
+    if problemas:
+        print("❌ Consultas com varredura completa:")
+        for nome, detalhe in problemas:
+            print(f"  - {nome}: {detalhe}")
+        sys.exit(1)
+
+    print("✅ Nenhuma consulta de página faz varredura completa")
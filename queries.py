@@ -0,0 +1,681 @@
+"""
+🏥 MedStock360 - Consultas das Páginas
+Consultas SQL usadas pelas páginas do app, centralizadas para verificação de planos
+Versão: 3.0 Advanced
+"""
+
+import json
+import re
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+import pandas as pd
+
+from config import Config
+from search import BUSCA_PACIENTES, fts_query
+
+# ==========================================
+# ALERTAS RÁPIDOS (SIDEBAR)
+# ==========================================
+
+QUERY_ALERTA_VENCIMENTO = """
+    SELECT COUNT(*) FROM lotes l
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    WHERE l.ativo = 1 AND l.data_validade <= DATE('now', '+30 days')
+    AND l.quantidade_atual > 0
+"""
+
+QUERY_ALERTA_ESTOQUE_BAIXO = """
+    SELECT COUNT(*) FROM lotes l
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    WHERE l.ativo = 1 AND l.quantidade_atual > 0 AND l.quantidade_atual <= 10
+"""
+
+QUERY_ALERTA_SEM_ESTOQUE = """
+    SELECT COUNT(*) FROM lotes l
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    WHERE l.ativo = 1 AND l.quantidade_atual = 0
+"""
+
+# ==========================================
+# DASHBOARD
+# ==========================================
+
+# Todos os indicadores do dashboard (e das estatísticas de medicamentos) em uma
+# única consulta: cada tabela é lida uma vez e as listas voltam como arrays JSON
+QUERY_DASHBOARD_SNAPSHOT = """
+    WITH
+    medicamentos_ativos AS (
+        SELECT categoria, forma_farmaceutica, controlado, refrigerado
+        FROM medicamentos WHERE ativo = 1
+    ),
+    totais_lotes AS (
+        SELECT
+            COUNT(*) as total_lotes,
+            COALESCE(SUM(quantidade_atual > 0 AND data_validade <= DATE('now', '+30 days')), 0) as lotes_vencendo,
+            COALESCE(SUM(quantidade_atual > 0 AND quantidade_atual <= 10), 0) as lotes_estoque_baixo,
+            COALESCE(SUM(quantidade_atual = 0), 0) as lotes_sem_estoque
+        FROM lotes WHERE ativo = 1
+    ),
+    movimentos_7_dias AS (
+        SELECT DATE(data_movimento) as data, tipo_movimento, COUNT(*) as quantidade
+        FROM movimentacoes
+        WHERE data_movimento >= DATE('now', '-7 days')
+        GROUP BY DATE(data_movimento), tipo_movimento
+    ),
+    categorias AS (
+        SELECT categoria, COUNT(*) as quantidade
+        FROM medicamentos_ativos WHERE categoria IS NOT NULL
+        GROUP BY categoria ORDER BY quantidade DESC
+    ),
+    formas AS (
+        SELECT forma_farmaceutica, COUNT(*) as quantidade
+        FROM medicamentos_ativos WHERE forma_farmaceutica IS NOT NULL
+        GROUP BY forma_farmaceutica ORDER BY quantidade DESC LIMIT 10
+    ),
+    proximos_vencimento AS (
+        SELECT m.nome, l.numero_lote, l.data_validade, l.quantidade_atual,
+               julianday(l.data_validade) - julianday('now') as dias_vencimento
+        FROM lotes l
+        JOIN medicamentos m ON l.medicamento_id = m.id
+        WHERE l.ativo = 1 AND l.data_validade <= DATE('now', '+30 days') AND l.quantidade_atual > 0
+        ORDER BY l.data_validade LIMIT 5
+    ),
+    estoque_baixo AS (
+        SELECT m.nome, l.numero_lote, l.quantidade_atual, l.local_armazenamento
+        FROM lotes l
+        JOIN medicamentos m ON l.medicamento_id = m.id
+        WHERE l.ativo = 1 AND l.quantidade_atual > 0 AND l.quantidade_atual <= 10
+        ORDER BY l.quantidade_atual LIMIT 5
+    )
+    SELECT
+        (SELECT COUNT(*) FROM medicamentos_ativos) as total_medicamentos,
+        (SELECT COALESCE(SUM(controlado = 1), 0) FROM medicamentos_ativos) as controlados,
+        (SELECT COALESCE(SUM(refrigerado = 1), 0) FROM medicamentos_ativos) as refrigerados,
+        total_lotes, lotes_vencendo, lotes_estoque_baixo, lotes_sem_estoque,
+        (SELECT COUNT(*) FROM pacientes WHERE ativo = 1) as total_pacientes,
+        (SELECT COALESCE(SUM(quantidade), 0) FROM movimentos_7_dias WHERE data = DATE('now')) as movimentacoes_hoje,
+        (SELECT json_group_array(json_object('categoria', categoria, 'quantidade', quantidade))
+         FROM categorias) as categorias,
+        (SELECT json_group_array(json_object('forma_farmaceutica', forma_farmaceutica, 'quantidade', quantidade))
+         FROM formas) as formas_farmaceuticas,
+        (SELECT json_group_array(json_object('data', data, 'tipo_movimento', tipo_movimento, 'quantidade', quantidade))
+         FROM (SELECT * FROM movimentos_7_dias ORDER BY data)) as movimentacoes_7_dias,
+        (SELECT json_group_array(json_object('nome', nome, 'numero_lote', numero_lote, 'data_validade', data_validade,
+                                             'quantidade_atual', quantidade_atual, 'dias_vencimento', dias_vencimento))
+         FROM proximos_vencimento) as proximos_vencimento,
+        (SELECT json_group_array(json_object('nome', nome, 'numero_lote', numero_lote, 'quantidade_atual', quantidade_atual,
+                                             'local_armazenamento', local_armazenamento))
+         FROM estoque_baixo) as lotes_estoque_baixo_lista
+    FROM totais_lotes
+"""
+
+# Colunas de cada lista do snapshot, para DataFrames vazios com o formato certo
+_SNAPSHOT_LISTAS = {
+    'categorias': ['categoria', 'quantidade'],
+    'formas_farmaceuticas': ['forma_farmaceutica', 'quantidade'],
+    'movimentacoes_7_dias': ['data', 'tipo_movimento', 'quantidade'],
+    'proximos_vencimento': ['nome', 'numero_lote', 'data_validade', 'quantidade_atual', 'dias_vencimento'],
+    'lotes_estoque_baixo_lista': ['nome', 'numero_lote', 'quantidade_atual', 'local_armazenamento'],
+}
+
+class DashboardSnapshot(NamedTuple):
+    """Indicadores do dashboard calculados de uma vez; compartilhado entre sessões (somente leitura)"""
+    total_medicamentos: int
+    controlados: int
+    refrigerados: int
+    total_lotes: int
+    lotes_vencendo: int
+    lotes_estoque_baixo: int
+    lotes_sem_estoque: int
+    total_pacientes: int
+    movimentacoes_hoje: int
+    categorias: pd.DataFrame
+    formas_farmaceuticas: pd.DataFrame
+    movimentacoes_7_dias: pd.DataFrame
+    proximos_vencimento: pd.DataFrame
+    lotes_estoque_baixo_lista: pd.DataFrame
+    calculado_em: datetime
+
+def load_dashboard_snapshot(conn):
+    """Calcular o snapshot do dashboard com uma única consulta"""
+    cursor = conn.execute(QUERY_DASHBOARD_SNAPSHOT)
+    colunas = [descricao[0] for descricao in cursor.description]
+    valores = dict(zip(colunas, cursor.fetchone()))
+    for nome, colunas_lista in _SNAPSHOT_LISTAS.items():
+        valores[nome] = pd.DataFrame(json.loads(valores[nome]), columns=colunas_lista)
+    return DashboardSnapshot(calculado_em=datetime.now(timezone.utc), **valores)
+
+# ==========================================
+# ESTOQUE
+# ==========================================
+
+# Consulta base da aba "Estoque Atual"; os filtros são acrescentados pela página
+QUERY_ESTOQUE_ATUAL = """
+    SELECT
+        l.id as lote_id,
+        m.nome as medicamento,
+        m.principio_ativo,
+        m.controlado,
+        l.numero_lote,
+        l.data_validade,
+        l.quantidade_atual,
+        l.local_armazenamento,
+        l.setor,
+        l.prateleira,
+        l.posicao,
+        l.fornecedor,
+        l.preco_unitario,
+        julianday(l.data_validade) - julianday('now') as dias_vencimento,
+        CASE
+            WHEN l.quantidade_atual = 0 THEN 'Sem estoque'
+            WHEN l.quantidade_atual <= 10 THEN 'Estoque baixo'
+            WHEN l.data_validade <= DATE('now', '+30 days') THEN 'Próximo ao vencimento'
+            ELSE 'Normal'
+        END as status
+    FROM lotes l
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    WHERE l.ativo = 1 AND m.ativo = 1
+"""
+
+# Totais da aba "Estoque Atual" sobre todos os lotes filtrados, sem trazê-los
+QUERY_ESTOQUE_TOTAIS = """
+    SELECT
+        COUNT(*) as total_lotes,
+        COALESCE(SUM(l.quantidade_atual = 0), 0) as sem_estoque,
+        COALESCE(SUM(l.quantidade_atual > 0 AND l.quantidade_atual <= 10), 0) as estoque_baixo,
+        COALESCE(SUM(l.quantidade_atual > 10 AND l.data_validade <= DATE('now', '+30 days')), 0) as proximo_vencimento,
+        COALESCE(SUM(m.controlado = 1), 0) as controlados
+    FROM lotes l
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    WHERE l.ativo = 1 AND m.ativo = 1
+"""
+
+# Paginação por chave (keyset) na ordem de exibição da lista
+ESTOQUE_ORDEM = " ORDER BY m.nome, l.data_validade, l.id"
+ESTOQUE_APOS_CURSOR = " AND (m.nome, l.data_validade, l.id) > (?, ?, ?)"
+
+# Lotes utilizáveis de um medicamento na ordem FEFO; percorre o índice
+# idx_lotes_ativo_medicamento (ativo, medicamento_id, data_validade) sem ordenar,
+# por isso não há desempate por id (lotes com a mesma validade saem em ordem do índice)
+QUERY_LOTES_FEFO = """
+    SELECT
+        id as lote_id,
+        numero_lote,
+        data_validade,
+        quantidade_atual,
+        local_armazenamento,
+        setor,
+        prateleira,
+        posicao
+    FROM lotes
+    WHERE ativo = 1 AND medicamento_id = ? AND data_validade >= ? AND quantidade_atual > 0
+    ORDER BY data_validade
+"""
+
+STATUS_FILTROS = {
+    "Em estoque": " AND l.quantidade_atual > 10",
+    "Estoque baixo": " AND l.quantidade_atual > 0 AND l.quantidade_atual <= 10",
+    "Sem estoque": " AND l.quantidade_atual = 0",
+    "Próximo ao vencimento": " AND l.data_validade <= DATE('now', '+30 days') AND l.quantidade_atual > 0",
+}
+
+def stock_filters(search_term="", local="Todos", setor="Todos", status="Todos"):
+    """Cláusulas SQL e parâmetros dos filtros da aba Estoque Atual"""
+    clausulas = ""
+    params = []
+
+    busca = fts_query(search_term)
+    if busca:
+        clausulas += " AND m.id IN (SELECT rowid FROM medicamentos_fts WHERE medicamentos_fts MATCH ?)"
+        params.append(busca)
+
+    if local != "Todos":
+        clausulas += " AND l.local_armazenamento = ?"
+        params.append(local)
+
+    if setor != "Todos":
+        clausulas += " AND l.setor = ?"
+        params.append(setor)
+
+    clausulas += STATUS_FILTROS.get(status, "")
+    return clausulas, params
+
+def load_stock_totals(conn, filtros):
+    """Totais (lotes, sem estoque, baixo, vencendo, controlados) dos lotes filtrados"""
+    clausulas, params = filtros
+    return pd.read_sql(QUERY_ESTOQUE_TOTAIS + clausulas, conn, params=params).iloc[0].astype(int).to_dict()
+
+def load_stock_page(conn, filtros, cursor=None, limite=None):
+    """Uma página de lotes após o cursor (nome, validade, id); retorna (página, próximo cursor)"""
+    clausulas, params = filtros
+    limite = limite or Config.ITEMS_PER_PAGE
+
+    query = QUERY_ESTOQUE_ATUAL + clausulas
+    params = list(params)
+    if cursor is not None:
+        query += ESTOQUE_APOS_CURSOR
+        params.extend(cursor)
+    # Uma linha a mais indica se existe próxima página
+    query += ESTOQUE_ORDEM + " LIMIT ?"
+    params.append(limite + 1)
+
+    df = pd.read_sql(query, conn, params=params)
+    if len(df) <= limite:
+        return df, None
+
+    df = df.iloc[:limite]
+    ultimo = df.iloc[-1]
+    return df, (ultimo['medicamento'], ultimo['data_validade'], int(ultimo['lote_id']))
+
+# Mapa do estoque: uma linha por posição (local, setor, prateleira, posição), não por lote;
+# a posição leva o pior status entre os seus lotes
+QUERY_MAPA_ESTOQUE = """
+    SELECT *,
+        CASE
+            WHEN vazios > 0 THEN 'Vazio'
+            WHEN baixos > 0 THEN 'Baixo'
+            WHEN vencendo > 0 THEN 'Vencendo'
+            ELSE 'Normal'
+        END as status,
+        (vazios + baixos + vencendo) * 1.0 / lotes as atencao
+    FROM (
+        SELECT
+            local_armazenamento,
+            setor,
+            prateleira,
+            posicao,
+            COUNT(*) as lotes,
+            SUM(quantidade_atual) as quantidade,
+            SUM(quantidade_atual = 0) as vazios,
+            SUM(quantidade_atual > 0 AND quantidade_atual <= 10) as baixos,
+            SUM(quantidade_atual > 10 AND data_validade <= DATE('now', '+30 days')) as vencendo
+        FROM lotes
+        WHERE ativo = 1 AND local_armazenamento IS NOT NULL
+        GROUP BY local_armazenamento, setor, prateleira, posicao
+    )
+"""
+
+# Lotes de uma posição do mapa; IS casa também setor/prateleira/posição vazios
+QUERY_MAPA_LOTES = """
+    SELECT
+        m.nome as medicamento,
+        l.numero_lote,
+        l.quantidade_atual,
+        l.data_validade,
+        CASE
+            WHEN l.quantidade_atual = 0 THEN 'Vazio'
+            WHEN l.quantidade_atual <= 10 THEN 'Baixo'
+            WHEN l.data_validade <= DATE('now', '+30 days') THEN 'Vencendo'
+            ELSE 'Normal'
+        END as status
+    FROM lotes l
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    WHERE l.ativo = 1 AND l.local_armazenamento = ? AND l.setor IS ? AND l.prateleira IS ? AND l.posicao IS ?
+    ORDER BY l.data_validade
+"""
+
+# Rótulos do mapa para partes da localização não informadas
+MAPA_SEM_ROTULO = {'setor': "Sem setor", 'prateleira': "P?", 'posicao': "?"}
+
+def load_stock_map(conn):
+    """Posições do estoque com lotes, quantidade e status; colunas rotulo_* prontas para o mapa"""
+    df = pd.read_sql(QUERY_MAPA_ESTOQUE, conn)
+    df['rotulo_local'] = df['local_armazenamento']
+    for coluna, vazio in MAPA_SEM_ROTULO.items():
+        df[f'rotulo_{coluna}'] = df[coluna].fillna(vazio).astype(str)
+    return df
+
+def load_location_lots(conn, local, setor=None, prateleira=None, posicao=None):
+    """Lotes de uma única posição do mapa"""
+    params = [None if pd.isna(valor) else valor for valor in (local, setor, prateleira, posicao)]
+    return pd.read_sql(QUERY_MAPA_LOTES, conn, params=params)
+
+# ==========================================
+# HISTÓRICO DE MOVIMENTAÇÕES
+# ==========================================
+
+# Lista detalhada: intervalo semiaberto sobre data_movimento, sem funções na
+# coluna, para percorrer idx_movimentacoes_data a partir do cursor
+QUERY_MOVIMENTACOES_HISTORICO = """
+    SELECT
+        mov.id as movimentacao_id,
+        m.nome as medicamento,
+        l.numero_lote,
+        l.local_armazenamento,
+        l.setor,
+        mov.tipo_movimento,
+        mov.quantidade,
+        mov.motivo,
+        mov.data_movimento,
+        u.nome_completo as responsavel,
+        mov.observacoes
+    FROM movimentacoes mov
+    JOIN lotes l ON mov.lote_id = l.id
+    JOIN medicamentos m ON l.medicamento_id = m.id
+    LEFT JOIN usuarios u ON mov.responsavel = u.id
+    WHERE mov.data_movimento >= ? AND mov.data_movimento < ?
+"""
+
+MOVIMENTACOES_ORDEM = " ORDER BY mov.data_movimento DESC, mov.id DESC"
+MOVIMENTACOES_ANTES_CURSOR = " AND (mov.data_movimento, mov.id) < (?, ?)"
+
+# Gráfico e totais do período a partir do acumulado diário (poucas linhas por dia)
+QUERY_MOVIMENTACOES_POR_DIA = """
+    SELECT d.data, d.tipo_movimento, SUM(d.movimentos) as quantidade, SUM(d.unidades) as unidades
+    FROM movimentacoes_diarias d
+    WHERE d.data >= ? AND d.data < ?
+"""
+
+def _movement_filters(coluna_medicamento, coluna_tipo, tipo="Todos", busca_medicamento=""):
+    """Cláusulas e parâmetros comuns à lista detalhada e ao acumulado diário"""
+    clausulas = ""
+    params = []
+
+    if tipo != "Todos":
+        clausulas += f" AND {coluna_tipo} = ?"
+        params.append(tipo)
+
+    busca = fts_query(busca_medicamento)
+    if busca:
+        clausulas += f" AND {coluna_medicamento} IN (SELECT rowid FROM medicamentos_fts WHERE medicamentos_fts MATCH ?)"
+        params.append(busca)
+    return clausulas, params
+
+def _day_range(data_inicio, data_fim):
+    """Dias [início, fim] como intervalo semiaberto de textos ISO [início, fim + 1 dia)"""
+    return data_inicio.isoformat(), (data_fim + timedelta(days=1)).isoformat()
+
+def load_movement_summary(conn, data_inicio, data_fim, tipo="Todos", busca_medicamento=""):
+    """Movimentações e unidades por dia e tipo no período, lidas do acumulado diário"""
+    clausulas, params = _movement_filters("d.medicamento_id", "d.tipo_movimento", tipo, busca_medicamento)
+    query = (QUERY_MOVIMENTACOES_POR_DIA + clausulas
+             + " GROUP BY d.data, d.tipo_movimento ORDER BY d.data")
+    return pd.read_sql(query, conn, params=[*_day_range(data_inicio, data_fim), *params])
+
+def load_movement_page(conn, data_inicio, data_fim, tipo="Todos", busca_medicamento="", cursor=None, limite=None):
+    """Uma página do histórico após o cursor (data, id), da mais recente; retorna (página, próximo cursor)"""
+    clausulas, params = _movement_filters("l.medicamento_id", "mov.tipo_movimento", tipo, busca_medicamento)
+    limite = limite or Config.ITEMS_PER_PAGE
+
+    query = QUERY_MOVIMENTACOES_HISTORICO + clausulas
+    params = [*_day_range(data_inicio, data_fim), *params]
+    if cursor is not None:
+        query += MOVIMENTACOES_ANTES_CURSOR
+        params.extend(cursor)
+    # Uma linha a mais indica se existe próxima página
+    query += MOVIMENTACOES_ORDEM + " LIMIT ?"
+    params.append(limite + 1)
+
+    df = pd.read_sql(query, conn, params=params)
+    proximo = None
+    if len(df) > limite:
+        df = df.iloc[:limite]
+        proximo = (df.iloc[-1]['data_movimento'], int(df.iloc[-1]['movimentacao_id']))
+    # Datas formatadas de uma vez para a página, não linha a linha
+    df['data_hora'] = pd.to_datetime(df['data_movimento']).dt.strftime('%d/%m/%Y %H:%M')
+    return df, proximo
+
+# ==========================================
+# PACIENTES
+# ==========================================
+
+# Cada tabela filha é agregada separadamente pelo índice de paciente_id; juntar
+# consultas, receitas e prontuário de uma vez multiplicaria as linhas (c × r × pr)
+QUERY_PACIENTES_LISTA = """
+    SELECT
+        p.*,
+        u.nome_completo as cadastrado_por_nome,
+        (SELECT COUNT(*) FROM consultas c WHERE c.paciente_id = p.id) as total_consultas,
+        (SELECT COUNT(*) FROM receitas r WHERE r.paciente_id = p.id) as total_receitas,
+        (SELECT COUNT(*) FROM prontuario pr WHERE pr.paciente_id = p.id) as total_prontuario,
+        (SELECT MAX(c.data_consulta) FROM consultas c WHERE c.paciente_id = p.id) as ultima_consulta
+    FROM pacientes p
+    LEFT JOIN usuarios u ON p.cadastrado_por = u.id
+"""
+
+# Faixa etária → (idade mínima, idade máxima) em anos completos
+FAIXAS_ETARIAS = {
+    "Criança (0-12)": (0, 12),
+    "Adolescente (13-17)": (13, 17),
+    "Adulto (18-64)": (18, 64),
+    "Idoso (65+)": (65, None),
+}
+
+def age_bracket_filter(faixa):
+    """Cláusulas SQL e parâmetros da faixa etária como intervalo de data_nascimento"""
+    if faixa not in FAIXAS_ETARIAS:
+        return "", []
+
+    minimo, maximo = FAIXAS_ETARIAS[faixa]
+    # idade >= minimo: nasceu até hoje - minimo anos
+    clausulas = " AND p.data_nascimento <= DATE('now', ?)"
+    params = [f"-{minimo} years"]
+    # idade <= maximo: nasceu depois de hoje - (maximo + 1) anos
+    if maximo is not None:
+        clausulas += " AND p.data_nascimento > DATE('now', ?)"
+        params.append(f"-{maximo + 1} years")
+    return clausulas, params
+
+def compute_ages(datas_nascimento, hoje=None):
+    """Idade em anos completos para uma série de datas de nascimento (nula se ausente)"""
+    hoje = pd.Timestamp(hoje) if hoje is not None else pd.Timestamp.now(tz="UTC").tz_localize(None)
+    nascimento = pd.to_datetime(datas_nascimento, format="%Y-%m-%d", errors="coerce")
+    # Desconta um ano de quem ainda não fez aniversário neste ano
+    sem_aniversario = (nascimento.dt.month > hoje.month) | (
+        (nascimento.dt.month == hoje.month) & (nascimento.dt.day > hoje.day)
+    )
+    return (hoje.year - nascimento.dt.year - sem_aniversario.astype(int)).astype("Int64")
+
+def load_patients(conn, search_term="", plano="Todos", faixa="Todas"):
+    """Pacientes ativos com idade e totais de consultas, receitas e prontuário"""
+    query = QUERY_PACIENTES_LISTA
+    params = []
+
+    # Busca FTS5 por nome, CPF (só dígitos) ou cidade, ordenada por relevância
+    busca = fts_query(search_term)
+    if busca:
+        query += f" JOIN ({BUSCA_PACIENTES}) b ON b.id = p.id"
+        params.append(busca)
+
+    query += " WHERE p.ativo = 1"
+
+    if plano != "Todos":
+        query += " AND p.plano_saude = ?"
+        params.append(plano)
+
+    clausulas_faixa, params_faixa = age_bracket_filter(faixa)
+    query += clausulas_faixa
+    params.extend(params_faixa)
+
+    query += " ORDER BY b.rank, p.nome_completo" if busca else " ORDER BY p.nome_completo"
+    df = pd.read_sql(query, conn, params=params)
+    df['idade'] = compute_ages(df['data_nascimento'])
+    return df
+
+# ==========================================
+# RESUMO DE ESTOQUE
+# ==========================================
+
+# Resumo por medicamento calculado do zero a partir de lotes e movimentações;
+# usado para popular, reconstruir e verificar a tabela estoque_resumo
+QUERY_ESTOQUE_RESUMO_CALCULADO = """
+    SELECT
+        m.id as medicamento_id,
+        COALESCE(l.total_unidades, 0) as total_unidades,
+        COALESCE(l.lotes_ativos, 0) as lotes_ativos,
+        l.proxima_validade,
+        COALESCE(l.total_unidades, 0) <= 10 as estoque_baixo,
+        COALESCE(l.valor_estoque, 0) as valor_estoque,
+        COALESCE(mv.total_movimentacoes, 0) as total_movimentacoes,
+        COALESCE(mv.unidades_saida, 0) as unidades_saida,
+        mv.ultima_movimentacao
+    FROM medicamentos m
+    LEFT JOIN (
+        SELECT
+            medicamento_id,
+            SUM(quantidade_atual) as total_unidades,
+            COUNT(*) as lotes_ativos,
+            MIN(CASE WHEN quantidade_atual > 0 THEN data_validade END) as proxima_validade,
+            SUM(quantidade_atual * COALESCE(preco_unitario, 0)) as valor_estoque
+        FROM lotes
+        WHERE ativo = 1
+        GROUP BY medicamento_id
+    ) l ON l.medicamento_id = m.id
+    LEFT JOIN (
+        SELECT
+            lt.medicamento_id,
+            COUNT(*) as total_movimentacoes,
+            SUM(CASE WHEN mov.tipo_movimento = 'Saída' THEN mov.quantidade ELSE 0 END) as unidades_saida,
+            MAX(mov.data_movimento) as ultima_movimentacao
+        FROM movimentacoes mov
+        JOIN lotes lt ON mov.lote_id = lt.id
+        GROUP BY lt.medicamento_id
+    ) mv ON mv.medicamento_id = m.id
+"""
+
+ESTOQUE_RESUMO_COLUNAS = (
+    "medicamento_id, total_unidades, lotes_ativos, proxima_validade, estoque_baixo, "
+    "valor_estoque, total_movimentacoes, unidades_saida, ultima_movimentacao"
+)
+
+# ==========================================
+# ANÁLISE PREDITIVA
+# ==========================================
+
+# Medicamentos com estoque e histórico de movimentação, lidos do resumo materializado,
+# com a última previsão gravada (colunas nulas se ainda não calculada)
+QUERY_PREVISAO_BASE = """
+    SELECT
+        m.id,
+        m.nome as medicamento,
+        m.principio_ativo,
+        m.categoria,
+        r.total_unidades as estoque_atual,
+        r.total_movimentacoes,
+        CAST(r.unidades_saida AS REAL) / r.total_movimentacoes as consumo_medio,
+        r.ultima_movimentacao,
+        p.consumo_previsto,
+        p.modelo,
+        p.consumo_total,
+        p.dias_com_consumo,
+        p.recente,
+        p.anterior,
+        p.desvio_padrao,
+        p.holt_nivel,
+        p.holt_tendencia,
+        p.calculado_em
+    FROM medicamentos m
+    JOIN estoque_resumo r ON r.medicamento_id = m.id
+    LEFT JOIN previsoes p ON p.medicamento_id = m.id
+    WHERE m.ativo = 1 AND r.total_unidades > 0 AND r.total_movimentacoes > 0
+    ORDER BY consumo_medio DESC
+"""
+
+# Consumo diário de todos os medicamentos, lido do acumulado diário de movimentações;
+# o parâmetro é o modificador de data do SQLite, ex: '-30 days'
+QUERY_CONSUMO_DIARIO = """
+    SELECT
+        d.medicamento_id,
+        d.data,
+        d.unidades as consumo_diario
+    FROM movimentacoes_diarias d
+    WHERE d.data >= DATE('now', ?)
+    AND d.tipo_movimento = 'Saída'
+"""
+
+# O mesmo para uma lista JSON de medicamentos, pelo índice (medicamento, tipo, data)
+QUERY_CONSUMO_DIARIO_MEDICAMENTOS = """
+    SELECT
+        d.medicamento_id,
+        d.data,
+        d.unidades as consumo_diario
+    FROM movimentacoes_diarias d
+    WHERE d.medicamento_id IN (SELECT value FROM json_each(?))
+    AND d.tipo_movimento = 'Saída'
+    AND d.data >= DATE('now', ?)
+"""
+
+# Marca d'água: maior movimentação já incorporada às previsões
+QUERY_PREVISOES_MARCA = "SELECT COALESCE(MAX(ultima_movimentacao_id), 0) FROM previsoes"
+
+# Medicamentos com movimentações após a marca d'água (faixa de rowid: só as novas são lidas)
+QUERY_MOVIMENTOS_NOVOS = """
+    SELECT
+        l.medicamento_id,
+        MAX(mov.id) as ultima_movimentacao_id
+    FROM movimentacoes mov
+    CROSS JOIN lotes l ON mov.lote_id = l.id
+    WHERE mov.id > ?
+    GROUP BY l.medicamento_id
+"""
+
+# ==========================================
+# VERIFICAÇÃO DE PLANOS
+# ==========================================
+
+# Consultas executadas a cada renderização das páginas; nenhuma delas pode
+# degradar para uma varredura completa de tabela
+PAGE_QUERIES = {
+    "alerta_vencimento": QUERY_ALERTA_VENCIMENTO,
+    "alerta_estoque_baixo": QUERY_ALERTA_ESTOQUE_BAIXO,
+    "alerta_sem_estoque": QUERY_ALERTA_SEM_ESTOQUE,
+    "dashboard_snapshot": QUERY_DASHBOARD_SNAPSHOT,
+    "estoque_totais": QUERY_ESTOQUE_TOTAIS,
+    "estoque_pagina": QUERY_ESTOQUE_ATUAL + ESTOQUE_APOS_CURSOR + ESTOQUE_ORDEM + " LIMIT 50",
+    "previsao_base": QUERY_PREVISAO_BASE,
+    "consumo_diario": QUERY_CONSUMO_DIARIO,
+    "consumo_diario_medicamentos": QUERY_CONSUMO_DIARIO_MEDICAMENTOS,
+    "previsoes_marca": QUERY_PREVISOES_MARCA,
+    "movimentos_novos": QUERY_MOVIMENTOS_NOVOS,
+    "pacientes_lista": QUERY_PACIENTES_LISTA + " WHERE p.ativo = 1 ORDER BY p.nome_completo",
+    "lotes_fefo": QUERY_LOTES_FEFO,
+    "mapa_estoque": QUERY_MAPA_ESTOQUE,
+    "mapa_lotes": QUERY_MAPA_LOTES,
+    "movimentacoes_historico": QUERY_MOVIMENTACOES_HISTORICO + MOVIMENTACOES_ANTES_CURSOR + MOVIMENTACOES_ORDEM + " LIMIT 50",
+    "movimentacoes_por_dia": QUERY_MOVIMENTACOES_POR_DIA + " GROUP BY d.data, d.tipo_movimento ORDER BY d.data",
+    "pacientes_faixa_etaria": QUERY_PACIENTES_LISTA + " WHERE p.ativo = 1" + age_bracket_filter("Adulto (18-64)")[0],
+}
+
+# json_each percorre o parâmetro JSON da consulta, não uma tabela
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW|\(|json_each )(\S+)")
+_CTE = re.compile(r"(\w+)\s+AS\s*\(", re.IGNORECASE)
+
+def find_full_scans(conn, sql, params=()):
+    """Listar os passos do plano que varrem uma tabela inteira"""
+    # Percorrer o resultado de uma CTE já filtrada não é varredura de tabela
+    ctes = set(_CTE.findall(sql))
+    plano = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row[3] for row in plano
+            if (passo := _FULL_SCAN.match(row[3])) and passo.group(1) not in ctes]
+
+def clone_schema(conn):
+    """Cópia em memória apenas do schema (sem dados nem estatísticas do planejador)"""
+    sombras = {row[0] for row in conn.execute(
+        "SELECT name FROM pragma_table_list WHERE type = 'shadow'"
+    )}
+    objetos = conn.execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+        ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END
+    """).fetchall()
+
+    copia = sqlite3.connect(":memory:")
+    for nome, sql in objetos:
+        if nome not in sombras:
+            copia.execute(sql)
+    return copia
+
+def check_query_plans(conn, queries=None):
+    """Verificar os planos das consultas de página, retornando (nome, passo) problemáticos"""
+    # Verificação estrutural: sem sqlite_stat1 o resultado não depende do volume
+    # atual de cada tabela, só dos índices existentes
+    schema = clone_schema(conn)
+    problemas = []
+    for nome, sql in (queries or PAGE_QUERIES).items():
+        params = (None,) * sql.count("?")
+        for detalhe in find_full_scans(schema, sql, params):
+            problemas.append((nome, detalhe))
+    schema.close()
+    return problemas
@@ -0,0 +1,277 @@
+"""
+🏥 MedStock360 - Recebimento em Lote
+Importação de lotes a partir de CSV ou XML de NF-e, em blocos e com relatório de erros por linha
+Versão: 3.0 Advanced
+"""
+
+import sys
+import time
+import unicodedata
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from config import Config
+from stock import run_immediate
+
+# Nome canônico de cada coluna e os cabeçalhos aceitos nos arquivos dos fornecedores
+COLUNAS = {
+    'codigo_barras': ['codigo_barras', 'codigo de barras', 'ean', 'gtin', 'cean'],
+    'medicamento': ['medicamento', 'nome', 'produto', 'descricao', 'xprod'],
+    'numero_lote': ['numero_lote', 'lote', 'nlote'],
+    'data_fabricacao': ['data_fabricacao', 'fabricacao', 'dfab'],
+    'data_validade': ['data_validade', 'validade', 'dval'],
+    'quantidade': ['quantidade', 'qtd', 'qlote', 'qcom'],
+    'preco_unitario': ['preco_unitario', 'preco', 'valor_unitario', 'vuncom'],
+    'fornecedor': ['fornecedor'],
+    'local_armazenamento': ['local_armazenamento', 'local'],
+    'setor': ['setor'],
+    'prateleira': ['prateleira'],
+    'posicao': ['posicao'],
+}
+
+_ALIAS = {alias: coluna for coluna, aliases in COLUNAS.items() for alias in aliases}
+
+NFE_NS = "{http://www.portalfiscal.inf.br/nfe}"
+
+SQL_INSERIR_LOTE = """
+    INSERT INTO lotes (
+        medicamento_id, numero_lote, data_fabricacao, data_validade,
+        quantidade_inicial, quantidade_atual, preco_unitario, fornecedor,
+        local_armazenamento, setor, prateleira, posicao, responsavel_entrada
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_INSERIR_ENTRADA = """
+    INSERT INTO movimentacoes (lote_id, tipo_movimento, quantidade, motivo, responsavel)
+    VALUES (?, 'Entrada', ?, ?, ?)
+"""
+
+def _normalize_text(serie):
+    """Texto sem acentos, em minúsculas e com espaços simples (comparação de nomes)"""
+    return (serie.fillna("").str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+            .str.casefold().str.split().str.join(" "))
+
+def _normalize_header(nome):
+    nome = unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode("ascii")
+    return nome.strip().casefold()
+
+def load_medicine_lookup(conn):
+    """Mapas código de barras → id e nome normalizado → id dos medicamentos ativos"""
+    df = pd.read_sql("SELECT id, nome, codigo_barras FROM medicamentos WHERE ativo = 1", conn)
+    codigos = df.dropna(subset=['codigo_barras'])
+    por_codigo = dict(zip(codigos['codigo_barras'].str.strip(), codigos['id']))
+    por_nome = dict(zip(_normalize_text(df['nome']), df['id']))
+    return por_codigo, por_nome
+
+def _canonical(bloco):
+    """Bloco com todas as colunas canônicas como texto (ausentes ficam vazias)"""
+    return bloco.reindex(columns=list(COLUNAS)).astype("string")
+
+def _parse_dates(serie):
+    """Datas ISO (AAAA-MM-DD) ou brasileiras (DD/MM/AAAA); inválidas viram NaT"""
+    serie = serie.str.strip()
+    datas = pd.to_datetime(serie, format="%Y-%m-%d", errors="coerce")
+    return datas.fillna(pd.to_datetime(serie, format="%d/%m/%Y", errors="coerce"))
+
+# ==========================================
+# LEITURA EM BLOCOS
+# ==========================================
+
+def _detect_separator(arquivo):
+    """';' (Excel em português) ou ',' conforme o cabeçalho do CSV"""
+    if hasattr(arquivo, "read"):
+        cabecalho = arquivo.readline()
+        arquivo.seek(0)
+    else:
+        with open(arquivo, "rb") as entrada:
+            cabecalho = entrada.readline()
+    if isinstance(cabecalho, bytes):
+        cabecalho = cabecalho.decode("utf-8", "ignore")
+    return ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+
+def read_csv_chunks(arquivo, tamanho=None):
+    """Blocos de linhas do CSV com colunas canônicas (separador ',' ou ';' detectado)"""
+    leitor = pd.read_csv(arquivo, sep=_detect_separator(arquivo), dtype=str, encoding="utf-8-sig",
+                         chunksize=tamanho or Config.IMPORT_CHUNK_SIZE, skipinitialspace=True)
+    for bloco in leitor:
+        bloco = bloco.rename(columns=lambda nome: _ALIAS.get(_normalize_header(nome), nome))
+        yield _canonical(bloco)
+
+def read_nfe_chunks(arquivo, tamanho=None):
+    """Blocos de lotes lidos de um XML de NF-e (um lote por grupo <rastro> de cada item)"""
+    tamanho = tamanho or Config.IMPORT_CHUNK_SIZE
+    fornecedor = None
+    linhas = []
+
+    # iterparse libera cada item depois de lido: o arquivo não é carregado inteiro
+    for _, elemento in ET.iterparse(arquivo, events=("end",)):
+        if elemento.tag == f"{NFE_NS}emit":
+            fornecedor = elemento.findtext(f"{NFE_NS}xNome")
+        elif elemento.tag == f"{NFE_NS}det":
+            prod = elemento.find(f"{NFE_NS}prod")
+            base = {
+                'codigo_barras': prod.findtext(f"{NFE_NS}cEAN"),
+                'medicamento': prod.findtext(f"{NFE_NS}xProd"),
+                'preco_unitario': prod.findtext(f"{NFE_NS}vUnCom"),
+                'fornecedor': fornecedor,
+            }
+            rastros = prod.findall(f"{NFE_NS}rastro")
+            for rastro in rastros:
+                linhas.append(dict(base,
+                                   numero_lote=rastro.findtext(f"{NFE_NS}nLote"),
+                                   quantidade=rastro.findtext(f"{NFE_NS}qLote"),
+                                   data_fabricacao=rastro.findtext(f"{NFE_NS}dFab"),
+                                   data_validade=rastro.findtext(f"{NFE_NS}dVal")))
+            if not rastros:
+                # Item sem rastreabilidade: fica no relatório por falta de lote e validade
+                linhas.append(dict(base, quantidade=prod.findtext(f"{NFE_NS}qCom")))
+            elemento.clear()
+
+            if len(linhas) >= tamanho:
+                yield _canonical(pd.DataFrame(linhas))
+                linhas = []
+    if linhas:
+        yield _canonical(pd.DataFrame(linhas))
+
+# ==========================================
+# VALIDAÇÃO E GRAVAÇÃO
+# ==========================================
+
+def validate_chunk(bloco, lookup, hoje, existentes=frozenset()):
+    """Separar as linhas válidas (com medicamento_id) das inválidas (linha, motivo)"""
+    por_codigo, por_nome = lookup
+    df = bloco.copy()
+
+    codigos = df['codigo_barras'].fillna("").str.strip()
+    df['medicamento_id'] = codigos.map(por_codigo)
+    sem_codigo = df['medicamento_id'].isna()
+    df.loc[sem_codigo, 'medicamento_id'] = _normalize_text(df.loc[sem_codigo, 'medicamento']).map(por_nome)
+
+    df['numero_lote'] = df['numero_lote'].fillna("").str.strip()
+    quantidade = pd.to_numeric(df['quantidade'].str.replace(",", ".", regex=False), errors="coerce")
+    preco = pd.to_numeric(df['preco_unitario'].str.replace(",", ".", regex=False), errors="coerce")
+    validade = _parse_dates(df['data_validade'].fillna(""))
+    fabricacao = _parse_dates(df['data_fabricacao'].fillna(""))
+
+    chave = list(zip(df['medicamento_id'], df['numero_lote']))
+    regras = [
+        (df['medicamento_id'].isna(), "medicamento não encontrado (código de barras ou nome)"),
+        (df['numero_lote'] == "", "número do lote ausente"),
+        (quantidade.isna() | (quantidade <= 0) | (quantidade % 1 != 0), "quantidade inválida"),
+        (validade.isna(), "data de validade inválida"),
+        (validade <= hoje, "data de validade deve ser futura"),
+        (df['preco_unitario'].notna() & (preco.isna() | (preco < 0)), "preço unitário inválido"),
+        (pd.Series([c in existentes for c in chave], index=df.index), "lote já cadastrado"),
+        (pd.Series(chave, index=df.index).duplicated(), "lote repetido no arquivo"),
+    ]
+
+    motivos = pd.Series("", index=df.index)
+    for condicao, motivo in regras:
+        motivos = motivos.where(~condicao | (motivos != ""), motivo)
+    invalidas = motivos != ""
+
+    erros = pd.DataFrame({'linha': df.index[invalidas], 'motivo': motivos[invalidas].values})
+    validos = df.loc[~invalidas].assign(
+        medicamento_id=lambda d: d['medicamento_id'].astype(int),
+        quantidade=quantidade[~invalidas].astype(int),
+        preco_unitario=preco[~invalidas],
+        data_validade=validade[~invalidas].dt.strftime("%Y-%m-%d"),
+        data_fabricacao=fabricacao[~invalidas].dt.strftime("%Y-%m-%d"),
+    )
+    return validos, erros
+
+def _existing_lots(conn, medicamento_ids):
+    """Pares (medicamento_id, numero_lote) já cadastrados para os medicamentos do bloco"""
+    ids = sorted({int(i) for i in medicamento_ids})
+    existentes = set()
+    # Em partes, abaixo do limite de parâmetros do SQLite
+    for inicio in range(0, len(ids), 900):
+        parte = ids[inicio:inicio + 900]
+        existentes.update(conn.execute(
+            f"SELECT medicamento_id, numero_lote FROM lotes WHERE medicamento_id IN ({','.join('?' * len(parte))})",
+            parte
+        ).fetchall())
+    return existentes
+
+def _insert_chunk(conn, validos, responsavel, motivo):
+    """Gravar lotes e movimentações de entrada do bloco; ids atribuídos pelo SQLite (AUTOINCREMENT)"""
+    opcionais = validos[['preco_unitario', 'fornecedor', 'local_armazenamento', 'setor', 'prateleira', 'posicao',
+                         'data_fabricacao']].astype(object).where(validos.notna(), None)
+
+    linhas = zip(
+        validos['medicamento_id'].tolist(), validos['numero_lote'].tolist(),
+        opcionais['data_fabricacao'].tolist(), validos['data_validade'].tolist(),
+        validos['quantidade'].tolist(), validos['quantidade'].tolist(), opcionais['preco_unitario'].tolist(),
+        opcionais['fornecedor'].tolist(), opcionais['local_armazenamento'].tolist(), opcionais['setor'].tolist(),
+        opcionais['prateleira'].tolist(), opcionais['posicao'].tolist(), [responsavel] * len(validos),
+    )
+    # Um INSERT por linha para ler o id gerado; nunca reaproveita ids de lotes excluídos
+    ids = [conn.execute(SQL_INSERIR_LOTE, linha).lastrowid for linha in linhas]
+    conn.executemany(SQL_INSERIR_ENTRADA, zip(
+        ids, validos['quantidade'].tolist(), [motivo] * len(validos), [responsavel] * len(validos),
+    ))
+
+def import_lots(conn, blocos, responsavel, motivo="Recebimento em lote", hoje=None):
+    """Validar e gravar os blocos de lotes, um bloco por transação; retorna o resumo da importação"""
+    hoje = pd.Timestamp(hoje or datetime.now(timezone.utc).date())
+    inicio = time.perf_counter()
+    lookup = load_medicine_lookup(conn)
+
+    linhas = importadas = 0
+    erros = []
+    vistos = set()
+    for bloco in blocos:
+        # Linhas numeradas como no arquivo (cabeçalho é a linha 1)
+        bloco.index = pd.RangeIndex(linhas + 2, linhas + 2 + len(bloco))
+        linhas += len(bloco)
+
+        ids = pd.concat([bloco['codigo_barras'].fillna("").str.strip().map(lookup[0]),
+                         _normalize_text(bloco['medicamento']).map(lookup[1])]).dropna()
+        validos, erros_bloco = validate_chunk(bloco, lookup, hoje, _existing_lots(conn, ids) | vistos)
+        erros.append(erros_bloco)
+
+        if not validos.empty:
+            run_immediate(conn, lambda c: _insert_chunk(c, validos, responsavel, motivo))
+            vistos.update(zip(validos['medicamento_id'], validos['numero_lote']))
+            importadas += len(validos)
+
+    relatorio = pd.concat(erros, ignore_index=True) if erros else pd.DataFrame(columns=['linha', 'motivo'])
+    return {
+        'linhas': linhas,
+        'importadas': importadas,
+        'erros': relatorio,
+        'segundos': time.perf_counter() - inicio,
+    }
+
+def read_chunks(arquivo, nome=None, tamanho=None):
+    """Escolher o leitor pelo nome do arquivo (.xml para NF-e, CSV nos demais casos)"""
+    nome = nome or getattr(arquivo, "name", str(arquivo))
+    if str(nome).lower().endswith(".xml"):
+        return read_nfe_chunks(arquivo, tamanho)
+    return read_csv_chunks(arquivo, tamanho)
+
+# ==========================================
+# LINHA DE COMANDO
+# ==========================================
+
+if __name__ == "__main__":
+    import sqlite3
+
+    from config import get_database_path
+
+    if len(sys.argv) < 2:
+        print("Uso: python receiving.py arquivo.csv|arquivo.xml [caminho_do_banco]")
+        sys.exit(2)
+
+    db_path = sys.argv[2] if len(sys.argv) > 2 else get_database_path()
+    conn = sqlite3.connect(db_path)
+    usuario = conn.execute("SELECT id FROM usuarios WHERE perfil = 'admin' ORDER BY id LIMIT 1").fetchone()
+    resultado = import_lots(conn, read_chunks(sys.argv[1]), responsavel=usuario[0] if usuario else 1)
+    conn.close()
+
+    print(f"✅ {resultado['importadas']:,} de {resultado['linhas']:,} linhas importadas em {resultado['segundos']:.1f} s")
+    if not resultado['erros'].empty:
+        print(f"❌ {len(resultado['erros'])} linhas com erro:")
+        print(resultado['erros'].to_string(index=False, max_rows=50))
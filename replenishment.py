@@ -0,0 +1,120 @@
+"""
+🏥 MedStock360 - Plano de Reposição
+Estoque de segurança, ponto de pedido e quantidade sugerida de todos os medicamentos de uma vez
+Versão: 3.0 Advanced
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+
+# Histórico de entregas: cada lote é uma entrega do fornecedor
+QUERY_ENTREGAS = """
+    SELECT medicamento_id, fornecedor, data_entrada, preco_unitario
+    FROM lotes
+    WHERE fornecedor IS NOT NULL AND fornecedor <> ''
+"""
+
+SEM_FORNECEDOR = "Sem fornecedor"
+
+def load_deliveries(conn):
+    """Entregas (medicamento, fornecedor, data, preço) de todos os lotes com fornecedor"""
+    df = pd.read_sql(QUERY_ENTREGAS, conn)
+    df['data_entrada'] = pd.to_datetime(df['data_entrada'])
+    return df
+
+def supplier_lead_times(df_entregas, prazos=None):
+    """Prazo de entrega (configurado ou padrão) e desvio do prazo (dias) de cada fornecedor
+
+    Os lotes só guardam a data de entrada, não a do pedido: o intervalo entre entregas
+    é o ciclo de reposição, não o prazo. Por isso o prazo vem de PRAZO_ENTREGA_FORNECEDOR
+    (ou PRAZO_ENTREGA_PADRAO) e o histórico entra só no desvio: o coeficiente de variação
+    dos intervalos (até 1) aplicado ao prazo.
+    """
+    prazos = Config.PRAZO_ENTREGA_FORNECEDOR if prazos is None else prazos
+    df = df_entregas.sort_values(['fornecedor', 'medicamento_id', 'data_entrada'])
+    intervalos = df.groupby(['fornecedor', 'medicamento_id'])['data_entrada'].diff().dt.total_seconds() / 86400
+    # Lotes do mesmo dia (um pedido em vários lotes) não dizem nada sobre a regularidade
+    intervalos = intervalos[intervalos >= 1]
+    historico = intervalos.groupby(df.loc[intervalos.index, 'fornecedor']).agg(
+        intervalo_mediano='median', intervalo_desvio='std', entregas='count')
+
+    fornecedores = historico.index.union(pd.Index(list(prazos), dtype=object)).union([SEM_FORNECEDOR])
+    resultado = historico.reindex(fornecedores)
+    resultado['prazo_entrega'] = pd.Series(prazos, dtype=float).reindex(fornecedores)
+    resultado['prazo_origem'] = np.where(resultado['prazo_entrega'].notna(), "Configurado", "Padrão")
+    resultado['prazo_entrega'] = resultado['prazo_entrega'].fillna(Config.PRAZO_ENTREGA_PADRAO)
+    variacao = (resultado['intervalo_desvio'] / resultado['intervalo_mediano']).fillna(0.0).clip(0, 1)
+    resultado['prazo_desvio'] = resultado['prazo_entrega'] * variacao
+    resultado['entregas'] = resultado['entregas'].fillna(0).astype(int)
+    resultado.index.name = 'fornecedor'
+    return resultado
+
+def plan_replenishment(df_previsoes, df_entregas, nivel_servico=None, dias_cobertura=None, prazos=None):
+    """Estoque de segurança, ponto de pedido e quantidade a comprar de cada medicamento previsto"""
+    nivel_servico = nivel_servico or Config.NIVEL_SERVICO
+    dias_cobertura = dias_cobertura or Config.ESTOQUE_SUGERIDO_DIAS
+    z = NormalDist().inv_cdf(nivel_servico)
+
+    # Fornecedor e preço do lote mais recente de cada medicamento
+    ultimo = (df_entregas.sort_values('data_entrada')
+              .groupby('medicamento_id')[['fornecedor', 'preco_unitario']].last())
+    plano = (df_previsoes[['id', 'medicamento', 'estoque_atual', 'consumo_medio_diario', 'desvio_padrao']]
+             .merge(ultimo, left_on='id', right_index=True, how='left')
+             .fillna({'fornecedor': SEM_FORNECEDOR})
+             .merge(supplier_lead_times(df_entregas, prazos)[['prazo_entrega', 'prazo_origem', 'prazo_desvio']],
+                    left_on='fornecedor', right_index=True, how='left'))
+
+    demanda = plano['consumo_medio_diario'].to_numpy()
+    desvio = plano['desvio_padrao'].fillna(0.0).to_numpy()
+    prazo = plano['prazo_entrega'].to_numpy()
+    prazo_desvio = plano['prazo_desvio'].to_numpy()
+    estoque = plano['estoque_atual'].to_numpy()
+
+    # Incerteza da demanda durante o prazo e do próprio prazo
+    seguranca = z * np.sqrt(prazo * desvio ** 2 + demanda ** 2 * prazo_desvio ** 2)
+    ponto_pedido = demanda * prazo + seguranca
+    alvo = demanda * (prazo + dias_cobertura) + seguranca
+    plano['estoque_seguranca'] = np.ceil(seguranca)
+    plano['ponto_pedido'] = np.ceil(ponto_pedido)
+    plano['quantidade_sugerida'] = np.where(estoque <= ponto_pedido, np.ceil(np.maximum(alvo - estoque, 0)), 0.0)
+    plano['valor_estimado'] = plano['quantidade_sugerida'] * plano['preco_unitario'].fillna(0.0)
+
+    return plano.sort_values(['fornecedor', 'medicamento'], ignore_index=True)
+
+def purchase_list(plano):
+    """(itens a comprar agrupados por fornecedor, totais por fornecedor)"""
+    itens = plano.loc[plano['quantidade_sugerida'] > 0, [
+        'fornecedor', 'medicamento', 'estoque_atual', 'ponto_pedido', 'quantidade_sugerida',
+        'preco_unitario', 'valor_estimado', 'prazo_entrega', 'prazo_origem'
+    ]].reset_index(drop=True)
+    totais = itens.groupby('fornecedor').agg(
+        itens=('medicamento', 'count'),
+        unidades=('quantidade_sugerida', 'sum'),
+        valor_estimado=('valor_estimado', 'sum'),
+        prazo_entrega=('prazo_entrega', 'max'),
+    ).sort_values('valor_estimado', ascending=False)
+    return itens, totais
+
+# Multiplicadores do consumo previsto avaliados pelo simulador de cenários
+MULTIPLICADORES_CENARIO = np.round(np.arange(0.1, 3.0 + 1e-9, 0.05), 2)
+
+def scenario_curves(plano, hoje=None, multiplicadores=MULTIPLICADORES_CENARIO):
+    """Dias até acabar, data de ruptura e data limite do pedido de todo o plano, indexados por (id, multiplicador)"""
+    hoje = pd.Timestamp(hoje or pd.Timestamp.now(tz='UTC').date())
+    estoque = plano['estoque_atual'].to_numpy(dtype=float)[:, None]
+    taxa = plano['consumo_medio_diario'].to_numpy()[:, None] * multiplicadores
+    dias_restantes = estoque / taxa
+    # O pedido precisa sair antes de o estoque acima da segurança cobrir só o prazo de entrega
+    dias_ate_pedido = ((estoque - plano['estoque_seguranca'].to_numpy()[:, None]) / taxa
+                       - plano['prazo_entrega'].to_numpy()[:, None])
+    return pd.DataFrame({
+        'consumo_diario': taxa.ravel(),
+        'dias_restantes': dias_restantes.ravel(),
+        'data_ruptura': hoje + pd.to_timedelta(np.floor(dias_restantes.ravel()), unit='D'),
+        'dias_ate_pedido': dias_ate_pedido.ravel(),
+        'data_pedido': hoje + pd.to_timedelta(np.floor(np.maximum(dias_ate_pedido.ravel(), 0)), unit='D'),
+    }, index=pd.MultiIndex.from_product([plano['id'], multiplicadores], names=['id', 'multiplicador']))
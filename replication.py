@@ -0,0 +1,287 @@
+"""
+🏥 MedStock360 - Replicação do WAL
+Envio contínuo dos quadros do WAL para uma réplica em espera e restauração em um ponto no tempo
+Versão: 3.0 Advanced
+"""
+
+import glob
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+from config import Config, get_standby_path
+
+# Formato do WAL: cabeçalho de 32 bytes e quadros de 24 bytes + uma página
+WAL_HEADER = 32
+FRAME_HEADER = 24
+FORMATO_DATA = "%Y%m%d_%H%M%S_%f"
+
+class ReplicationGap(Exception):
+    """Quadros do WAL reaproveitados antes de serem enviados: exige uma nova geração"""
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def _write_atomic(caminho, dados):
+    """Gravar compactado em .tmp, fsync e renomear: a réplica nunca vê arquivo pela metade"""
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as bruto:
+        with gzip.GzipFile(fileobj=bruto, mode="wb", compresslevel=1) as saida:
+            saida.write(dados)
+        bruto.flush()
+        os.fsync(bruto.fileno())
+    os.replace(temporario, caminho)
+
+def _read_wal_header(wal_path):
+    """(tamanho da página, sequência de checkpoint, salt) do WAL, ou None se vazio"""
+    try:
+        with open(wal_path, "rb") as wal:
+            cabecalho = wal.read(WAL_HEADER)
+    except FileNotFoundError:
+        return None
+    if len(cabecalho) < WAL_HEADER:
+        return None
+    _, _, pagina, sequencia = struct.unpack(">IIII", cabecalho[:16])
+    return pagina, sequencia, cabecalho[16:24]
+
+# ==========================================
+# ENVIO CONTÍNUO
+# ==========================================
+
+class WalReplicator:
+    """Thread que copia para o standby os quadros novos do WAL a cada REPLICATION_INTERVAL segundos
+
+    O replicador é o único a fazer checkpoint (o pool deve ser criado com auto_checkpoint=False):
+    o SQLite só reinicia o WAL depois de um checkpoint completo, e o checkpoint do replicador
+    nunca passa do último quadro enviado.
+    """
+
+    def __init__(self, pool, pasta=None, intervalo=None):
+        self.pool = pool
+        self.wal_path = pool.db_path + "-wal"
+        self.pasta = pasta or get_standby_path()
+        self.intervalo = intervalo or Config.REPLICATION_INTERVAL
+        self._parar = threading.Event()
+        self._thread = None
+        self._leitor = None
+        self._geracao = None
+        self._sequencia = None
+        self._salt = None
+        self._enviados = 0
+        self._segmento = 0
+        self._stats = {'geracoes': 0, 'segmentos': 0, 'quadros': 0, 'bytes': 0,
+                       'ultimo_envio': None, 'ultimo_erro': None}
+
+    def _open(self):
+        conn = sqlite3.connect(self.pool.db_path, timeout=Config.DB_BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute("PRAGMA wal_autocheckpoint = 0")
+        return conn
+
+    def _committed_frames(self):
+        """Quadros confirmados no WAL, após um checkpoint PASSIVE que não espera ninguém"""
+        _, quadros, _ = self._leitor.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        return max(quadros, 0)
+
+    def _ship(self):
+        """Enviar os quadros confirmados ainda não enviados; retorna quantos foram enviados"""
+        # Uma leitura aberta impede o SQLite de reiniciar o WAL enquanto os quadros são lidos
+        instantaneo = self._open()
+        try:
+            instantaneo.execute("BEGIN")
+            instantaneo.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+            cabecalho = _read_wal_header(self.wal_path)
+            quadros = self._committed_frames()
+            if cabecalho is None or quadros == 0:
+                return 0
+
+            pagina, sequencia, salt = cabecalho
+            if salt != self._salt:
+                # Reinício do WAL: legítimo só se for o seguinte ao que estava sendo enviado
+                if self._salt is not None and sequencia != self._sequencia + 1:
+                    raise ReplicationGap(f"WAL reiniciado de {self._sequencia} para {sequencia}")
+                self._sequencia, self._salt, self._enviados = sequencia, salt, 0
+            if quadros <= self._enviados:
+                return 0
+
+            tamanho_quadro = FRAME_HEADER + pagina
+            with open(self.wal_path, "rb") as wal:
+                wal.seek(WAL_HEADER + self._enviados * tamanho_quadro)
+                dados = wal.read((quadros - self._enviados) * tamanho_quadro)
+            # WAL já todo no banco pode reiniciar durante a leitura: descarta e tenta no próximo ciclo
+            if _read_wal_header(self.wal_path) != cabecalho:
+                return 0
+        finally:
+            instantaneo.close()
+
+        # Só transações completas: corta no último quadro de commit
+        fim = 0
+        for posicao in range(0, len(dados) - tamanho_quadro + 1, tamanho_quadro):
+            if dados[posicao + 8:posicao + 16] != salt:
+                raise ReplicationGap("Quadro do WAL com salt diferente do cabeçalho")
+            if struct.unpack(">I", dados[posicao + 4:posicao + 8])[0]:
+                fim = posicao + tamanho_quadro
+        if fim == 0:
+            return 0
+
+        self._segmento += 1
+        nome = f"{self._segmento:08d}_{_now():{FORMATO_DATA}}.wal.gz"
+        _write_atomic(os.path.join(self._geracao, "wal", nome), dados[:fim])
+        enviados = fim // tamanho_quadro
+        self._enviados += enviados
+        self._stats['segmentos'] += 1
+        self._stats['quadros'] += enviados
+        self._stats['bytes'] += fim
+        self._stats['ultimo_envio'] = _now().isoformat(timespec="seconds")
+        return enviados
+
+    def _new_generation(self):
+        """Cópia base do banco na posição atual do WAL, com os escritores do processo parados"""
+        inicio = _now()
+        geracao = os.path.join(self.pasta, f"{inicio:{FORMATO_DATA}}")
+        os.makedirs(os.path.join(geracao, "wal"), exist_ok=True)
+        base = os.path.join(geracao, "base.db")
+
+        with self.pool.writer() as conn:
+            copia = sqlite3.connect(base)
+            conn.backup(copia)
+            copia.close()
+            quadros = self._committed_frames()
+            cabecalho = _read_wal_header(self.wal_path)
+
+        with open(base, "rb") as entrada:
+            _write_atomic(base + ".gz", entrada.read())
+        os.remove(base)
+
+        self._geracao = geracao
+        self._segmento = 0
+        if cabecalho is None or quadros == 0:
+            self._sequencia, self._salt, self._enviados = None, None, 0
+        else:
+            _, self._sequencia, self._salt = cabecalho
+            self._enviados = quadros
+        with open(os.path.join(geracao, "geracao.json"), "w", encoding="utf-8") as arquivo:
+            json.dump({'inicio': inicio.isoformat(), 'banco': os.path.abspath(self.pool.db_path)}, arquivo)
+        self._stats['geracoes'] += 1
+        prune_generations(self.pasta, manter=geracao)
+
+    def _loop(self):
+        self._leitor = self._open()
+        while not self._parar.is_set():
+            try:
+                if self._geracao is None:
+                    self._new_generation()
+                self._ship()
+            except (ReplicationGap, sqlite3.Error, OSError) as erro:
+                # Envio interrompido após o checkpoint pode deixar quadros sem cópia: recomeça do zero
+                self._stats['ultimo_erro'] = str(erro)
+                self._geracao = None
+            self._parar.wait(self.intervalo)
+        self._leitor.close()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name="replicacao-wal", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, envio_final=True):
+        """Parar a thread; por padrão envia o que falta antes de sair"""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        if envio_final and self._geracao is not None:
+            self._leitor = self._open()
+            self._ship()
+            self._leitor.close()
+
+    def stats(self):
+        estatisticas = dict(self._stats)
+        estatisticas['ativo'] = self._thread is not None and self._thread.is_alive()
+        estatisticas['geracao'] = os.path.basename(self._geracao) if self._geracao else None
+        return estatisticas
+
+def prune_generations(pasta=None, retencao_dias=None, manter=None):
+    """Remover gerações sem envios há mais que a retenção de backups"""
+    limite = (_now() - timedelta(days=retencao_dias or Config.BACKUP_RETENTION_DAYS)).timestamp()
+    for geracao in list_generations(pasta):
+        if geracao == manter:
+            continue
+        arquivos = glob.glob(os.path.join(geracao, "**", "*.gz"), recursive=True)
+        if max((os.path.getmtime(a) for a in arquivos), default=0) < limite:
+            shutil.rmtree(geracao)
+
+# ==========================================
+# RESTAURAÇÃO EM UM PONTO NO TEMPO
+# ==========================================
+
+def list_generations(pasta=None):
+    """Gerações completas (com cópia base), da mais antiga para a mais recente"""
+    pasta = pasta or get_standby_path()
+    return sorted(os.path.dirname(base) for base in glob.glob(os.path.join(pasta, "*", "base.db.gz")))
+
+def _segment_time(segmento):
+    return datetime.strptime(os.path.basename(segmento).split("_", 1)[1][:-len(".wal.gz")],
+                             FORMATO_DATA).replace(tzinfo=timezone.utc)
+
+def restore(destino, ate=None, pasta=None):
+    """Reconstruir em `destino` o banco como estava em `ate` (UTC; None = último envio)"""
+    ate = ate or _now()
+    geracoes = [g for g in list_generations(pasta)
+                if datetime.strptime(os.path.basename(g), FORMATO_DATA).replace(tzinfo=timezone.utc) <= ate]
+    if not geracoes:
+        raise FileNotFoundError(f"Nenhuma geração da réplica anterior a {ate.isoformat()}")
+    geracao = geracoes[-1]
+
+    for sufixo in ("-wal", "-shm"):
+        if os.path.exists(destino + sufixo):
+            os.remove(destino + sufixo)
+    with gzip.open(os.path.join(geracao, "base.db.gz"), "rb") as entrada, open(destino, "wb") as saida:
+        shutil.copyfileobj(entrada, saida, length=1024 * 1024)
+
+    segmentos = [s for s in sorted(glob.glob(os.path.join(geracao, "wal", "*.wal.gz"))) if _segment_time(s) <= ate]
+    with open(destino, "r+b") as banco:
+        pagina = struct.unpack(">H", banco.read(18)[16:18])[0]
+        pagina = 65536 if pagina == 1 else pagina
+        tamanho_quadro = FRAME_HEADER + pagina
+        # Cada segmento termina em um commit: aplicar em ordem reproduz as transações
+        for segmento in segmentos:
+            with gzip.open(segmento, "rb") as arquivo:
+                dados = arquivo.read()
+            for posicao in range(0, len(dados), tamanho_quadro):
+                numero, paginas_apos_commit = struct.unpack(">II", dados[posicao:posicao + 8])
+                banco.seek((numero - 1) * pagina)
+                banco.write(dados[posicao + FRAME_HEADER:posicao + tamanho_quadro])
+                if paginas_apos_commit:
+                    banco.truncate(paginas_apos_commit * pagina)
+        banco.flush()
+        os.fsync(banco.fileno())
+
+    conn = sqlite3.connect(destino)
+    integridade = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    conn.close()
+    return {'geracao': os.path.basename(geracao), 'segmentos': len(segmentos),
+            'ultimo_segmento': _segment_time(segmentos[-1]).isoformat() if segmentos else None,
+            'integridade': integridade}
+
+# ==========================================
+# LINHA DE COMANDO
+# ==========================================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "restaurar":
+        print("Uso: python replication.py restaurar destino.db [AAAA-MM-DDTHH:MM:SS em UTC]")
+        for geracao in list_generations():
+            print(f"   {os.path.basename(geracao)}: {len(glob.glob(os.path.join(geracao, 'wal', '*.wal.gz')))} segmentos")
+        sys.exit(2)
+
+    ate = datetime.fromisoformat(sys.argv[3]).replace(tzinfo=timezone.utc) if len(sys.argv) > 3 else None
+    resultado = restore(sys.argv[2], ate)
+    print(f"✅ {sys.argv[2]} reconstruído da geração {resultado['geracao']} com {resultado['segmentos']} "
+          f"segmentos do WAL (até {resultado['ultimo_segmento']}); integridade: {resultado['integridade']}")
@@ -0,0 +1,300 @@
+"""
+🏥 MedStock360 - Leitura de Códigos de Barras
+Índice em memória código → medicamento/lote e sessões de leitura gravadas em micro-lotes
+Versão: 3.0 Advanced
+"""
+
+import calendar
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timezone
+
+from config import Config
+from dispensing import allocate_fefo
+from stock import InsufficientStockError, decrement_lot, run_immediate
+
+# Separador de campos GS1 (FNC1) enviado pelos leitores em modo teclado
+GS = "\x1d"
+
+class ScanError(Exception):
+    """Leitura que não pôde ser resolvida para um medicamento ou lote"""
+
+def _gs1_date(valor):
+    """Data GS1 AAMMDD; dia 00 significa o último dia do mês"""
+    ano, mes, dia = 2000 + int(valor[:2]), int(valor[2:4]), int(valor[4:6])
+    return date(ano, mes, dia or calendar.monthrange(ano, mes)[1])
+
+def parse_scan(leitura):
+    """(código, lote, validade) de uma leitura: GS1 com AIs 01/17/10 ou código de barras simples"""
+    leitura = leitura.strip()
+    # Identificador de simbologia (ex: "]d2" do DataMatrix) não faz parte do código
+    if leitura.startswith("]"):
+        leitura = leitura[3:]
+
+    if not (len(leitura) >= 16 and leitura.startswith("01") and leitura[2:16].isdigit()):
+        return leitura, None, None
+
+    codigo, lote, validade = leitura[2:16], None, None
+    posicao = 16
+    while posicao < len(leitura):
+        if leitura[posicao] == GS:
+            posicao += 1
+            continue
+        ai = leitura[posicao:posicao + 2]
+        if ai in ("11", "15", "17"):
+            if ai == "17":
+                validade = _gs1_date(leitura[posicao + 2:posicao + 8])
+            posicao += 8
+        elif ai in ("10", "21"):
+            # Campos variáveis terminam no separador GS ou no fim da leitura
+            fim = leitura.find(GS, posicao + 2)
+            fim = len(leitura) if fim == -1 else fim
+            if ai == "10":
+                lote = leitura[posicao + 2:fim]
+            posicao = fim
+        else:
+            break
+    return codigo, lote, validade
+
+# ==========================================
+# ÍNDICE EM MEMÓRIA
+# ==========================================
+
+class BarcodeIndex:
+    """Dicionários código de barras → medicamento e (medicamento, lote) → (lote, validade), compartilhados"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._medicamentos = None
+        self._lotes = None
+        self._stats = {'acertos': 0, 'falhas': 0, 'invalidacoes': 0}
+
+    def _load_medicines(self, conn):
+        medicamentos = {}
+        for med_id, nome, codigo in conn.execute("""
+            SELECT id, nome, codigo_barras FROM medicamentos
+            WHERE ativo = 1 AND codigo_barras IS NOT NULL AND codigo_barras <> ''
+        """):
+            medicamentos[codigo.strip()] = (med_id, nome)
+        self._medicamentos = medicamentos
+
+    def _load_lots(self, conn):
+        self._lotes = {
+            (med_id, numero_lote): (lote_id, validade)
+            for lote_id, med_id, numero_lote, validade in conn.execute(
+                "SELECT id, medicamento_id, numero_lote, data_validade FROM lotes WHERE ativo = 1"
+            )
+        }
+
+    def medicine(self, conn, codigo):
+        """(id, nome) do medicamento do código; GTIN-14 também casa com o EAN-13 sem o zero inicial"""
+        candidatos = [codigo, codigo[1:]] if len(codigo) == 14 and codigo.startswith("0") else [codigo]
+        with self._lock:
+            if self._medicamentos is None:
+                self._load_medicines(conn)
+            for candidato in candidatos:
+                if candidato in self._medicamentos:
+                    self._stats['acertos'] += 1
+                    return self._medicamentos[candidato]
+            self._stats['falhas'] += 1
+
+        # Medicamento cadastrado por outro processo: busca pelo índice do código de barras
+        for candidato in candidatos:
+            row = conn.execute(
+                "SELECT id, nome FROM medicamentos WHERE codigo_barras = ? AND ativo = 1", (candidato,)
+            ).fetchone()
+            if row:
+                with self._lock:
+                    # O índice pode ter sido invalidado enquanto a consulta rodava
+                    if self._medicamentos is not None:
+                        self._medicamentos[candidato] = tuple(row)
+                return tuple(row)
+        return None
+
+    def lot(self, conn, medicamento_id, numero_lote):
+        """(id, validade) do lote ativo do medicamento com o número informado, ou None"""
+        with self._lock:
+            if self._lotes is None:
+                self._load_lots(conn)
+            lote = self._lotes.get((medicamento_id, numero_lote))
+        if lote is not None:
+            return lote
+
+        row = conn.execute(
+            "SELECT id, data_validade FROM lotes WHERE medicamento_id = ? AND numero_lote = ? AND ativo = 1",
+            (medicamento_id, numero_lote)
+        ).fetchone()
+        if row:
+            self.add_lot(medicamento_id, numero_lote, *row)
+            return tuple(row)
+        return None
+
+    def add_lot(self, medicamento_id, numero_lote, lote_id, validade):
+        with self._lock:
+            if self._lotes is not None:
+                self._lotes[(medicamento_id, numero_lote)] = (lote_id, validade)
+
+    def invalidate(self):
+        """Descartar os dicionários (após cadastrar ou editar medicamentos)"""
+        with self._lock:
+            self._medicamentos = None
+            self._lotes = None
+            self._stats['invalidacoes'] += 1
+
+    def invalidate_lots(self):
+        """Descartar só o dicionário de lotes (após desativar, excluir ou gravar lotes)"""
+        with self._lock:
+            self._lotes = None
+
+    def stats(self):
+        with self._lock:
+            estatisticas = dict(self._stats)
+            estatisticas['codigos'] = len(self._medicamentos or {})
+            estatisticas['lotes'] = len(self._lotes or {})
+        return estatisticas
+
+# ==========================================
+# SESSÃO DE LEITURA
+# ==========================================
+
+MODOS = ("Recebimento", "Separação")
+
+class ScanSession:
+    """Leituras de um operador acumuladas em memória e gravadas em micro-lotes"""
+
+    def __init__(self, indice, modo, responsavel, tamanho=None, intervalo=None):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de leitura inválido: {modo}")
+        self.indice = indice
+        self.modo = modo
+        self.responsavel = responsavel
+        self.tamanho = tamanho or Config.SCAN_BATCH_SIZE
+        self.intervalo = intervalo or Config.SCAN_FLUSH_SECONDS
+        self.pendentes = []
+        self.recusadas = []
+        self.gravadas = 0
+        self._primeira_pendente = None
+
+    def scan(self, conn, leitura, hoje=None):
+        """Resolver a leitura pelo índice e acumulá-la; retorna o item lido"""
+        hoje = (hoje or datetime.now(timezone.utc).date()).isoformat()
+        codigo, numero_lote, validade = parse_scan(leitura)
+        medicamento = self.indice.medicine(conn, codigo)
+        if medicamento is None:
+            raise ScanError(f"Código {codigo} não corresponde a nenhum medicamento ativo")
+
+        medicamento_id, nome = medicamento
+        lote = self.indice.lot(conn, medicamento_id, numero_lote) if numero_lote else None
+        lote_id, validade_lote = lote or (None, None)
+        if self.modo == "Recebimento" and lote_id is None and (numero_lote is None or validade is None):
+            raise ScanError(f"{nome}: o recebimento exige código GS1 com lote e validade")
+
+        # Validade do código (AI 17) ou do lote cadastrado: o recebimento exige data futura, como
+        # receiving.validate_chunk, e a separação recusa lotes vencidos, como a alocação FEFO
+        datas = [d for d in (validade.isoformat() if validade else None, validade_lote) if d]
+        if datas:
+            vencimento = min(datas)
+            rotulo = f"lote {numero_lote}" if numero_lote else "produto"
+            if self.modo == "Recebimento" and vencimento <= hoje:
+                raise ScanError(f"{nome}: {rotulo} com validade {vencimento}; a validade deve ser futura")
+            if self.modo == "Separação" and vencimento < hoje:
+                raise ScanError(f"{nome}: {rotulo} vencido em {vencimento}")
+
+        item = {'medicamento_id': medicamento_id, 'medicamento': nome, 'numero_lote': numero_lote,
+                'data_validade': validade.isoformat() if validade else None, 'lote_id': lote_id}
+        if not self.pendentes:
+            self._primeira_pendente = time.monotonic()
+        self.pendentes.append(item)
+        return item
+
+    def should_flush(self):
+        """Micro-lote cheio ou leitura pendente há mais que o intervalo"""
+        if not self.pendentes:
+            return False
+        return len(self.pendentes) >= self.tamanho or time.monotonic() - self._primeira_pendente >= self.intervalo
+
+    @staticmethod
+    def _key(item):
+        return (item['medicamento_id'], item['numero_lote'], item['data_validade'], item['lote_id'])
+
+    def _grouped(self):
+        grupos = {}
+        for item in self.pendentes:
+            chave = self._key(item)
+            grupos[chave] = grupos.get(chave, 0) + 1
+        return grupos
+
+    def _write_receiving(self, conn, chave, quantidade):
+        medicamento_id, numero_lote, validade, lote_id = chave
+        novo = lote_id is None
+        if novo:
+            lote_id = conn.execute("""
+                INSERT INTO lotes (medicamento_id, numero_lote, data_validade, quantidade_inicial,
+                                   quantidade_atual, responsavel_entrada)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (medicamento_id, numero_lote, validade, quantidade, quantidade, self.responsavel)).lastrowid
+        else:
+            atualizados = conn.execute("""
+                UPDATE lotes SET quantidade_atual = quantidade_atual + ?, quantidade_inicial = quantidade_inicial + ?
+                WHERE id = ? AND ativo = 1
+            """, (quantidade, quantidade, lote_id)).rowcount
+            # Lote desativado ou excluído depois de entrar no índice
+            if atualizados == 0:
+                raise ScanError(f"Lote #{lote_id} não está mais ativo")
+        conn.execute("""
+            INSERT INTO movimentacoes (lote_id, tipo_movimento, quantidade, motivo, responsavel)
+            VALUES (?, 'Entrada', ?, 'Recebimento por leitura de código de barras', ?)
+        """, (lote_id, quantidade, self.responsavel))
+        if novo:
+            self.indice.add_lot(medicamento_id, numero_lote, lote_id, validade)
+
+    def _write_picking(self, conn, chave, quantidade):
+        medicamento_id, _, _, lote_id = chave
+        if lote_id is not None:
+            baixas = [(lote_id, quantidade)]
+        else:
+            # Código sem lote: separa pelo lote que vence primeiro
+            alocacoes, restante = allocate_fefo(conn, medicamento_id, quantidade)
+            if restante > 0:
+                raise InsufficientStockError(f"Medicamento #{medicamento_id} sem saldo para {quantidade} unidades")
+            baixas = [(lote['lote_id'], lote['quantidade']) for lote in alocacoes]
+        for baixa_lote, baixa_quantidade in baixas:
+            decrement_lot(conn, baixa_lote, baixa_quantidade)
+            conn.execute("""
+                INSERT INTO movimentacoes (lote_id, tipo_movimento, quantidade, motivo, responsavel)
+                VALUES (?, 'Saída', ?, 'Separação por leitura de código de barras', ?)
+            """, (baixa_lote, baixa_quantidade, self.responsavel))
+
+    def _write(self, conn):
+        """Gravar cada grupo em um savepoint; um grupo recusado é desfeito sem derrubar os demais"""
+        escrita = self._write_receiving if self.modo == "Recebimento" else self._write_picking
+        recusados = {}
+        for chave, quantidade in self._grouped().items():
+            conn.execute("SAVEPOINT leitura")
+            try:
+                escrita(conn, chave, quantidade)
+            except (InsufficientStockError, ScanError, sqlite3.IntegrityError) as erro:
+                conn.execute("ROLLBACK TO leitura")
+                recusados[chave] = str(erro)
+            conn.execute("RELEASE leitura")
+        return recusados
+
+    def flush(self, conn):
+        """Gravar as leituras pendentes em uma transação; retorna quantas foram gravadas"""
+        if not self.pendentes:
+            return 0
+        recusados = run_immediate(conn, self._write)
+
+        # Leituras recusadas (lote sem saldo, por exemplo) saem das pendentes com o motivo,
+        # para não travar as próximas gravações
+        self.recusadas = [dict(item, erro=recusados[self._key(item)])
+                          for item in self.pendentes if self._key(item) in recusados]
+        gravadas = len(self.pendentes) - len(self.recusadas)
+        self.gravadas += gravadas
+        self.pendentes = []
+        return gravadas
+
+    def discard(self):
+        """Descartar as leituras pendentes sem gravar"""
+        self.pendentes = []
@@ -0,0 +1,111 @@
+"""
+🏥 MedStock360 - Busca
+Busca por texto completo (FTS5) em medicamentos e pacientes, sem acentos e por prefixo
+Versão: 3.0 Advanced
+"""
+
+import random
+import re
+import sqlite3
+import sys
+import time
+
+# Pontuação entre dígitos (CPF, código de barras) é removida: "123.456-7" vira "1234567"
+_SEPARADOR_NUMERICO = re.compile(r"(?<=\d)[.\-/](?=\d)")
+_TERMO = re.compile(r"\w+", re.UNICODE)
+
+# Subconsultas ordenadas por relevância (bm25); o parâmetro é a expressão de fts_query()
+BUSCA_MEDICAMENTOS = "SELECT rowid AS id, rank FROM medicamentos_fts WHERE medicamentos_fts MATCH ?"
+BUSCA_PACIENTES = "SELECT rowid AS id, rank FROM pacientes_fts WHERE pacientes_fts MATCH ?"
+
+def fts_query(texto):
+    """Converter o texto digitado em uma expressão FTS5 de prefixos (None se vazio)"""
+    termos = _TERMO.findall(_SEPARADOR_NUMERICO.sub("", texto or ""))
+    if not termos:
+        return None
+    # Cada termo entre aspas evita que a entrada do usuário vire sintaxe FTS5
+    return " ".join(f'"{termo}"*' for termo in termos)
+
+def search_medicines(conn, texto, limite=50):
+    """IDs de medicamentos que casam com o texto, do mais relevante ao menos relevante"""
+    expressao = fts_query(texto)
+    if expressao is None:
+        return []
+    rows = conn.execute(f"{BUSCA_MEDICAMENTOS} ORDER BY rank LIMIT ?", (expressao, limite))
+    return [row[0] for row in rows]
+
+def search_patients(conn, texto, limite=50):
+    """IDs de pacientes que casam com o texto, do mais relevante ao menos relevante"""
+    expressao = fts_query(texto)
+    if expressao is None:
+        return []
+    rows = conn.execute(f"{BUSCA_PACIENTES} ORDER BY rank LIMIT ?", (expressao, limite))
+    return [row[0] for row in rows]
+
+# ==========================================
+# BENCHMARK: FTS5 x LIKE
+# ==========================================
+
+_NOMES = ["Dipirona Sódica", "Paracetamol", "Amoxicilina", "Ibuprofeno", "Losartana Potássica",
+          "Omeprazol", "Metformina", "Captopril", "Ácido Acetilsalicílico", "Cefalexina"]
+_FABRICANTES = ["Medley", "EMS", "Neo Química", "Eurofarma", "Aché", "Sanofi"]
+_PESSOAS = ["José", "João", "Maria", "Antônio", "Conceição", "Sebastião", "Luíza", "André"]
+_SOBRENOMES = ["Conceição", "Gonçalves", "Araújo", "Simões", "Magalhães", "Brandão", "Pereira"]
+_CIDADES = ["São Paulo", "Belém", "Maceió", "Goiânia", "Florianópolis", "Ribeirão Preto"]
+
+def _populate(conn, total):
+    rnd = random.Random(42)
+    conn.executemany(
+        "INSERT INTO medicamentos (nome, principio_ativo, fabricante, codigo_barras) VALUES (?, ?, ?, ?)",
+        ((f"{rnd.choice(_NOMES)} {rnd.choice([250, 500, 750])}mg {i}", rnd.choice(_NOMES),
+          rnd.choice(_FABRICANTES), f"789{i:010d}") for i in range(total))
+    )
+    conn.executemany(
+        "INSERT INTO pacientes (nome_completo, cpf, cidade) VALUES (?, ?, ?)",
+        ((f"{rnd.choice(_PESSOAS)} {rnd.choice(_SOBRENOMES)} {rnd.choice(_SOBRENOMES)} {i}",
+          f"{i:03d}.{rnd.randrange(1000):03d}.{rnd.randrange(1000):03d}-{rnd.randrange(100):02d}",
+          rnd.choice(_CIDADES)) for i in range(total))
+    )
+    conn.commit()
+
+def _tempo(func, repeticoes=5):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = func()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+def run_benchmark(total=100_000):
+    """Comparar busca por LIKE com FTS5 em um banco em memória com `total` linhas por tabela"""
+    from migrations import create_base_tables
+
+    conn = sqlite3.connect(":memory:")
+    create_base_tables(conn)
+    _populate(conn, total)
+
+    casos = [
+        ("medicamentos", "dipirona sodica",
+         "SELECT id FROM medicamentos WHERE nome LIKE ? OR principio_ativo LIKE ?", 2,
+         BUSCA_MEDICAMENTOS + " ORDER BY rank LIMIT 50"),
+        ("medicamentos", "Amoxi",
+         "SELECT id FROM medicamentos WHERE nome LIKE ? OR principio_ativo LIKE ?", 2,
+         BUSCA_MEDICAMENTOS + " ORDER BY rank LIMIT 50"),
+        ("pacientes", "sebastiao goncalves",
+         "SELECT id FROM pacientes WHERE nome_completo LIKE ? OR cpf LIKE ?", 2,
+         BUSCA_PACIENTES + " ORDER BY rank LIMIT 50"),
+        ("pacientes", "123.45",
+         "SELECT id FROM pacientes WHERE nome_completo LIKE ? OR cpf LIKE ?", 2,
+         BUSCA_PACIENTES + " ORDER BY rank LIMIT 50"),
+    ]
+
+    print(f"Benchmark de busca com {total:,} linhas por tabela")
+    print(f"{'tabela':<14}{'termo':<22}{'LIKE (ms)':>11}{'achados':>9}{'FTS5 (ms)':>11}{'achados':>9}")
+    for tabela, termo, sql_like, n_params, sql_fts in casos:
+        padrao = f"%{termo}%"
+        ms_like, rows_like = _tempo(lambda: conn.execute(sql_like, (padrao,) * n_params).fetchall())
+        ms_fts, rows_fts = _tempo(lambda: conn.execute(sql_fts, (fts_query(termo),)).fetchall())
+        print(f"{tabela:<14}{termo:<22}{ms_like:>11.2f}{len(rows_like):>9}{ms_fts:>11.2f}{len(rows_fts):>9}")
+
+    conn.close()
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
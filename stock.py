@@ -0,0 +1,143 @@
+"""
+🏥 MedStock360 - Estoque
+Baixas atômicas de estoque e manutenção do resumo materializado (estoque_resumo)
+Versão: 3.0 Advanced
+"""
+
+import random
+import sqlite3
+import sys
+import time
+
+from config import Config
+from queries import QUERY_ESTOQUE_RESUMO_CALCULADO, ESTOQUE_RESUMO_COLUNAS
+
+# ==========================================
+# BAIXAS ATÔMICAS
+# ==========================================
+
+class InsufficientStockError(Exception):
+    """Lote inativo, inexistente ou sem saldo para a quantidade pedida"""
+
+# Baixa condicional: verifica o saldo e decrementa no mesmo comando, sem janela
+# entre leitura e escrita para outro operador consumir o mesmo lote
+SQL_BAIXA_LOTE = """
+    UPDATE lotes SET quantidade_atual = quantidade_atual - ?
+    WHERE id = ? AND ativo = 1 AND quantidade_atual >= ?
+"""
+
+def _is_busy(erro):
+    """Erro de banco ocupado/travado por outro escritor"""
+    codigo = getattr(erro, "sqlite_errorcode", None)
+    if codigo is not None:
+        return codigo in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(erro) or "busy" in str(erro)
+
+def run_immediate(conn, operacao, tentativas=None, espera=None):
+    """Executar operacao(conn) em BEGIN IMMEDIATE, repetindo com espera exponencial se ocupado"""
+    tentativas = tentativas or Config.MAX_DB_RETRIES
+    espera = espera or Config.DB_RETRY_BACKOFF
+
+    for tentativa in range(tentativas):
+        ultima = tentativa == tentativas - 1
+        try:
+            # IMMEDIATE reserva a escrita já no início: a transação não falha no meio
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as erro:
+            if not _is_busy(erro) or ultima:
+                raise
+        else:
+            try:
+                resultado = operacao(conn)
+                conn.commit()
+                return resultado
+            except sqlite3.OperationalError as erro:
+                conn.rollback()
+                if not _is_busy(erro) or ultima:
+                    raise
+            except Exception:
+                conn.rollback()
+                raise
+        # Jitter evita que os escritores em espera tentem todos ao mesmo tempo
+        time.sleep(espera * (2 ** tentativa) * random.uniform(0.5, 1.5))
+
+def decrement_lot(conn, lote_id, quantidade):
+    """Baixar a quantidade de um lote ou levantar InsufficientStockError, sem nunca negativar"""
+    if quantidade <= 0:
+        raise ValueError("A quantidade da baixa deve ser positiva")
+    if conn.execute(SQL_BAIXA_LOTE, (quantidade, lote_id, quantidade)).rowcount == 0:
+        raise InsufficientStockError(f"Lote #{lote_id} sem saldo para {quantidade} unidades")
+
+def dispense_lot(conn, lote_id, quantidade, responsavel, motivo="Dispensação"):
+    """Baixa atômica de um lote com a movimentação de saída, em uma transação própria"""
+    def operacao(conn):
+        decrement_lot(conn, lote_id, quantidade)
+        conn.execute(
+            """INSERT INTO movimentacoes (lote_id, tipo_movimento, quantidade, motivo, responsavel)
+               VALUES (?, 'Saída', ?, ?, ?)""",
+            (lote_id, quantidade, motivo, responsavel)
+        )
+    run_immediate(conn, operacao)
+
+# ==========================================
+# RESUMO DE ESTOQUE
+# ==========================================
+
+def rebuild_stock_summary(conn):
+    """Reconstruir estoque_resumo do zero a partir de lotes e movimentações"""
+    conn.execute("DELETE FROM estoque_resumo")
+    conn.execute(f"""
+        INSERT INTO estoque_resumo ({ESTOQUE_RESUMO_COLUNAS})
+        {QUERY_ESTOQUE_RESUMO_CALCULADO}
+    """)
+    conn.commit()
+    return conn.execute("SELECT COUNT(*) FROM estoque_resumo").fetchone()[0]
+
+def verify_stock_summary(conn):
+    """Listar os medicamentos cujo resumo materializado divergiu do cálculo completo"""
+    # Somas de ponto flutuante podem diferir na última casa conforme a ordem
+    colunas = ESTOQUE_RESUMO_COLUNAS.replace("valor_estoque", "ROUND(valor_estoque, 2)")
+    divergentes = conn.execute(f"""
+        SELECT medicamento_id FROM (
+            SELECT {colunas} FROM ({QUERY_ESTOQUE_RESUMO_CALCULADO})
+            EXCEPT
+            SELECT {colunas} FROM estoque_resumo
+        )
+        UNION
+        SELECT medicamento_id FROM (
+            SELECT {colunas} FROM estoque_resumo
+            EXCEPT
+            SELECT {colunas} FROM ({QUERY_ESTOQUE_RESUMO_CALCULADO})
+        )
+        ORDER BY medicamento_id
+    """).fetchall()
+    return [row[0] for row in divergentes]
+
+# ==========================================
+# LINHA DE COMANDO
+# ==========================================
+
+if __name__ == "__main__":
+    from config import get_database_path
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("verify", "rebuild"):
+        print("Uso: python stock.py verify|rebuild [caminho_do_banco]")
+        sys.exit(2)
+
+    comando = sys.argv[1]
+    db_path = sys.argv[2] if len(sys.argv) > 2 else get_database_path()
+    conn = sqlite3.connect(db_path)
+
+    divergentes = verify_stock_summary(conn)
+    if comando == "rebuild":
+        total = rebuild_stock_summary(conn)
+        print(f"✅ Resumo reconstruído: {total} medicamentos ({len(divergentes)} estavam divergentes)")
+    elif divergentes:
+        print(f"❌ {len(divergentes)} medicamentos com resumo divergente: {divergentes[:20]}")
+        print("   Execute 'python stock.py rebuild' para corrigir")
+        conn.close()
+        sys.exit(1)
+    else:
+        print("✅ Resumo de estoque consistente")
+
+    conn.close()
@@ -0,0 +1,183 @@
+"""
+🏥 MedStock360 - Dados Sintéticos
+Gerador reprodutível (com semente) de um hospital fictício para testes de escala
+Versão: 3.0 Advanced
+"""
+
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from migrations import create_base_tables
+
+# Volumes na escala 1×; as demais escalas multiplicam medicamentos e pacientes
+MEDICAMENTOS_BASE = 200
+PACIENTES_BASE = 500
+DIAS_HISTORICO = 90
+
+_NOMES = ["Dipirona Sódica", "Paracetamol", "Amoxicilina", "Ibuprofeno", "Losartana Potássica",
+          "Omeprazol", "Metformina", "Captopril", "Ácido Acetilsalicílico", "Cefalexina",
+          "Sinvastatina", "Hidroclorotiazida", "Prednisona", "Azitromicina", "Insulina NPH"]
+_CATEGORIAS = ["Analgésico", "Antibiótico", "Anti-inflamatório", "Anti-hipertensivo",
+               "Antidiabético", "Corticoide", "Gastroprotetor"]
+_FORMAS = ["Comprimido", "Cápsula", "Solução oral", "Injetável", "Pomada"]
+_FABRICANTES = ["Medley", "EMS", "Neo Química", "Eurofarma", "Aché", "Sanofi"]
+_FORNECEDORES = ["Distribuidora Saúde", "Farmalog", "MedSupply", "Hospfar"]
+_LOCAIS = ["Farmácia Central", "Almoxarifado", "UTI", "Pronto-Socorro", "Centro Cirúrgico"]
+_SETORES = ["A", "B", "C", "D"]
+_PESSOAS = ["José", "João", "Maria", "Antônio", "Conceição", "Sebastião", "Luíza", "André", "Ana", "Francisco"]
+_SOBRENOMES = ["Silva", "Santos", "Conceição", "Gonçalves", "Araújo", "Simões", "Magalhães", "Pereira"]
+_CIDADES = ["São Paulo", "Belém", "Maceió", "Goiânia", "Florianópolis", "Ribeirão Preto"]
+_PLANOS = ["SUS", "Unimed", "Amil", "Bradesco Saúde", "SulAmérica"]
+
+def _synthetic_user(conn):
+    """Usuário responsável pelas movimentações e médico das consultas geradas"""
+    conn.execute("""
+        INSERT OR IGNORE INTO usuarios (username, password_hash, nome_completo, perfil)
+        VALUES ('sintetico', '!', 'Gerador Sintético', 'medico')
+    """)
+    return conn.execute("SELECT id FROM usuarios WHERE username = 'sintetico'").fetchone()[0]
+
+def _generate_stock(conn, rng, medicamentos, hoje, usuario_id):
+    """Medicamentos, lotes e movimentações (entradas e saídas diárias de Poisson)"""
+    primeiro_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM medicamentos").fetchone()[0]) + 1
+    ids = np.arange(primeiro_id, primeiro_id + medicamentos)
+    conn.executemany(
+        """INSERT INTO medicamentos (id, nome, principio_ativo, categoria, forma_farmaceutica,
+                                     controlado, refrigerado, codigo_barras, fabricante, cadastrado_por)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        ((int(med_id), f"{_NOMES[med_id % len(_NOMES)]} {(med_id % 4 + 1) * 125}mg #{med_id}",
+          _NOMES[med_id % len(_NOMES)], str(rng.choice(_CATEGORIAS)), str(rng.choice(_FORMAS)),
+          int(rng.random() < 0.1), int(rng.random() < 0.05), f"789{med_id:010d}",
+          str(rng.choice(_FABRICANTES)), usuario_id) for med_id in ids)
+    )
+
+    # Demanda diária por medicamento; um quarto deles tem consumo intermitente
+    demanda = rng.gamma(1.5, 4.0, medicamentos)
+    intermitente = rng.random(medicamentos) < 0.25
+    demanda[intermitente] = rng.uniform(0.05, 0.3, intermitente.sum())
+    saidas = rng.poisson(demanda[:, None], (medicamentos, DIAS_HISTORICO))
+
+    inicio = hoje - timedelta(days=DIAS_HISTORICO)
+    dias = [(inicio + timedelta(days=d)).isoformat() for d in range(DIAS_HISTORICO)]
+    lotes, entradas, movimentos = [], [], []
+    lote_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM lotes").fetchone()[0]) + 1
+
+    for i, med_id in enumerate(ids):
+        n_lotes = int(rng.integers(1, 6))
+        iniciais = np.ceil(demanda[i] * DIAS_HISTORICO * rng.uniform(0.4, 1.2, n_lotes)).astype(int) + 5
+        limites = np.cumsum(iniciais)
+
+        # Saídas consomem os lotes em sequência e param quando o estoque acaba
+        consumido = np.minimum(np.cumsum(saidas[i]), limites[-1])
+        diarias = np.diff(consumido, prepend=0)
+        lote_do_dia = np.searchsorted(limites, consumido, side="left").clip(max=n_lotes - 1)
+        atuais = iniciais - np.diff(np.minimum(consumido[-1], limites), prepend=0)
+
+        validades = rng.integers(-10, 720, n_lotes)
+        for k in range(n_lotes):
+            validade = hoje + timedelta(days=int(validades[k]))
+            lotes.append((lote_id + k, int(med_id), f"L{med_id:06d}-{k + 1}",
+                          (validade - timedelta(days=730)).isoformat(), validade.isoformat(),
+                          int(iniciais[k]), int(atuais[k]), round(float(rng.uniform(0.5, 80.0)), 2),
+                          str(rng.choice(_FORNECEDORES)), str(rng.choice(_LOCAIS)), str(rng.choice(_SETORES)),
+                          f"P{rng.integers(1, 20)}", f"{rng.integers(1, 10)}", usuario_id,
+                          f"{inicio.isoformat()} 08:00:00"))
+            entradas.append((lote_id + k, int(iniciais[k]), usuario_id, f"{inicio.isoformat()} 08:00:00"))
+
+        for d in np.flatnonzero(diarias):
+            movimentos.append((lote_id + int(lote_do_dia[d]), int(diarias[d]), usuario_id,
+                               f"{dias[d]} {8 + d % 12:02d}:00:00"))
+        lote_id += n_lotes
+
+    conn.executemany(
+        """INSERT INTO lotes (id, medicamento_id, numero_lote, data_fabricacao, data_validade,
+                              quantidade_inicial, quantidade_atual, preco_unitario, fornecedor,
+                              local_armazenamento, setor, prateleira, posicao, responsavel_entrada, data_entrada)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        lotes
+    )
+    conn.executemany(
+        """INSERT INTO movimentacoes (lote_id, tipo_movimento, quantidade, motivo, responsavel, data_movimento)
+           VALUES (?, 'Entrada', ?, 'Entrada de lote', ?, ?)""",
+        entradas
+    )
+    conn.executemany(
+        """INSERT INTO movimentacoes (lote_id, tipo_movimento, quantidade, motivo, responsavel, data_movimento)
+           VALUES (?, 'Saída', ?, 'Dispensação', ?, ?)""",
+        movimentos
+    )
+    return {'medicamentos': medicamentos, 'lotes': len(lotes), 'movimentacoes': len(entradas) + len(movimentos)}
+
+def _generate_patients(conn, rng, pacientes, hoje, medico_id):
+    """Pacientes com consultas, receitas e prontuário; 5% são crônicos com histórico 10× maior"""
+    primeiro_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM pacientes").fetchone()[0]) + 1
+    ids = np.arange(primeiro_id, primeiro_id + pacientes)
+    nascimentos = rng.integers(0, 95 * 365, pacientes)
+    cronicos = rng.random(pacientes) < 0.05
+
+    conn.executemany(
+        """INSERT INTO pacientes (id, nome_completo, cpf, data_nascimento, sexo, cidade, plano_saude,
+                                  medicamentos_uso_continuo, alergias, cadastrado_por)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        ((int(pac_id), f"{rng.choice(_PESSOAS)} {rng.choice(_SOBRENOMES)} {rng.choice(_SOBRENOMES)}",
+          f"{pac_id // 1000000 % 1000:03d}.{pac_id // 1000 % 1000:03d}.{pac_id % 1000:03d}-{pac_id % 97:02d}",
+          (hoje - timedelta(days=int(nascimentos[i]))).isoformat(), str(rng.choice(["M", "F"])),
+          str(rng.choice(_CIDADES)), str(rng.choice(_PLANOS)),
+          _NOMES[pac_id % len(_NOMES)] if cronicos[i] else None,
+          "Penicilina" if rng.random() < 0.08 else None, medico_id)
+         for i, pac_id in enumerate(ids))
+    )
+
+    fator = np.where(cronicos, 10, 1)
+    totais = {}
+    for tabela, media, sql in (
+        ("consultas", 3, "INSERT INTO consultas (paciente_id, medico_id, data_consulta, status) VALUES (?, ?, ?, 'realizada')"),
+        ("receitas", 2, "INSERT INTO receitas (paciente_id, medico_id, data_receita) VALUES (?, ?, ?)"),
+        ("prontuario", 5, "INSERT INTO prontuario (paciente_id, medico_responsavel, data_entrada, tipo_entrada, descricao) "
+                          "VALUES (?, ?, ?, 'Evolução', 'Acompanhamento de rotina')"),
+    ):
+        quantidades = rng.poisson(media * fator)
+        paciente_ids = np.repeat(ids, quantidades)
+        dias_atras = rng.integers(0, 365, len(paciente_ids))
+        conn.executemany(sql, (
+            (int(pac_id), medico_id, f"{(hoje - timedelta(days=int(d))).isoformat()} 09:00:00")
+            for pac_id, d in zip(paciente_ids, dias_atras)
+        ))
+        totais[tabela] = len(paciente_ids)
+
+    totais['pacientes'] = pacientes
+    return totais
+
+def generate_hospital(conn, escala=1, seed=42, hoje=None):
+    """Popular o schema com um hospital sintético na escala dada; retorna as contagens por tabela"""
+    rng = np.random.default_rng(seed)
+    hoje = hoje or datetime.now(timezone.utc).date()
+
+    create_base_tables(conn)
+    usuario_id = _synthetic_user(conn)
+    contagens = _generate_stock(conn, rng, int(MEDICAMENTOS_BASE * escala), hoje, usuario_id)
+    contagens.update(_generate_patients(conn, rng, int(PACIENTES_BASE * escala), hoje, usuario_id))
+    conn.commit()
+    conn.execute("ANALYZE")
+    return contagens
+
+# ==========================================
+# LINHA DE COMANDO
+# ==========================================
+
+if __name__ == "__main__":
+    escala = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    db_path = sys.argv[2] if len(sys.argv) > 2 else f"data/sintetico_{escala:g}x.db"
+
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    contagens = generate_hospital(conn, escala)
+    conn.close()
+
+    print(f"✅ Hospital sintético ({escala:g}×) gerado em {db_path}")
+    for tabela, total in contagens.items():
+        print(f"   {tabela}: {total:,}")